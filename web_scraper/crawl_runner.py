@@ -0,0 +1,448 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+COMPANIES_FILE = os.path.join(BASE_DIR, "companies.csv")
+
+# Lines printed with this prefix on stdout carry a JSON progress event.
+# The GUI reads them from the runner subprocess to drive its progress bar.
+PROGRESS_PREFIX = "@@progress "
+
+# Every log line names the company whose crawl logged it ('-' for the runner and shared
+# components), so the GUI can filter the log and split it into one file per company
+LOG_FORMAT = "%(asctime)s [%(company)s] [%(name)s] %(levelname)s: %(message)s"
+
+# Make the Scrapy project importable no matter where the runner is started from
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("SCRAPY_SETTINGS_MODULE", "product_scraper.settings")
+
+
+# Optional companies.csv columns passed through to the spider as arguments
+SPIDER_ARG_COLUMNS = ['cache_ttl', 'start_rate', 'max_rate', 'burst', 'concurrency']
+
+
+def load_companies(path=COMPANIES_FILE):
+    """Reads companies.csv once and returns the complete rows as a list of dictionaries."""
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    return [row for row in rows if row.get('name') and row.get('type') and row.get('url')]
+
+
+def company_domain(company):
+    """Returns the host a company's crawl will hit, used to share a per-domain budget."""
+    url = company['url']
+    if not url.startswith('http'):
+        url = 'https://' + url
+    return urlparse(url).netloc.lower()
+
+
+_progress_lock = threading.Lock()
+
+
+def print_progress(event):
+    """Progress callback that writes each event as a prefixed JSON line on stdout."""
+    with _progress_lock:
+        sys.stdout.write(PROGRESS_PREFIX + json.dumps(event) + "\n")
+        sys.stdout.flush()
+
+
+class RecordCompany:
+    """The %(company)s of a log record, looked up from its spider only when the record is formatted."""
+    __slots__ = ('record',)
+
+    def __init__(self, record):
+        self.record = record
+
+    def __str__(self):
+        spider = self.record.__dict__.get('spider')
+        return getattr(spider, 'company_name', None) or '-'
+
+
+def install_company_log_field():
+    """
+    Gives every log record a `company` attribute for LOG_FORMAT. Scrapy reinstalls its log
+    handler for each crawler, so this is done with a record factory rather than a handler filter.
+    """
+    factory = logging.getLogRecordFactory()
+    if getattr(factory, 'adds_company', False):
+        return
+
+    def record_factory(*args, **kwargs):
+        record = factory(*args, **kwargs)
+        record.company = RecordCompany(record)
+        return record
+
+    record_factory.adds_company = True
+    logging.setLogRecordFactory(record_factory)
+
+
+def parse_progress_line(line):
+    """Returns the event dictionary for a progress line, or None for ordinary log output."""
+    if not line.startswith(PROGRESS_PREFIX):
+        return None
+    try:
+        return json.loads(line[len(PROGRESS_PREFIX):])
+    except json.JSONDecodeError:
+        return None
+
+
+class CrawlRunner:
+    """
+    Runs every company's ProductSpider inside a single CrawlerProcess.
+
+    All crawlers share one interpreter, one reactor and the database module's
+    writer. At most `max_concurrent_companies` crawlers run at once, and
+    companies on the same domain take turns so that the per-domain limit
+    (`per_domain_concurrency`) holds for the whole run and not just per crawler.
+
+    run() crawls `companies` and returns; serve() keeps the process running and crawls
+    the companies sent to it (the scheduler daemon's worker).
+
+    `progress_callback` is called with a dictionary for each event:
+    run_started, company_started, company_finished, company_failed, enrichment_finished,
+    matching_finished, postprocess_finished (serve() only) and run_finished.
+
+    Each company runs as a job (see jobs.py). With `resume`, companies whose last job
+    was interrupted, failed or crashed continue from its queue and checkpoint; every
+    other crawl starts a fresh job.
+
+    With `enrich`, the rows that changed are classified and normalized (enrichment.py)
+    once every crawl has finished; with `match`, the products that changed are then matched
+    into cross-brand clusters (matching.py).
+    """
+
+    def __init__(self, companies, max_concurrent_companies=5, per_domain_concurrency=None,
+                 progress_callback=None, settings=None, incremental=False, resume=False, enrich=True,
+                 match=True):
+        self.companies = list(companies)
+        self.max_concurrent_companies = max(1, int(max_concurrent_companies))
+        # None leaves CONCURRENT_REQUESTS_PER_DOMAIN (and the companies' `concurrency` column) in charge
+        self.per_domain_concurrency = max(1, int(per_domain_concurrency)) if per_domain_concurrency else None
+        self.progress_callback = progress_callback
+        self.extra_settings = dict(settings or {})
+        self.incremental = incremental
+        self.resume = resume
+        self.enrich = enrich
+        self.match = match
+        self.results = {}
+        # Set once serve() is stopping, so crawls still waiting for a slot do not start
+        self.closing = False
+
+    def emit(self, event, **data):
+        if self.progress_callback:
+            data['event'] = event
+            data['time'] = time.time()
+            self.progress_callback(data)
+
+    def build_settings(self):
+        from scrapy.utils.project import get_project_settings
+
+        settings = get_project_settings()
+        if self.per_domain_concurrency:
+            settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', self.per_domain_concurrency, priority='cmdline')
+        # Every crawler lives in this process and shares one writer connection, unless other
+        # processes write to the database at the same time (`settings`, --write-mode staging)
+        settings.set('DB_WRITE_MODE', 'direct', priority='cmdline')
+        settings.set('LOG_FORMAT', LOG_FORMAT, priority='cmdline')
+        for key, value in self.extra_settings.items():
+            settings.set(key, value, priority='cmdline')
+        return settings
+
+    def start_process(self):
+        """Prepares the database and the reactor, and returns the CrawlerProcess every crawl runs in."""
+        from scrapy.crawler import CrawlerProcess
+        from scrapy.utils.reactor import install_reactor
+        from twisted.internet import defer
+        import database
+
+        database.create_table()
+        database.merge_stale_staging_databases()
+
+        install_company_log_field()
+        settings = self.build_settings()
+        # Install the configured reactor before anything imports twisted.internet.reactor
+        install_reactor(settings['TWISTED_REACTOR'], settings['ASYNCIO_EVENT_LOOP'])
+        self.company_slots = defer.DeferredSemaphore(self.max_concurrent_companies)
+        self.domain_locks = {}
+        return CrawlerProcess(settings)
+
+    def schedule(self, process, company, resume=None):
+        """
+        Crawls a company once its domain is free and then a company slot, and returns the
+        crawl's Deferred. A company waiting for its domain does not hold a slot.
+        """
+        from twisted.internet import defer
+
+        lock = self.domain_locks.setdefault(company_domain(company), defer.DeferredLock())
+        return lock.run(self.company_slots.run, self._crawl_company, process, company, resume)
+
+    def run(self):
+        """Schedules all companies and blocks until every crawl has finished."""
+        from twisted.internet import defer
+        from twisted.internet.error import ReactorNotRunning
+
+        process = self.start_process()
+        from twisted.internet import reactor
+
+        self.emit('run_started', total=len(self.companies))
+        started_at = time.time()
+        deferreds = [self.schedule(process, company) for company in self.companies]
+        finished = defer.DeferredList(deferreds, consumeErrors=True)
+
+        def stop(_):
+            if any(r['status'] == 'finished' for r in self.results.values()):
+                if self.enrich:
+                    self.run_enrichment()
+                if self.match:
+                    self.run_matching()
+            self.emit('run_finished', total=len(self.companies),
+                      failed=sum(1 for r in self.results.values() if r['status'] != 'finished'),
+                      elapsed=round(time.time() - started_at, 2))
+            # Crawls that fail straight away finish before the reactor has even started
+            if reactor.running:
+                try:
+                    reactor.stop()
+                except ReactorNotRunning:
+                    pass  # Ctrl+C already made CrawlerProcess stop it
+            else:
+                reactor.callWhenRunning(reactor.stop)
+
+        finished.addBoth(stop)
+        try:
+            process.start(stop_after_crawl=False)
+        finally:
+            # Every crawl has closed, so no spider is still waiting on the extraction pool
+            from product_scraper import extraction
+            extraction.shutdown_process_pool()
+        return self.results
+
+    def serve(self, commands=None):
+        """
+        Crawls the companies sent as JSON lines on `commands` (stdin by default) until it ends
+        or the process is interrupted, then stops like Ctrl+C so the running jobs can resume:
+        - {"command": "crawl", "company": {...}, "resume": false} queues a companies.csv row;
+        - {"command": "postprocess"} enriches and matches the changed rows in a thread, then
+          emits postprocess_finished.
+        """
+        from twisted.internet import threads
+
+        process = self.start_process()
+        from twisted.internet import reactor
+
+        def handle(command):
+            if command.get('command') == 'crawl':
+                self.schedule(process, command['company'], bool(command.get('resume')))
+            elif command.get('command') == 'postprocess':
+                threads.deferToThread(self.postprocess)
+
+        def read_commands():
+            for line in commands or sys.stdin:
+                try:
+                    command = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                reactor.callFromThread(handle, command)
+            # Whoever sent the commands has gone away
+            reactor.callFromThread(self.shutdown, process)
+
+        def on_signal(signum, _):
+            reactor.callFromThread(self.shutdown, process)
+
+        for name in ('SIGINT', 'SIGTERM', 'SIGBREAK'):
+            if hasattr(signal, name):
+                signal.signal(getattr(signal, name), on_signal)
+        threading.Thread(target=read_commands, daemon=True).start()
+        self.emit('run_started', total=0)
+        try:
+            process.start(stop_after_crawl=False, install_signal_handlers=False)
+        finally:
+            from product_scraper import extraction
+            extraction.shutdown_process_pool()
+        return self.results
+
+    def shutdown(self, process):
+        """Stops the running crawls so their jobs can resume, then the reactor; waiting crawls never start."""
+        from twisted.internet import reactor
+
+        if self.closing:
+            return
+        self.closing = True
+        d = process.stop()
+        d.addBoth(lambda _: reactor.stop() if reactor.running else None)
+
+    def postprocess(self):
+        self.run_enrichment()
+        self.run_matching()
+        self.emit('postprocess_finished')
+
+    def run_enrichment(self):
+        import enrichment
+
+        try:
+            result = enrichment.enrich_products()
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Enrichment failed: {e}")
+            return
+        self.emit('enrichment_finished', **result)
+
+    def run_matching(self):
+        import matching
+
+        try:
+            result = matching.update_clusters()
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Product matching failed: {e}")
+            return
+        self.emit('matching_finished', **result)
+
+    def _crawl_company(self, process, company, resume=None):
+        from scrapy import signals
+        from product_scraper.spiders.product_spider import ProductSpider
+        import jobs
+
+        name = company['name']
+        if self.closing:
+            # Its job was never started, so there is nothing to save
+            self.results[name] = {'status': 'failed', 'reason': 'shutdown', 'items': 0}
+            self.emit('company_failed', company=name, reason='shutdown', items=0)
+            return None
+        crawler = process.create_crawler(ProductSpider)
+        state = {'started_at': time.time()}
+
+        def on_spider_closed(spider, reason):
+            state['reason'] = reason
+
+        # weak=False: the handler is a closure nothing else keeps alive
+        crawler.signals.connect(on_spider_closed, signal=signals.spider_closed, weak=False)
+        job = jobs.Job.for_company(name)
+        resumed = (self.resume if resume is None else resume) and job.is_resumable()
+        job.start(company, resume=resumed)
+        self.emit('company_started', company=name, type=company['type'], url=company['url'], resumed=resumed)
+
+        spider_args = {'name': name, 'type': company['type'], 'url': company['url'], 'job_dir': job.path}
+        for column in SPIDER_ARG_COLUMNS:
+            if company.get(column):
+                spider_args[column] = company[column]
+        if self.incremental:
+            spider_args['incremental'] = '1'
+        d = process.crawl(crawler, **spider_args)
+
+        def on_done(_):
+            stats = crawler.stats.get_stats() if crawler.stats else {}
+            reason = state.get('reason', 'finished')
+            if stats.get('database/items_unwritten') and reason == 'finished':
+                reason = 'database_error'
+            result = {
+                'status': 'finished' if reason == 'finished' else 'failed',
+                'reason': reason,
+                'items': stats.get('item_scraped_count', 0),
+                'requests': stats.get('downloader/request_count', 0),
+                'errors': stats.get('log_count/ERROR', 0),
+                'elapsed': round(time.time() - state['started_at'], 2),
+            }
+            self.results[name] = result
+            # Ctrl+C or the GUI closing: the queue was saved, so the job can resume later
+            job.finish(result['status'] if reason != 'shutdown' else 'interrupted', reason)
+            event = 'company_finished' if result['status'] == 'finished' else 'company_failed'
+            self.emit(event, company=name, **result)
+
+        def on_error(failure):
+            job.finish('failed', failure.getErrorMessage())
+            self.results[name] = {'status': 'failed', 'reason': failure.getErrorMessage(), 'items': 0}
+            self.emit('company_failed', company=name, reason=failure.getErrorMessage(), items=0)
+
+        d.addCallbacks(on_done, on_error)
+        return d
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the product spider for every company in a single process.")
+    parser.add_argument('--companies', default=COMPANIES_FILE, help="Path to the companies CSV file.")
+    parser.add_argument('--only', action='append', metavar='NAME', help="Only crawl the named company (repeatable).")
+    parser.add_argument('--max-concurrent', type=int, default=5, help="Maximum number of companies crawled at once.")
+    parser.add_argument('--per-domain', type=int, help="Maximum concurrent requests per domain for every company "
+                        "(default: CONCURRENT_REQUESTS_PER_DOMAIN, or the company's `concurrency` column).")
+    parser.add_argument('--incremental', action='store_true', help="Skip Shopify products unchanged since the last crawl.")
+    parser.add_argument('--resume', action='store_true', help="Only crawl companies whose last job was interrupted, "
+                        "failed or crashed, continuing where it stopped.")
+    parser.add_argument('--list-jobs', action='store_true', help="Print the status of every company's last job and exit.")
+    parser.add_argument('--no-enrich', action='store_true', help="Do not classify and normalize the changed rows "
+                        "after the crawl (run enrichment.py later).")
+    parser.add_argument('--no-match', action='store_true', help="Do not match the changed products into cross-brand "
+                        "clusters after the crawl (run matching.py later).")
+    parser.add_argument('--serve', action='store_true', help="Keep running and crawl the companies sent as JSON "
+                        "commands on stdin (used by scheduler.py); the companies file and --only are ignored.")
+    parser.add_argument('--progress-json', action='store_true', help="Print machine-readable progress lines on stdout.")
+    parser.add_argument('--write-mode', choices=['direct', 'staging'], default='direct',
+                        help="'staging' writes each company into its own staging database and merges it when the "
+                        "company finishes; use it when other processes write to scraper.db at the same time.")
+    parser.add_argument('--metrics-port', type=int, help="Serve per-company crawl metrics in the Prometheus text "
+                        "format on this port (http://127.0.0.1:PORT/metrics).")
+    parser.add_argument('--profile', choices=['cprofile', 'pyinstrument'], help="Profile each company's crawl into "
+                        "the profiles/ directory. Profiles are cleanest with --max-concurrent 1.")
+    args = parser.parse_args(argv)
+    import jobs
+
+    if args.list_jobs:
+        for job in jobs.list_jobs():
+            state = job.state
+            resumable = " (resumable)" if job.is_resumable() else ""
+            print(f"{state.get('company')}: {state.get('status')}{resumable}, {state.get('items_written', 0)} items "
+                  f"checkpointed, last reason: {state.get('reason') or '-'}")
+        return 0
+
+    companies = [] if args.serve else load_companies(args.companies)
+    if args.only:
+        wanted = set(args.only)
+        companies = [c for c in companies if c['name'] in wanted]
+    if args.resume and not args.serve:
+        companies = jobs.resumable_companies(companies)
+        if not companies:
+            print("No incomplete jobs to resume.")
+            return 0
+    if not companies and not args.serve:
+        print("No companies to crawl.")
+        return 1
+
+    def print_human(event):
+        if event['event'] in ('company_finished', 'company_failed'):
+            print(f"{event['company']}: {event['event'].split('_')[1]} ({event.get('items', 0)} items)")
+        elif event['event'] == 'enrichment_finished':
+            print(f"Enriched {event['variants']} changed rows ({event['products_reclassified']} products reclassified).")
+        elif event['event'] == 'matching_finished':
+            print(f"Matched {event['changed']} changed products into {event['clusters']} clusters.")
+
+    settings = {'DB_WRITE_MODE': args.write_mode}
+    if args.metrics_port:
+        settings['METRICS_PROMETHEUS_PORT'] = args.metrics_port
+    if args.profile:
+        settings['PROFILER'] = args.profile
+
+    runner = CrawlRunner(
+        companies,
+        max_concurrent_companies=args.max_concurrent,
+        per_domain_concurrency=args.per_domain,
+        progress_callback=print_progress if args.progress_json else print_human,
+        settings=settings,
+        incremental=args.incremental,
+        resume=args.resume,
+        enrich=not args.no_enrich,
+        match=not args.no_match,
+    )
+    if args.serve:
+        runner.serve()
+        return 0
+    results = runner.run()
+    return 0 if all(r['status'] == 'finished' for r in results.values()) else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,403 @@
 import sqlite3
 import os
+import contextlib
+import hashlib
+import json
+import re
+import glob
+import logging
 import threading
+import time
+
+logger = logging.getLogger(__name__)
 
 DB_FILE = os.path.join(os.path.dirname(__file__), "scraper.db")
+# Each crawl process writes into its own staging database here, merged into DB_FILE when it finishes
+STAGING_DIR = os.path.join(os.path.dirname(__file__), "staging")
+
+# Column order of the flat `products` view, which exports and the Data Viewer read
+PRODUCT_COLUMNS = [
+    "Product Name", "Brand", "Segment", "Positioning", "Animal Product Replicated",
+    "Consumption Format", "Storage Condition", "Availability", "In Stock", "Status",
+    "Price (INR)", "Weight", "Weight Unit", "Pack Size", "Distribution Channels",
+    "Channel", "Product Page", "Website", "Source Name", "Source Links",
+    "Ingredients List", "Ingredient Count", "Last Updated", "Notes"
+]
+# Columns of the products view filled by the post-crawl enrichment pass (enrichment.py);
+# exports and the Data Viewer read them with the flat columns
+ENRICHED_COLUMNS = ["Pack Count", "Net Quantity", "Quantity Unit", "Price per 100 (INR)"]
+# Staging databases keep flat rows; the variant id tells variants of one product page apart
+STAGED_COLUMNS = PRODUCT_COLUMNS + ["Variant ID"]
+
+# Where each flat column lives in the normalized schema ("Brand" is brands.name)
+CATALOG_FIELDS = {
+    "Product Name": "name", "Segment": "segment", "Positioning": "positioning",
+    "Animal Product Replicated": "animal_replicated", "Consumption Format": "consumption_format",
+    "Storage Condition": "storage_condition", "Status": "status",
+    "Distribution Channels": "distribution_channels", "Channel": "channel",
+    "Product Page": "product_page", "Website": "website", "Source Name": "source_name",
+    "Source Links": "source_links", "Ingredients List": "ingredients_text",
+    "Ingredient Count": "ingredient_count", "Last Updated": "last_updated", "Notes": "notes",
+}
+VARIANT_FIELDS = {
+    "Availability": "availability", "In Stock": "in_stock", "Price (INR)": "price_paise",
+    "Weight": "weight", "Weight Unit": "weight_unit", "Pack Size": "pack_size",
+}
+
+def _upsert_assignments(fields, key):
+    return ', '.join(f'{field} = excluded.{field}' for field in fields if field != key)
+
+UPSERT_BRAND_SQL = 'INSERT INTO brands (name) VALUES (:brand) ON CONFLICT(name) DO NOTHING'
+UPSERT_CATALOG_PRODUCT_SQL = (
+    'INSERT INTO catalog_products (brand_id, {0}) VALUES ((SELECT brand_id FROM brands WHERE name = :brand), {1}) '
+    'ON CONFLICT(product_page) DO UPDATE SET brand_id = excluded.brand_id, {2}'
+).format(', '.join(CATALOG_FIELDS.values()), ', '.join(f':{field}' for field in CATALOG_FIELDS.values()),
+         _upsert_assignments(CATALOG_FIELDS.values(), 'product_page'))
+# content_hash fingerprints the whole flat row, so an unchanged re-crawl can be recognised without writing
+VARIANT_WRITE_FIELDS = list(VARIANT_FIELDS.values()) + ["content_hash"]
+UPSERT_VARIANT_SQL = (
+    'INSERT INTO variants (product_id, source_variant_id, {0}) VALUES ('
+    '(SELECT product_id FROM catalog_products WHERE product_page = :product_page), :variant_id, {1}) '
+    'ON CONFLICT(product_id, source_variant_id) DO UPDATE SET {2}'
+).format(', '.join(VARIANT_WRITE_FIELDS), ', '.join(f':{field}' for field in VARIANT_WRITE_FIELDS),
+         _upsert_assignments(VARIANT_WRITE_FIELDS, None))
+# Rows migrated from the flat table have no variant id; drop that row once the real variants arrive
+DELETE_UNKEYED_VARIANT_SQL = (
+    "DELETE FROM variants WHERE :variant_id != '' AND source_variant_id = '' "
+    "AND product_id = (SELECT product_id FROM catalog_products WHERE product_page = :product_page)"
+)
+INSERT_INGREDIENT_SQL = 'INSERT INTO ingredients (name) VALUES (?) ON CONFLICT(name) DO NOTHING'
+# Every spelling seen maps to its canonical ingredient; a changed alias table re-points it
+UPSERT_INGREDIENT_ALIAS_SQL = (
+    'INSERT INTO ingredient_aliases (alias, ingredient_id) SELECT ?, ingredient_id FROM ingredients WHERE name = ? '
+    'ON CONFLICT(alias) DO UPDATE SET ingredient_id = excluded.ingredient_id'
+)
+CLEAR_PRODUCT_INGREDIENTS_SQL = 'DELETE FROM product_ingredients WHERE product_id = ?'
+PRUNE_UNALIASED_INGREDIENTS_SQL = """DELETE FROM ingredients WHERE ingredient_id IN (
+    SELECT i.ingredient_id FROM ingredients i
+    WHERE NOT EXISTS (SELECT 1 FROM ingredient_aliases a WHERE a.ingredient_id = i.ingredient_id)
+    AND NOT EXISTS (SELECT 1 FROM product_ingredients pi WHERE pi.ingredient_id = i.ingredient_id)
+    AND NOT EXISTS (SELECT 1 FROM product_ingredients pi WHERE pi.parent_ingredient_id = i.ingredient_id)
+    AND NOT EXISTS (SELECT 1 FROM product_allergens pa WHERE pa.ingredient_id = i.ingredient_id))"""
+CLEAR_PRODUCT_ALLERGENS_SQL = 'DELETE FROM product_allergens WHERE product_id = ?'
+INSERT_PRODUCT_INGREDIENT_SQL = (
+    'INSERT OR IGNORE INTO product_ingredients (product_id, ingredient_id, position, percentage, parent_ingredient_id) '
+    'SELECT ?, i.ingredient_id, ?, ?, (SELECT ingredient_id FROM ingredients WHERE name = ?) FROM ingredients i WHERE i.name = ?'
+)
+INSERT_PRODUCT_ALLERGEN_SQL = (
+    'INSERT OR IGNORE INTO product_allergens (product_id, ingredient_id) SELECT ?, ingredient_id FROM ingredients WHERE name = ?'
+)
+INSERT_STAGED_PRODUCT_SQL = 'INSERT INTO staged_products ({}) VALUES ({})'.format(
+    ', '.join(f'"{col}"' for col in STAGED_COLUMNS), ', '.join(['?'] * len(STAGED_COLUMNS))
+)
+UPSERT_SYNC_STATE_SQL = (
+    'INSERT INTO sync_state ("Product Page", "Website", "Source Updated At") VALUES (?, ?, ?) '
+    'ON CONFLICT("Product Page") DO UPDATE SET "Website" = excluded."Website", "Source Updated At" = excluded."Source Updated At"'
+)
+# SQLite allows 999 host parameters per statement in older builds; batched lookups stay below that
+LOOKUP_CHUNK_SIZE = 500
 
-def db_connect():
+_shared_conn = None
+_shared_conn_pid = None
+_shared_conn_lock = threading.Lock()
+# Serialises transactions on the shared connection between writers in the same process
+_shared_write_lock = threading.RLock()
+
+def db_connect(db_file=None):
     """Establishes a connection to the SQLite database."""
-    return sqlite3.connect(DB_FILE, timeout=10) # Added timeout for concurrent access
+    return sqlite3.connect(db_file or DB_FILE, timeout=10) # Added timeout for concurrent access
 
-def create_table():
-    """Creates the 'products' table if it doesn't already exist."""
-    conn = db_connect()
-    cursor = conn.cursor()
-    cursor.execute("""
+def open_writer_connection(db_file):
+    """
+    Opens a long-lived writer connection in WAL mode with write-friendly pragmas.
+    The connection is in autocommit, so callers manage transactions explicitly.
+    """
+    conn = sqlite3.connect(db_file, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    return conn
+
+def get_shared_connection():
+    """Returns this process's long-lived writer connection to DB_FILE, opening it on first use."""
+    global _shared_conn, _shared_conn_pid
+    with _shared_conn_lock:
+        if _shared_conn is None or _shared_conn_pid != os.getpid():
+            _shared_conn, _shared_conn_pid = open_writer_connection(DB_FILE), os.getpid()
+        return _shared_conn
+
+def close_shared_connection():
+    """Closes this process's writer connection, if one is open."""
+    global _shared_conn, _shared_conn_pid
+    with _shared_conn_lock:
+        if _shared_conn is not None and _shared_conn_pid == os.getpid():
+            _shared_conn.close()
+        _shared_conn, _shared_conn_pid = None, None
+
+class BatchWriter:
+    """
+    Buffers product rows and writes them with executemany, one transaction per batch.
+    A batch is flushed once it holds `batch_size` rows or `flush_interval_ms` has passed
+    since the previous flush; call flush() at the end of a crawl to write the rest.
+
+    By default rows go to DB_FILE's normalized tables through the process's shared
+    connection. Pass `db_file` to append flat rows to a staging database instead.
+    """
+
+    def __init__(self, batch_size=500, flush_interval_ms=1000, db_file=None, on_flush=None):
+        self.db_file = db_file
+        # Called with (seconds, products written) after every committed flush; flushes
+        # with nothing to write and failed flushes are not reported
+        self.on_flush = on_flush
+        self.conn = None
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.lock = threading.Lock()
+        self.product_rows = []
+        self.sync_rows = []
+        self.last_flush = time.monotonic()
+        # Rows written vs. rows skipped because the database already held identical data
+        self.written = 0
+        self.unchanged = 0
+
+    def add_product(self, product_data, source_updated_at=None, variant_id=None):
+        """
+        Queues one product variant (a dict keyed by column name) and flushes if a batch is due.
+        `variant_id` is the source's id for the variant (e.g. Shopify's); leave it out for
+        sources with one row per product page.
+        """
+        row = tuple(product_data.get(col) for col in PRODUCT_COLUMNS) + (variant_id,)
+        with self.lock:
+            self.product_rows.append(row)
+            if source_updated_at:
+                self.sync_rows.append((product_data.get("Product Page"), product_data.get("Website"), source_updated_at))
+            due = (len(self.product_rows) >= self.batch_size
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+        if due:
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                # The rows stay buffered and go out with the next flush
+                logger.warning(f"Database write failed, {self.pending()} rows kept for the next flush: {e}")
+
+    def pending(self):
+        with self.lock:
+            return len(self.product_rows)
+
+    def flush(self):
+        """
+        Writes every buffered row in a single transaction and returns the number of products written.
+        Rows identical to what DB_FILE already holds are dropped first with one batched lookup,
+        and a batch with nothing left to write does not open a transaction at all.
+        If the write fails (e.g. the database stayed locked), the rows are put back into the
+        buffer and the sqlite3.Error is raised, so no caller mistakes them for written.
+        """
+        with self.lock:
+            product_rows, self.product_rows = self.product_rows, []
+            buffered_sync_rows, self.sync_rows = self.sync_rows, []
+            sync_rows = buffered_sync_rows
+            self.last_flush = time.monotonic()
+            if not product_rows and not sync_rows:
+                return 0
+            if self.db_file is None:
+                conn, write_lock = get_shared_connection(), _shared_write_lock
+            else:
+                if self.conn is None:
+                    self.conn = open_writer_connection(self.db_file)
+                # Only this writer uses its own connection, so self.lock is enough
+                conn, write_lock = self.conn, contextlib.nullcontext()
+            started = time.perf_counter()
+            with write_lock:
+                try:
+                    if self.db_file is None:
+                        params = changed_product_params(conn, product_rows)
+                        sync_rows = changed_sync_rows(conn, sync_rows)
+                        self.unchanged += len(product_rows) - len(params)
+                        if not params and not sync_rows:
+                            return 0
+                    conn.execute("BEGIN IMMEDIATE")
+                    if self.db_file is None:
+                        write_product_params(conn, params)
+                        written = len(params)
+                    else:
+                        conn.executemany(INSERT_STAGED_PRODUCT_SQL, product_rows)
+                        written = len(product_rows)
+                    conn.executemany(UPSERT_SYNC_STATE_SQL, sync_rows)
+                    conn.execute("COMMIT")
+                except sqlite3.Error:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    self.product_rows[:0] = product_rows
+                    self.sync_rows[:0] = buffered_sync_rows
+                    raise
+            if self.on_flush is not None:
+                self.on_flush(time.perf_counter() - started, written)
+        self.written += written
+        return written
+
+    def close(self, attempts=3):
+        """
+        Flushes remaining rows and closes the writer's own connection (the shared one stays open).
+        A failed flush is retried `attempts` times in all; the last error is raised, and
+        pending() tells how many rows were not written.
+        """
+        try:
+            for attempt in range(attempts):
+                try:
+                    self.flush()
+                    break
+                except sqlite3.Error as e:
+                    if attempt == attempts - 1:
+                        raise
+                    logger.warning(f"Database write failed, retrying {self.pending()} rows: {e}")
+                    time.sleep(1)
+        finally:
+            with self.lock:
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None
+
+def price_to_paise(value):
+    """Converts a rupee price ("279.00", 279 or 279.5) to integer paise; None when it is missing or not a number."""
+    if value in (None, ''):
+        return None
+    try:
+        return int(round(float(value) * 100))
+    except (TypeError, ValueError):
+        return None
+
+def _to_int(value):
+    try:
+        return None if value in (None, '') else int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_float(value):
+    try:
+        return None if value in (None, '') else float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _row_params(row):
+    """Turns a flat row (a tuple in STAGED_COLUMNS order) into typed named parameters for the normalized tables."""
+    values = dict(zip(STAGED_COLUMNS, row))
+    params = {field: values.get(col) for col, field in CATALOG_FIELDS.items()}
+    params.update({field: values.get(col) for col, field in VARIANT_FIELDS.items()})
+    params.update(
+        brand=values.get("Brand") or None,
+        price_paise=price_to_paise(values.get("Price (INR)")),
+        in_stock=_to_int(values.get("In Stock")),
+        weight=_to_float(values.get("Weight")),
+        ingredient_count=_to_int(values.get("Ingredient Count")),
+        variant_id='' if values.get("Variant ID") is None else str(values["Variant ID"]),
+    )
+    params['content_hash'] = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return params
+
+def _chunks(values, size=LOOKUP_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+def changed_product_params(conn, rows):
+    """
+    Returns typed parameters for the rows (tuples in STAGED_COLUMNS order) whose content hash
+    differs from the stored variant's, looking up every product page of the batch at once.
+    Rows without a product page cannot be keyed and are dropped.
+    """
+    params = [_row_params(row) for row in rows]
+    params = [p for p in params if p['product_page']]
+    stored = {}
+    for pages in _chunks({p['product_page'] for p in params}):
+        cursor = conn.execute(
+            'SELECT p.product_page, v.source_variant_id, v.content_hash FROM catalog_products p '
+            f'JOIN variants v ON v.product_id = p.product_id WHERE p.product_page IN ({", ".join("?" * len(pages))})',
+            pages
+        )
+        stored.update(((page, variant_id), content_hash) for page, variant_id, content_hash in cursor)
+    return [p for p in params if stored.get((p['product_page'], p['variant_id'])) != p['content_hash']]
+
+def changed_sync_rows(conn, sync_rows):
+    """Drops (product page, website, source updated at) rows that sync_state already holds."""
+    stored = {}
+    for pages in _chunks({row[0] for row in sync_rows}):
+        cursor = conn.execute(
+            f'SELECT "Product Page", "Website", "Source Updated At" FROM sync_state WHERE "Product Page" IN ({", ".join("?" * len(pages))})',
+            pages
+        )
+        stored.update((row[0], tuple(row)) for row in cursor)
+    return [row for row in sync_rows if stored.get(row[0]) != tuple(row)]
+
+def write_products(conn, rows):
+    """
+    Writes flat rows (tuples in STAGED_COLUMNS order) into the normalized tables, skipping rows
+    that are already stored unchanged. The caller owns the transaction. Returns the number written.
+    """
+    params = changed_product_params(conn, rows)
+    write_product_params(conn, params)
+    return len(params)
+
+def write_product_params(conn, params):
+    """
+    Upserts rows returned by changed_product_params() into the brands, catalog_products,
+    variants and ingredient tables with one executemany per statement. Triggers on
+    variants append price and availability changes to variant_history.
+    """
+    if not params:
+        return
+    conn.executemany(UPSERT_BRAND_SQL, [p for p in params if p['brand']])
+    conn.executemany(UPSERT_CATALOG_PRODUCT_SQL, params)
+    conn.executemany(DELETE_UNKEYED_VARIANT_SQL, params)
+    conn.executemany(UPSERT_VARIANT_SQL, params)
+
+    # Every variant of a product carries the same list, so link each product page once
+    texts = {p['product_page']: p['ingredients_text'] or '' for p in params}
+    product_ids = {}
+    for pages in _chunks(texts):
+        cursor = conn.execute(
+            f'SELECT product_page, product_id FROM catalog_products WHERE product_page IN ({", ".join("?" * len(pages))})',
+            pages
+        )
+        product_ids.update(cursor)
+    _link_ingredients(conn, {product_ids[page]: text for page, text in texts.items() if page in product_ids})
+
+def _link_ingredients(conn, texts):
+    """
+    Replaces the ingredient and allergen links of products from their stored ingredient lists
+    ({product id: text}). Every name is mapped to its canonical ingredient (see
+    product_scraper/ingredients.py), so "Soya Protein Isolate" and "soy protein" link to the same row.
+    """
+    from product_scraper import ingredients
+
+    names, aliases, links, allergen_links = set(), set(), [], []
+    for product_id, text in texts.items():
+        parsed, allergens = ingredients.parse_ingredient_list(text or '')
+        for position, (ingredient, parent) in enumerate(ingredients.flatten(parsed)):
+            name = ingredients.canonical_name(ingredient.name)
+            if not name:
+                continue
+            names.add(name)
+            aliases.add((ingredients.normalize_name(ingredient.name), name))
+            links.append((product_id, position, ingredient.percentage,
+                          ingredients.canonical_name(parent.name) if parent else None, name))
+        for allergen in allergens:
+            name = ingredients.canonical_allergen(allergen)
+            if name:
+                names.add(name)
+                aliases.add((ingredients.normalize_name(allergen), name))
+                allergen_links.append((product_id, name))
+    aliases.update((name, name) for name in names)
+    conn.executemany(INSERT_INGREDIENT_SQL, [(name,) for name in names])
+    conn.executemany(UPSERT_INGREDIENT_ALIAS_SQL, sorted(aliases))
+    conn.executemany(CLEAR_PRODUCT_INGREDIENTS_SQL, [(product_id,) for product_id in texts])
+    conn.executemany(CLEAR_PRODUCT_ALLERGENS_SQL, [(product_id,) for product_id in texts])
+    conn.executemany(INSERT_PRODUCT_INGREDIENT_SQL, links)
+    conn.executemany(INSERT_PRODUCT_ALLERGEN_SQL, allergen_links)
+
+def _migrate_flat_products(conn):
+    """Version 1: the original flat products table keyed by product page, with the Data Viewer's indexes and FTS."""
+    conn.execute("""
     CREATE TABLE IF NOT EXISTS products (
         "Product Name" TEXT,
         "Brand" TEXT,
@@ -40,26 +425,375 @@ def create_table():
         "Notes" TEXT
     )
     """)
-    conn.commit()
-    conn.close()
-    print("Database table 'products' is ready.")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS sync_state (
+        "Product Page" TEXT PRIMARY KEY,
+        "Website" TEXT,
+        "Source Updated At" TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS extraction_cache (
+        "Body Hash" TEXT PRIMARY KEY,
+        "Ingredients List" TEXT,
+        "Ingredient Count" INTEGER
+    )
+    """)
+    existing = {row[1] for row in conn.execute('PRAGMA table_xinfo(products)')}
+    if "Price Value" not in existing:
+        conn.execute("""ALTER TABLE products ADD COLUMN "Price Value" REAL
+            GENERATED ALWAYS AS (CAST(NULLIF("Price (INR)", '') AS REAL)) VIRTUAL""")
+    for col in ["Brand", "Availability", "Segment", "Price Value", "Weight", "Last Updated", "Product Name"]:
+        index_name = "idx_products_" + re.sub(r'\W+', '_', col.lower()).strip('_')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {index_name} ON products ("{col}")')
+    fts_exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'").fetchone()
+    conn.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        "Product Name", "Ingredients List", "Notes", content='products', content_rowid='rowid')""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, "Product Name", "Ingredients List", "Notes")
+        VALUES (new.rowid, new."Product Name", new."Ingredients List", new."Notes");
+    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, "Product Name", "Ingredients List", "Notes")
+        VALUES ('delete', old.rowid, old."Product Name", old."Ingredients List", old."Notes");
+    END""")
+    conn.execute("""CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, "Product Name", "Ingredients List", "Notes")
+        VALUES ('delete', old.rowid, old."Product Name", old."Ingredients List", old."Notes");
+        INSERT INTO products_fts(rowid, "Product Name", "Ingredients List", "Notes")
+        VALUES (new.rowid, new."Product Name", new."Ingredients List", new."Notes");
+    END""")
+    if not fts_exists:
+        conn.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
 
-def upsert_product(product_data, db_lock):
+def _migrate_normalized_schema(conn):
     """
-    Inserts a new product or replaces an existing one in a thread-safe manner.
+    Version 2: brands, catalog_products, variants (keyed by the source's variant id) and
+    an interned ingredient join table, with typed columns (prices in paise). The flat
+    table's rows are carried over and `products` becomes a view with the old columns.
     """
-    with db_lock:
-        try:
-            conn = db_connect()
-            cursor = conn.cursor()
+    for name in ("products_fts_insert", "products_fts_delete", "products_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    conn.execute("DROP TABLE IF EXISTS products_fts")
+    conn.execute("ALTER TABLE products RENAME TO products_flat")
+
+    conn.execute("""
+    CREATE TABLE brands (
+        brand_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE catalog_products (
+        product_id INTEGER PRIMARY KEY,
+        brand_id INTEGER REFERENCES brands (brand_id),
+        product_page TEXT NOT NULL UNIQUE,
+        name TEXT,
+        segment TEXT,
+        positioning TEXT,
+        animal_replicated TEXT,
+        consumption_format TEXT,
+        storage_condition TEXT,
+        status TEXT,
+        distribution_channels TEXT,
+        channel TEXT,
+        website TEXT,
+        source_name TEXT,
+        source_links TEXT,
+        ingredients_text TEXT,
+        ingredient_count INTEGER,
+        last_updated TEXT,
+        notes TEXT
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE variants (
+        variant_id INTEGER PRIMARY KEY,
+        product_id INTEGER NOT NULL REFERENCES catalog_products (product_id) ON DELETE CASCADE,
+        source_variant_id TEXT NOT NULL DEFAULT '',
+        pack_size TEXT,
+        price_paise INTEGER,
+        weight REAL,
+        weight_unit TEXT,
+        availability TEXT,
+        in_stock INTEGER CHECK (in_stock IN (0, 1)),
+        UNIQUE (product_id, source_variant_id)
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE ingredients (
+        ingredient_id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE COLLATE NOCASE
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE product_ingredients (
+        product_id INTEGER NOT NULL REFERENCES catalog_products (product_id) ON DELETE CASCADE,
+        ingredient_id INTEGER NOT NULL REFERENCES ingredients (ingredient_id),
+        position INTEGER NOT NULL,
+        PRIMARY KEY (product_id, ingredient_id)
+    ) WITHOUT ROWID
+    """)
+    # Each index holds the rowid, so these cover the view's joins and the Data Viewer's filters and sorts
+    conn.execute("CREATE INDEX idx_catalog_products_brand ON catalog_products (brand_id, name)")
+    conn.execute("CREATE INDEX idx_catalog_products_segment ON catalog_products (segment)")
+    conn.execute("CREATE INDEX idx_catalog_products_name ON catalog_products (name)")
+    conn.execute("CREATE INDEX idx_catalog_products_last_updated ON catalog_products (last_updated)")
+    conn.execute("CREATE INDEX idx_variants_price ON variants (price_paise, product_id)")
+    conn.execute("CREATE INDEX idx_variants_availability ON variants (availability, product_id)")
+    conn.execute("CREATE INDEX idx_variants_weight ON variants (weight, product_id)")
+    conn.execute("CREATE INDEX idx_product_ingredients_ingredient ON product_ingredients (ingredient_id, product_id)")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_sync_state_website ON sync_state ("Website")')
+
+    conn.execute("""CREATE VIRTUAL TABLE products_fts USING fts5(
+        name, ingredients_text, notes, content='catalog_products', content_rowid='product_id')""")
+    conn.execute("""CREATE TRIGGER products_fts_insert AFTER INSERT ON catalog_products BEGIN
+        INSERT INTO products_fts(rowid, name, ingredients_text, notes)
+        VALUES (new.product_id, new.name, new.ingredients_text, new.notes);
+    END""")
+    conn.execute("""CREATE TRIGGER products_fts_delete AFTER DELETE ON catalog_products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, ingredients_text, notes)
+        VALUES ('delete', old.product_id, old.name, old.ingredients_text, old.notes);
+    END""")
+    conn.execute("""CREATE TRIGGER products_fts_update AFTER UPDATE OF name, ingredients_text, notes ON catalog_products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, ingredients_text, notes)
+        VALUES ('delete', old.product_id, old.name, old.ingredients_text, old.notes);
+        INSERT INTO products_fts(rowid, name, ingredients_text, notes)
+        VALUES (new.product_id, new.name, new.ingredients_text, new.notes);
+    END""")
+
+    # Copy the flat rows in SQL so this migration does not depend on how write_products evolves
+    conn.create_function("price_to_paise", 1, price_to_paise)
+    conn.execute("""INSERT INTO brands (name) SELECT DISTINCT "Brand" FROM products_flat
+        WHERE "Brand" IS NOT NULL AND "Brand" != '' AND "Product Page" IS NOT NULL""")
+    conn.execute("""INSERT INTO catalog_products (brand_id, product_page, name, segment, positioning,
+        animal_replicated, consumption_format, storage_condition, status, distribution_channels, channel,
+        website, source_name, source_links, ingredients_text, ingredient_count, last_updated, notes)
+    SELECT b.brand_id, f."Product Page", f."Product Name", f."Segment", f."Positioning",
+        f."Animal Product Replicated", f."Consumption Format", f."Storage Condition", f."Status",
+        f."Distribution Channels", f."Channel", f."Website", f."Source Name", f."Source Links",
+        f."Ingredients List", f."Ingredient Count", f."Last Updated", f."Notes"
+    FROM products_flat f LEFT JOIN brands b ON b.name = f."Brand"
+    WHERE f."Product Page" IS NOT NULL ORDER BY f.rowid""")
+    conn.execute("""INSERT INTO variants (product_id, source_variant_id, pack_size, price_paise, weight,
+        weight_unit, availability, in_stock)
+    SELECT p.product_id, '', f."Pack Size", price_to_paise(f."Price (INR)"), f."Weight", f."Weight Unit",
+        f."Availability", CASE WHEN f."In Stock" IN (0, 1) THEN f."In Stock" END
+    FROM products_flat f JOIN catalog_products p ON p.product_page = f."Product Page" ORDER BY p.product_id""")
+    links = [(product_id, [name.strip() for name in text.split(',') if name.strip()])
+             for product_id, text in conn.execute("SELECT product_id, ingredients_text FROM catalog_products WHERE ingredients_text != ''")]
+    conn.executemany("INSERT INTO ingredients (name) VALUES (?) ON CONFLICT(name) DO NOTHING",
+                     [(name,) for _, names in links for name in names])
+    conn.executemany("""INSERT OR IGNORE INTO product_ingredients (product_id, ingredient_id, position)
+        SELECT ?, ingredient_id, ? FROM ingredients WHERE name = ?""",
+                     [(product_id, position, name) for product_id, names in links for position, name in enumerate(names)])
+    conn.execute("DROP TABLE products_flat")
+
+    def view_expression(col):
+        if col == "Brand":
+            return 'b.name'
+        if col == "Price (INR)":
+            # Same two-decimal text Shopify sends, so exports keep their format
+            return "CASE WHEN v.price_paise IS NULL THEN NULL ELSE printf('%.2f', v.price_paise / 100.0) END"
+        return f'p.{CATALOG_FIELDS[col]}' if col in CATALOG_FIELDS else f'v.{VARIANT_FIELDS[col]}'
+
+    view_columns = ',\n        '.join(f'{view_expression(col)} AS "{col}"' for col in PRODUCT_COLUMNS)
+    conn.execute(f"""CREATE VIEW products AS SELECT
+        {view_columns},
+        v.price_paise AS "Price Paise",
+        p.product_id AS "Product ID",
+        v.variant_id AS "Row ID",
+        v.source_variant_id AS "Variant ID"
+    FROM variants v
+    JOIN catalog_products p ON p.product_id = v.product_id
+    LEFT JOIN brands b ON b.brand_id = p.brand_id""")
+
+def _migrate_variant_history(conn):
+    """
+    Version 3: a content hash per variant, so unchanged rows are skipped before any write,
+    and an append-only variant_history of price and availability, filled by triggers only
+    when one of those values changes. current_prices shows each variant's state and since when.
+    """
+    conn.execute("ALTER TABLE variants ADD COLUMN content_hash TEXT")
+    conn.execute("""
+    CREATE TABLE variant_history (
+        history_id INTEGER PRIMARY KEY,
+        variant_id INTEGER NOT NULL REFERENCES variants (variant_id) ON DELETE CASCADE,
+        observed_at TEXT NOT NULL,
+        price_paise INTEGER,
+        availability TEXT,
+        in_stock INTEGER
+    )
+    """)
+    conn.execute("CREATE INDEX idx_variant_history_variant ON variant_history (variant_id, history_id)")
+    # What is stored today is the first known point of every variant's history
+    conn.execute("""INSERT INTO variant_history (variant_id, observed_at, price_paise, availability, in_stock)
+        SELECT variant_id, strftime('%Y-%m-%dT%H:%M:%SZ', 'now'), price_paise, availability, in_stock
+        FROM variants ORDER BY variant_id""")
+    conn.execute("""CREATE TRIGGER variant_history_insert AFTER INSERT ON variants BEGIN
+        INSERT INTO variant_history (variant_id, observed_at, price_paise, availability, in_stock)
+        VALUES (new.variant_id, strftime('%Y-%m-%dT%H:%M:%SZ', 'now'), new.price_paise, new.availability, new.in_stock);
+    END""")
+    conn.execute("""CREATE TRIGGER variant_history_update AFTER UPDATE OF price_paise, availability, in_stock ON variants
+    WHEN old.price_paise IS NOT new.price_paise OR old.availability IS NOT new.availability
+        OR old.in_stock IS NOT new.in_stock
+    BEGIN
+        INSERT INTO variant_history (variant_id, observed_at, price_paise, availability, in_stock)
+        VALUES (new.variant_id, strftime('%Y-%m-%dT%H:%M:%SZ', 'now'), new.price_paise, new.availability, new.in_stock);
+    END""")
+    # Foreign keys are not enforced on these connections, so cascade by hand
+    conn.execute("""CREATE TRIGGER variant_history_delete AFTER DELETE ON variants BEGIN
+        DELETE FROM variant_history WHERE variant_id = old.variant_id;
+    END""")
+    conn.execute("""CREATE VIEW current_prices AS SELECT
+        v.variant_id AS "Row ID",
+        p.product_page AS "Product Page",
+        v.source_variant_id AS "Variant ID",
+        v.price_paise AS "Price Paise",
+        v.availability AS "Availability",
+        v.in_stock AS "In Stock",
+        h.observed_at AS "Since",
+        (SELECT prev.price_paise FROM variant_history prev
+         WHERE prev.variant_id = v.variant_id AND prev.history_id < h.history_id
+         ORDER BY prev.history_id DESC LIMIT 1) AS "Previous Price Paise",
+        (SELECT COUNT(*) FROM variant_history c WHERE c.variant_id = v.variant_id) AS "Changes"
+    FROM variants v
+    JOIN catalog_products p ON p.product_id = v.product_id
+    LEFT JOIN variant_history h ON h.history_id = (
+        SELECT MAX(history_id) FROM variant_history WHERE variant_id = v.variant_id)""")
+
+def _migrate_enrichment(conn):
+    """
+    Version 4: the enrichment pass's results per variant (pack count, total grams or millilitres,
+    price per 100 of that unit) and enriched_hash, which tells it which rows changed since it last
+    ran. The products view is rebuilt with the enriched columns.
+    """
+    for column in ("pack_count INTEGER", "net_quantity REAL", "quantity_unit TEXT",
+                   "price_per_100_paise INTEGER", "enriched_hash TEXT"):
+        conn.execute(f"ALTER TABLE variants ADD COLUMN {column}")
+    conn.execute("CREATE INDEX idx_variants_price_per_100 ON variants (price_per_100_paise, product_id)")
+
+    def view_expression(col):
+        if col == "Brand":
+            return 'b.name'
+        if col == "Price (INR)":
+            return "CASE WHEN v.price_paise IS NULL THEN NULL ELSE printf('%.2f', v.price_paise / 100.0) END"
+        return f'p.{CATALOG_FIELDS[col]}' if col in CATALOG_FIELDS else f'v.{VARIANT_FIELDS[col]}'
+
+    view_columns = ',\n        '.join(f'{view_expression(col)} AS "{col}"' for col in PRODUCT_COLUMNS)
+    conn.execute("DROP VIEW products")
+    conn.execute(f"""CREATE VIEW products AS SELECT
+        {view_columns},
+        v.pack_count AS "Pack Count",
+        v.net_quantity AS "Net Quantity",
+        v.quantity_unit AS "Quantity Unit",
+        CASE WHEN v.price_per_100_paise IS NULL THEN NULL
+            ELSE printf('%.2f', v.price_per_100_paise / 100.0) END AS "Price per 100 (INR)",
+        v.price_paise AS "Price Paise",
+        v.price_per_100_paise AS "Price per 100 Paise",
+        p.product_id AS "Product ID",
+        v.variant_id AS "Row ID",
+        v.source_variant_id AS "Variant ID"
+    FROM variants v
+    JOIN catalog_products p ON p.product_id = v.product_id
+    LEFT JOIN brands b ON b.brand_id = p.brand_id""")
+
+def _migrate_ingredient_dictionary(conn):
+    """
+    Version 5: ingredients become a dictionary of canonical names. ingredient_aliases maps
+    every spelling seen to one of them, product_ingredients records declared percentages and
+    the ingredient a sub-ingredient belongs to, and product_allergens holds "Contains:"
+    declarations. Only the schema changes: the ingredients linked so far (raw comma-split
+    text, with no alias) stay linked until the next enrichment pass links those products
+    again with the parser of its day (see get_unaliased_ingredient_lists).
+    """
+    conn.execute("ALTER TABLE product_ingredients ADD COLUMN percentage REAL")
+    conn.execute("ALTER TABLE product_ingredients ADD COLUMN parent_ingredient_id INTEGER REFERENCES ingredients (ingredient_id)")
+    conn.execute("""
+    CREATE TABLE ingredient_aliases (
+        alias TEXT PRIMARY KEY COLLATE NOCASE,
+        ingredient_id INTEGER NOT NULL REFERENCES ingredients (ingredient_id)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("""
+    CREATE TABLE product_allergens (
+        product_id INTEGER NOT NULL REFERENCES catalog_products (product_id) ON DELETE CASCADE,
+        ingredient_id INTEGER NOT NULL REFERENCES ingredients (ingredient_id),
+        PRIMARY KEY (product_id, ingredient_id)
+    ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX idx_ingredient_aliases_ingredient ON ingredient_aliases (ingredient_id)")
+    conn.execute("CREATE INDEX idx_product_allergens_ingredient ON product_allergens (ingredient_id, product_id)")
+
+def _migrate_product_matching(conn):
+    """
+    Version 6: cluster_id groups listings of the same product across brands and sites (the
+    smallest product id of the cluster; see matching.py) and match_hash tells the matcher which
+    products changed since it last ran. product_clusters lists every product with its cluster.
+    """
+    conn.execute("ALTER TABLE catalog_products ADD COLUMN cluster_id INTEGER")
+    conn.execute("ALTER TABLE catalog_products ADD COLUMN match_hash TEXT")
+    conn.execute("CREATE INDEX idx_catalog_products_cluster ON catalog_products (cluster_id, product_id)")
+    conn.execute("""CREATE VIEW product_clusters AS SELECT
+        p.cluster_id AS "Cluster ID",
+        p.product_id AS "Product ID",
+        b.name AS "Brand",
+        p.name AS "Product Name",
+        p.product_page AS "Product Page",
+        (SELECT COUNT(*) FROM catalog_products c WHERE c.cluster_id = p.cluster_id) AS "Cluster Size"
+    FROM catalog_products p
+    LEFT JOIN brands b ON b.brand_id = p.brand_id
+    WHERE p.cluster_id IS NOT NULL""")
 
-            columns = ', '.join([f'"{col}"' for col in product_data.keys()])
-            placeholders = ', '.join(['?'] * len(product_data))
+# Schema history, applied in order; PRAGMA user_version records how many have run.
+# Never edit a released migration, append a new one instead.
+MIGRATIONS = [
+    _migrate_flat_products,
+    _migrate_normalized_schema,
+    _migrate_variant_history,
+    _migrate_enrichment,
+    _migrate_ingredient_dictionary,
+    _migrate_product_matching,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
 
-            sql = f"INSERT OR REPLACE INTO products ({columns}) VALUES ({placeholders})"
+def migrate(db_file=None):
+    """Brings a database up to SCHEMA_VERSION, one transaction per migration. Returns the resulting version."""
+    conn = open_writer_connection(db_file or DB_FILE)
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        while version < SCHEMA_VERSION:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Another process may have migrated while we waited for the lock
+                version = conn.execute("PRAGMA user_version").fetchone()[0]
+                if version < SCHEMA_VERSION:
+                    MIGRATIONS[version](conn)
+                    version += 1
+                    conn.execute(f"PRAGMA user_version = {version}")
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                conn.execute("ROLLBACK")
+                raise
+        return version
+    finally:
+        conn.close()
 
-            cursor.execute(sql, list(product_data.values()))
+def create_table(db_file=None):
+    """Creates the database, or migrates it to the current schema version."""
+    version = migrate(db_file)
+    print(f"Database schema is ready (version {version}).")
 
+def upsert_product(product_data, db_lock, variant_id=None):
+    """
+    Inserts a new product variant or updates the existing one in a thread-safe manner.
+    """
+    with db_lock:
+        conn = None
+        try:
+            conn = db_connect()
+            row = tuple(product_data.get(col) for col in PRODUCT_COLUMNS) + (variant_id,)
+            write_products(conn, [row])
             conn.commit()
         except sqlite3.Error as e:
             print(f"Database error: {e}")
@@ -67,13 +801,356 @@ def upsert_product(product_data, db_lock):
             if conn:
                 conn.close()
 
+def create_staging_database(label):
+    """
+    Creates an empty staging database for one crawl and returns its path.
+    Writing there instead of to DB_FILE means concurrent crawl processes never contend for the same lock.
+    """
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    safe_label = re.sub(r'[^A-Za-z0-9_-]+', '_', label or 'crawl').strip('_') or 'crawl'
+    path = os.path.join(STAGING_DIR, f"{safe_label}-{os.getpid()}-{int(time.time() * 1000)}.db")
+    conn = db_connect(path)
+    staged_columns = ', '.join(f'"{col}"' for col in STAGED_COLUMNS)
+    conn.execute(f"CREATE TABLE staged_products ({staged_columns})")
+    conn.execute('CREATE TABLE sync_state ("Product Page" TEXT PRIMARY KEY, "Website" TEXT, "Source Updated At" TEXT)')
+    conn.commit()
+    conn.close()
+    return path
+
+def merge_staging_database(path, delete=True):
+    """
+    Copies every row of a staging database into DB_FILE in a single transaction.
+    Returns the number of rows merged, or None if the merge failed (the staging file is then kept).
+    """
+    conn = get_shared_connection()
+    with _shared_write_lock:
+        try:
+            conn.execute("ATTACH DATABASE ? AS staging", (path,))
+        except sqlite3.Error as e:
+            print(f"Could not open staging database {path}: {e}")
+            return None
+        try:
+            staged_tables = {row[0] for row in conn.execute("SELECT name FROM staging.sqlite_master WHERE type = 'table'")}
+            columns = ', '.join(f'"{col}"' for col in PRODUCT_COLUMNS)
+            if 'staged_products' in staged_tables:
+                query = f'SELECT {columns}, "Variant ID" FROM staging.staged_products'
+            else:
+                # Left behind by a crawl from before the normalized schema
+                query = f"SELECT {columns}, '' FROM staging.products"
+            conn.execute("BEGIN IMMEDIATE")
+            merged = 0
+            cursor = conn.execute(query)
+            while True:
+                rows = cursor.fetchmany(1000)
+                if not rows:
+                    break
+                write_products(conn, rows)
+                merged += len(rows)
+            conn.execute('INSERT OR REPLACE INTO main.sync_state SELECT * FROM staging.sync_state')
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Database error while merging {path}: {e}")
+            return None
+        finally:
+            conn.execute("DETACH DATABASE staging")
+    if delete:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    return merged
+
+def merge_stale_staging_databases(max_age_seconds=600):
+    """
+    Merges staging databases left behind by crawls that died before merging.
+    Only files untouched for `max_age_seconds` are merged, so live crawls are left alone.
+    """
+    merged = 0
+    now = time.time()
+    for path in sorted(glob.glob(os.path.join(STAGING_DIR, "*.db"))):
+        last_write = max(os.path.getmtime(p) for p in (path, path + '-wal') if os.path.exists(p))
+        if now - last_write >= max_age_seconds:
+            merged += merge_staging_database(path) or 0
+    return merged
+
+def get_sync_state(website):
+    """Returns a {product page: source version (see extraction.source_version)} mapping for every product already stored for a website."""
+    conn = db_connect()
+    try:
+        cursor = conn.execute(
+            'SELECT s."Product Page", s."Source Updated At" FROM sync_state s '
+            'JOIN products p ON p."Product Page" = s."Product Page" WHERE s."Website" = ?',
+            (website,)
+        )
+        return dict(cursor.fetchall())
+    except sqlite3.OperationalError:
+        # Table not created yet, so nothing is known about this website
+        return {}
+    finally:
+        conn.close()
+
+def get_extraction_cache():
+    """Returns the persisted {body hash: (ingredients, ingredient count)} extraction results."""
+    conn = db_connect()
+    try:
+        cursor = conn.execute('SELECT "Body Hash", "Ingredients List", "Ingredient Count" FROM extraction_cache')
+        return {row[0]: (row[1], row[2]) for row in cursor}
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+
+def save_extraction_cache(entries):
+    """Stores {body hash: (ingredients, ingredient count)} extraction results in one transaction."""
+    conn = get_shared_connection()
+    with _shared_write_lock:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                'INSERT OR REPLACE INTO extraction_cache ("Body Hash", "Ingredients List", "Ingredient Count") VALUES (?, ?, ?)',
+                [(key, value[0], value[1]) for key, value in entries.items()]
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            print(f"Database error: {e}")
+
+def get_unenriched_variants(version, after_variant_id=0, limit=2000, full=False):
+    """
+    Returns up to `limit` variants after `after_variant_id` (in id order) that the enrichment
+    pass has not seen at `version` since their content last changed, or every variant with `full`.
+    Rows are (variant id, product id, name, segment, animal replicated, consumption format,
+    pack size, weight, weight unit, price in paise, content hash, ingredients text, enriched hash).
+    """
+    conn = get_shared_connection()
+    with _shared_write_lock:
+        return conn.execute(
+            """SELECT v.variant_id, v.product_id, p.name, p.segment, p.animal_replicated, p.consumption_format,
+                v.pack_size, v.weight, v.weight_unit, v.price_paise, COALESCE(v.content_hash, ''),
+                p.ingredients_text, v.enriched_hash
+            FROM variants v JOIN catalog_products p ON p.product_id = v.product_id
+            WHERE v.variant_id > ? AND (? OR v.enriched_hash IS NOT ? || ':' || COALESCE(v.content_hash, ''))
+            ORDER BY v.variant_id LIMIT ?""",
+            (after_variant_id, int(bool(full)), version, limit)
+        ).fetchall()
+
+def get_unaliased_ingredient_lists():
+    """
+    Returns {product id: ingredients text} for the products linked to an ingredient that has no
+    alias. Linking always gives an ingredient its own name as an alias, so these are links made
+    before schema version 5 from raw comma-split text, still to be linked again.
+    """
+    conn = get_shared_connection()
+    with _shared_write_lock:
+        return dict(conn.execute(
+            """SELECT p.product_id, p.ingredients_text FROM catalog_products p WHERE p.product_id IN (
+                SELECT pi.product_id FROM ingredients i
+                JOIN product_ingredients pi ON pi.ingredient_id = i.ingredient_id
+                WHERE NOT EXISTS (SELECT 1 FROM ingredient_aliases a WHERE a.ingredient_id = i.ingredient_id))"""
+        ).fetchall())
+
+def save_enrichment(variant_rows, product_rows, ingredient_texts=None):
+    """
+    Stores one chunk of enrichment results in a single transaction. `variant_rows` are
+    (pack count, net quantity, quantity unit, price per 100 in paise, enriched hash, variant id);
+    `product_rows` are (segment, animal replicated, consumption format, product id).
+    Products in `ingredient_texts` ({product id: ingredients text}) have their ingredients linked again.
+    """
+    conn = get_shared_connection()
+    with _shared_write_lock:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "UPDATE variants SET pack_count = ?, net_quantity = ?, quantity_unit = ?, price_per_100_paise = ?, "
+                "enriched_hash = ? WHERE variant_id = ?", variant_rows)
+            conn.executemany(
+                "UPDATE catalog_products SET segment = ?, animal_replicated = ?, consumption_format = ? "
+                "WHERE product_id = ?", product_rows)
+            if ingredient_texts:
+                _link_ingredients(conn, ingredient_texts)
+                # Raw names from before schema version 5 that nothing links to any more
+                conn.execute(PRUNE_UNALIASED_INGREDIENTS_SQL)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+def iter_match_features():
+    """
+    Yields what the product matcher compares, one row per product: (product id, brand, name,
+    comma-separated ingredient ids, smallest net quantity of one unit across its variants,
+    cluster id, match hash).
+    """
+    conn = db_connect()
+    try:
+        yield from conn.execute(
+            """SELECT p.product_id, b.name, p.name,
+                (SELECT group_concat(pi.ingredient_id) FROM product_ingredients pi WHERE pi.product_id = p.product_id),
+                (SELECT MIN(v.net_quantity / COALESCE(NULLIF(v.pack_count, 0), 1)) FROM variants v
+                 WHERE v.product_id = p.product_id),
+                p.cluster_id, p.match_hash
+            FROM catalog_products p LEFT JOIN brands b ON b.brand_id = p.brand_id""")
+    finally:
+        conn.close()
+
+def save_clusters(rows):
+    """Stores the matcher's results, (cluster id, match hash, product id) per product, in one transaction."""
+    if not rows:
+        return
+    conn = get_shared_connection()
+    with _shared_write_lock:
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("UPDATE catalog_products SET cluster_id = ?, match_hash = ? WHERE product_id = ?", rows)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+
+def iter_products(chunk_size=1000):
+    """Yields every product as a dictionary, fetching `chunk_size` rows at a time from one cursor."""
+    conn = db_connect()
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.execute(f"SELECT {_select_columns()} FROM products")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    finally:
+        conn.close()
+
+# Identifiers the products view exposes besides the flat columns; windows may include them
+KEY_COLUMNS = ["Row ID", "Product ID", "Variant ID"]
+# Sorting on the integer price column orders prices numerically and uses its index
+SORT_EXPRESSIONS = {"Price (INR)": '"Price Paise"', "Price per 100 (INR)": '"Price per 100 Paise"'}
+
+def _select_columns(columns=None):
+    return ', '.join(f'"{col}"' for col in (columns or PRODUCT_COLUMNS + ENRICHED_COLUMNS))
+
+def _search_query(text):
+    """Turns free text into an FTS5 query matching every word as a prefix."""
+    words = re.findall(r'\w+', text)
+    return ' '.join(f'"{word}"*' for word in words)
+
+def product_filter_sql(filters):
+    """
+    Builds a WHERE clause from a filters dictionary with any of: brand, availability,
+    segment (exact matches), min_price, max_price (numbers), ingredient (any spelling of
+    an ingredient) and search (free text).
+    Returns (sql, params); sql is empty when nothing is filtered.
+    """
+    clauses, params = [], []
+    filters = filters or {}
+    for key, col in (("brand", "Brand"), ("availability", "Availability"), ("segment", "Segment")):
+        if filters.get(key):
+            clauses.append(f'"{col}" = ?')
+            params.append(filters[key])
+    if filters.get("min_price") not in (None, ''):
+        clauses.append('"Price Paise" >= ?')
+        params.append(round(float(filters["min_price"]) * 100))
+    if filters.get("max_price") not in (None, ''):
+        clauses.append('"Price Paise" <= ?')
+        params.append(round(float(filters["max_price"]) * 100))
+    if filters.get("ingredient"):
+        from product_scraper import ingredients
+        # An indexed lookup: alias -> canonical ingredient -> products (idx_product_ingredients_ingredient).
+        # Names are matched too, for links from before schema version 5 that enrichment has not redone yet
+        names = [ingredients.normalize_name(filters["ingredient"]), ingredients.canonical_name(filters["ingredient"])]
+        clauses.append('"Product ID" IN (SELECT product_id FROM product_ingredients WHERE ingredient_id IN ('
+                       'SELECT ingredient_id FROM ingredient_aliases WHERE alias IN (?, ?) '
+                       'UNION SELECT ingredient_id FROM ingredients WHERE name IN (?, ?)))')
+        params.extend(names + names)
+    if filters.get("search"):
+        query = _search_query(filters["search"])
+        if query:
+            clauses.append('"Product ID" IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)')
+            params.append(query)
+    return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+def count_products(filters=None):
+    """Returns the number of product rows (one per variant) that match `filters`."""
+    where, params = product_filter_sql(filters)
+    conn = db_connect()
+    try:
+        return conn.execute(f"SELECT COUNT(*) FROM products{where}", params).fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+    finally:
+        conn.close()
+
+def get_products_window(columns, offset, limit, order_by=None, descending=False, filters=None):
+    """
+    Returns `limit` rows (as tuples of `columns`) starting at `offset`, optionally filtered and
+    sorted by one column. Only the requested window is read, so the cost does not grow with the
+    size of the table. `columns` may also name KEY_COLUMNS, e.g. "Row ID" to identify a variant.
+    """
+    for col in list(columns) + ([order_by] if order_by else []):
+        if col not in PRODUCT_COLUMNS and col not in ENRICHED_COLUMNS and col not in KEY_COLUMNS:
+            raise ValueError(f"Unknown column: {col}")
+    where, params = product_filter_sql(filters)
+    if order_by:
+        sort_key = SORT_EXPRESSIONS.get(order_by, f'"{order_by}"')
+        order = f'{sort_key} {"DESC" if descending else "ASC"}, "Row ID"'
+    else:
+        order = '"Row ID"'
+    conn = db_connect()
+    try:
+        cursor = conn.execute(
+            f"SELECT {_select_columns(columns)} FROM products{where} ORDER BY {order} LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        )
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+def get_current_price(row_id):
+    """Returns the current_prices row (a dictionary) for one variant, or None if it does not exist."""
+    conn = db_connect()
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute('SELECT * FROM current_prices WHERE "Row ID" = ?', (row_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+def get_price_history(row_id):
+    """Returns a variant's (observed at, price in paise, availability, in stock) changes, oldest first."""
+    conn = db_connect()
+    try:
+        return conn.execute(
+            'SELECT observed_at, price_paise, availability, in_stock FROM variant_history '
+            'WHERE variant_id = ? ORDER BY history_id', (row_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+
+def get_distinct_values(column):
+    """Returns the sorted distinct non-empty values of a column, e.g. to fill a filter drop-down."""
+    if column not in PRODUCT_COLUMNS:
+        raise ValueError(f"Unknown column: {column}")
+    conn = db_connect()
+    try:
+        rows = conn.execute(f'SELECT DISTINCT "{column}" FROM products WHERE "{column}" IS NOT NULL AND "{column}" != \'\' ORDER BY 1')
+        return [row[0] for row in rows]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
 def get_all_products():
     """Fetches all products from the database and returns them as a list of dictionaries."""
     conn = db_connect()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
 
-    cursor.execute("SELECT * FROM products")
+    cursor.execute(f"SELECT {_select_columns()} FROM products")
     rows = cursor.fetchall()
 
     products = [dict(row) for row in rows]
@@ -83,3 +1160,6 @@ def get_all_products():
 
 if __name__ == '__main__':
     create_table()
+    merged = merge_stale_staging_databases()
+    if merged:
+        print(f"Merged {merged} products from leftover staging databases.")
@@ -0,0 +1,161 @@
+import argparse
+import hashlib
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import database
+from product_scraper import extraction, ingredients
+
+# Bump when the quantity rules below change; edits to the keyword tables in
+# product_scraper/extraction.py and the ingredient aliases in product_scraper/ingredients.py
+# are picked up through RULES_VERSION on their own
+ENRICHMENT_VERSION = "1"
+
+# Unit spellings -> (normalized unit, factor to it)
+UNITS = {
+    'g': ('g', 1), 'gm': ('g', 1), 'gms': ('g', 1), 'gr': ('g', 1), 'grm': ('g', 1), 'gram': ('g', 1), 'grams': ('g', 1),
+    'kg': ('g', 1000), 'kgs': ('g', 1000), 'kilo': ('g', 1000), 'kilos': ('g', 1000),
+    'kilogram': ('g', 1000), 'kilograms': ('g', 1000),
+    'ml': ('ml', 1), 'millilitre': ('ml', 1), 'millilitres': ('ml', 1), 'milliliter': ('ml', 1), 'milliliters': ('ml', 1),
+    'l': ('ml', 1000), 'lt': ('ml', 1000), 'ltr': ('ml', 1000), 'ltrs': ('ml', 1000),
+    'litre': ('ml', 1000), 'litres': ('ml', 1000), 'liter': ('ml', 1000), 'liters': ('ml', 1000),
+}
+# "250 g", "1.5kg", "1,000 g"; the number must not continue another number or word
+QUANTITY_PATTERN = r'(?<![\w.,])(\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)\s*(%s)(?![a-z])' % '|'.join(
+    sorted(UNITS, key=len, reverse=True))
+QUANTITY_RE = re.compile(QUANTITY_PATTERN, re.IGNORECASE)
+# "2 x 250g" and "250g x 2" name the pack count and the size of each unit together
+COUNT_TIMES_QUANTITY_RE = re.compile(r'(?<![\w.])(\d+)\s*[x×*]\s*' + QUANTITY_PATTERN, re.IGNORECASE)
+QUANTITY_TIMES_COUNT_RE = re.compile(QUANTITY_PATTERN + r'\s*[x×*]\s*(\d+)(?![\w.])', re.IGNORECASE)
+# "Pack of 2", "Combo of 3", "2 packs", "3-pack"
+PACK_COUNT_RE = re.compile(r'\b(?:pack|set|combo|box|case|bundle)\s+of\s+(\d+)\b|(?<![\w.])(\d+)\s*-?\s*(?:packs?|pk)\b',
+                           re.IGNORECASE)
+
+RULES_VERSION = hashlib.sha1(repr((
+    ENRICHMENT_VERSION, extraction.ANIMAL_KEYWORDS, extraction.FORMAT_KEYWORDS, extraction.NEGATED_KEYWORDS,
+    extraction.NON_ANALOGUE_KEYWORDS, extraction.NON_FOOD_KEYWORDS, extraction.READY_TO_EAT_KEYWORDS, UNITS,
+    ingredients.ALIASES, ingredients.ALLERGEN_ALIASES, sorted(ingredients.DESCRIPTORS),
+)).encode('utf-8')).hexdigest()[:12]
+
+
+def _amount(number, unit):
+    normalized, factor = UNITS[unit.lower()]
+    return float(number.replace(',', '')) * factor, normalized
+
+
+def parse_quantity(text):
+    """
+    Reads the pack count and the quantity of each unit from a title or pack size.
+    Returns (pack count or None, quantity or None, 'g' or 'ml' or None); kg and l are converted.
+    """
+    if not text:
+        return None, None, None
+    match = COUNT_TIMES_QUANTITY_RE.search(text)
+    if match:
+        return int(match.group(1)), *_amount(match.group(2), match.group(3))
+    match = QUANTITY_TIMES_COUNT_RE.search(text)
+    if match:
+        return int(match.group(3)), *_amount(match.group(1), match.group(2))
+    count_match = PACK_COUNT_RE.search(text)
+    count = int(count_match.group(1) or count_match.group(2)) if count_match else None
+    match = QUANTITY_RE.search(text)
+    if match:
+        return count, *_amount(match.group(1), match.group(2))
+    return count, None, None
+
+
+def enrich_quantity(name, pack_size, weight, weight_unit):
+    """
+    (pack count, net quantity, unit) of one variant. A pack count multiplies the unit size
+    named with it ("2 x 250g") or in the title ("Nuggets (250 g)" sold as "Pack of 2" is
+    500 g), but a variant's own size or stored weight is already the whole pack's, so
+    "Bytz (Pack of 2)" with a "500g" variant is 500 g.
+    """
+    variant_count, variant_quantity, variant_unit = parse_quantity(pack_size)
+    title_count, title_quantity, title_unit = parse_quantity(name)
+    if variant_quantity:
+        if variant_count:
+            return variant_count, round(variant_count * variant_quantity, 3), variant_unit
+        return title_count or 1, round(variant_quantity, 3), variant_unit
+    count = variant_count or title_count or 1
+    if title_quantity:
+        return count, round(count * title_quantity, 3), title_unit
+    if weight and (weight_unit or 'g').lower() in UNITS:
+        quantity, unit = _amount(str(weight), weight_unit or 'g')
+        return count, round(quantity, 3), unit
+    return count, None, None
+
+
+def price_per_100(price_paise, net_quantity):
+    if not price_paise or not net_quantity:
+        return None
+    return round(price_paise * 100 / net_quantity)
+
+
+def enrich_products(full=False, chunk_size=2000):
+    """
+    Classifies and normalizes every variant whose row changed since the last pass (or every
+    variant with `full`), `chunk_size` rows per transaction. Product titles are classified once
+    per distinct title, and quantities parsed once per distinct (title, pack size, weight).
+    Products stored without a segment come from extractors that do not classify and keep it.
+    When the rules changed since a row was last enriched, its product's ingredients are linked again,
+    and so are the products still linked the way they were before schema version 5.
+    Returns {'variants', 'products_reclassified', 'elapsed'}.
+    """
+    started = time.monotonic()
+    quantities = {}
+    variants = reclassified = 0
+    last_id = 0
+    legacy = database.get_unaliased_ingredient_lists()
+    legacy_ids = list(legacy)
+    for i in range(0, len(legacy_ids), chunk_size):
+        database.save_enrichment([], [], {product_id: legacy[product_id] for product_id in legacy_ids[i:i + chunk_size]})
+    while True:
+        rows = database.get_unenriched_variants(RULES_VERSION, last_id, chunk_size, full)
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        variant_rows, product_rows, ingredient_texts = [], {}, {}
+        for (variant_id, product_id, name, segment, animal, consumption_format, pack_size,
+             weight, weight_unit, price_paise, content_hash, ingredients_text, enriched_hash) in rows:
+            if segment is not None and product_id not in product_rows:
+                details = extraction.infer_product_details(name or '')
+                if details != (segment, animal, consumption_format):
+                    product_rows[product_id] = details + (product_id,)
+            # Rows written since the last pass were linked as they were written, and products
+            # linked before schema version 5 were linked above; rows enriched under older rules
+            # may map to other canonical ingredients now
+            if ingredients_text and product_id not in legacy and (
+                    full or (enriched_hash and not enriched_hash.startswith(f"{RULES_VERSION}:"))):
+                ingredient_texts[product_id] = ingredients_text
+            key = (name, pack_size, weight, weight_unit)
+            if key not in quantities:
+                quantities[key] = enrich_quantity(*key)
+            count, net_quantity, unit = quantities[key]
+            variant_rows.append((count, net_quantity, unit, price_per_100(price_paise, net_quantity),
+                                 f"{RULES_VERSION}:{content_hash}", variant_id))
+        database.save_enrichment(variant_rows, list(product_rows.values()), ingredient_texts)
+        variants += len(variant_rows)
+        reclassified += len(product_rows)
+    return {'variants': variants, 'products_reclassified': reclassified,
+            'elapsed': round(time.monotonic() - started, 3)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Classify stored products and normalize their quantities and "
+                                     "price per 100 g/ml, for rows changed since the last pass.")
+    parser.add_argument('--full', action='store_true', help="Re-enrich every row, not only changed ones.")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="Rows per transaction.")
+    args = parser.parse_args(argv)
+    database.migrate()
+    result = enrich_products(full=args.full, chunk_size=args.chunk_size)
+    print(f"Enriched {result['variants']} variants ({result['products_reclassified']} products reclassified) "
+          f"in {result['elapsed']:.2f}s.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
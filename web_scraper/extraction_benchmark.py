@@ -0,0 +1,92 @@
+import argparse
+import asyncio
+import os
+import pickle
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from product_scraper import extraction
+
+INGREDIENTS = ["soy protein", "pea protein", "wheat gluten", "sunflower oil", "salt", "onion",
+               "garlic", "spices", "methylcellulose", "coconut oil", "beetroot extract", "yeast extract"]
+
+
+def make_products(count, seed=42):
+    """Builds synthetic Shopify products with distinct, realistically sized body_html."""
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        ingredients = ", ".join(rng.sample(INGREDIENTS, 6))
+        paragraphs = "".join(f"<p>Juicy, protein-packed goodness #{i}-{n}. Ready in 5 minutes.</p>" for n in range(20))
+        body_html = (f"<div class='description'>{paragraphs}<h3>Details</h3><ul><li>Serves 2</li></ul>"
+                     f"<p><strong>Ingredients:</strong> {ingredients}. Contains soy.</p></div>")
+        products.append({'title': f"Plant Chicken Chunks {i} (250 g)", 'body_html': body_html,
+                         'updated_at': '2024-05-01T10:00:00+05:30'})
+    return products
+
+
+def run_inline(products):
+    return [extraction.extract_product_fields(product) for product in products]
+
+
+async def run_pool(products, workers, chunk_size):
+    """The work ShopifyExtractor.extract_fields does with EXTRACTION_WORKERS > 0, pickling included."""
+    await extraction.extract_in_pool(extraction.get_process_pool(workers), products, chunk_size)
+    return run_inline(products)
+
+
+def pickling_seconds(products, chunk_size):
+    """
+    The CPU time one pool run spends pickling: each chunk is pickled for a worker and unpickled
+    there, and its results are pickled back and unpickled here.
+    """
+    slim = [extraction.slim_product(product) for product in products]
+    chunks = [slim[i:i + chunk_size] for i in range(0, len(slim), chunk_size)]
+    results = [extraction.extract_products_fields(chunk) for chunk in chunks]
+    started = time.perf_counter()
+    for chunk, fields in zip(chunks, results):
+        pickle.loads(pickle.dumps(chunk, pickle.HIGHEST_PROTOCOL))
+        pickle.loads(pickle.dumps(fields, pickle.HIGHEST_PROTOCOL))
+    return time.perf_counter() - started
+
+
+def reset_cache():
+    extraction._ingredient_cache.clear()
+    extraction._new_cache_entries.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare inline and process-pool product extraction throughput.")
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--chunk-size', type=int, default=25)
+    args = parser.parse_args(argv)
+
+    products = make_products(args.products)
+
+    reset_cache()
+    started = time.perf_counter()
+    run_inline(products)
+    elapsed = time.perf_counter() - started
+    print(f"inline      : {args.products / elapsed:10.1f} items/sec ({elapsed:.2f}s)")
+
+    pickling = pickling_seconds(products, args.chunk_size)
+    for workers in args.workers:
+        # Workers fork with a copy of the cache, so it must be empty when they start
+        reset_cache()
+        # Start the workers before timing, as a long-running crawl would have them warm
+        asyncio.run(run_pool(make_products(workers, seed=workers), workers, 1))
+        reset_cache()
+        started = time.perf_counter()
+        asyncio.run(run_pool(products, workers, args.chunk_size))
+        elapsed = time.perf_counter() - started
+        print(f"{workers} workers   : {args.products / elapsed:10.1f} items/sec ({elapsed:.2f}s, "
+              f"{pickling:.2f}s of it pickling)")
+        # The pool keeps its first size, so each worker count gets a new one
+        extraction.shutdown_process_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,41 +1,186 @@
+import argparse
 import json
 import csv
 
+import database
+
+# Define all possible headers based on the database schema
+headers = database.PRODUCT_COLUMNS + database.ENRICHED_COLUMNS
+
+
+class JsonArrayWriter:
+    """Writes rows as a pretty-printed JSON array, one element at a time."""
+
+    def __init__(self, filename):
+        self.f = open(filename, 'w', encoding='utf-8')
+        self.f.write('[')
+        self.count = 0
+
+    def write(self, row):
+        element = json.dumps(row, indent=4, ensure_ascii=False).replace('\n', '\n    ')
+        self.f.write((',\n    ' if self.count else '\n    ') + element)
+        self.count += 1
+
+    def close(self):
+        self.f.write('\n]' if self.count else ']')
+        self.f.close()
+
+
+class JsonLinesWriter:
+    """Writes one compact JSON object per line."""
+
+    def __init__(self, filename):
+        self.f = open(filename, 'w', encoding='utf-8')
+
+    def write(self, row):
+        self.f.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+    def close(self):
+        self.f.close()
+
+
+class CsvWriter:
+    def __init__(self, filename):
+        self.f = open(filename, 'w', newline='', encoding='utf-8')
+        self.writer = csv.DictWriter(self.f, fieldnames=headers, extrasaction='ignore')
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.f.close()
+
+
+class ParquetWriter:
+    """
+    Writes rows to a Parquet file in row groups of `chunk_size`, using pyarrow.
+    Numeric columns get numeric types, so analysts do not have to cast them.
+    """
+
+    NUMERIC_COLUMNS = {"Weight": float, "Ingredient Count": int, "In Stock": int, "Pack Count": int, "Net Quantity": float}
+
+    def __init__(self, filename, chunk_size=10000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow).")
+        self.pa = pa
+        self.schema = pa.schema([
+            (col, pa.float64() if self.NUMERIC_COLUMNS.get(col) is float
+             else pa.int64() if self.NUMERIC_COLUMNS.get(col) is int else pa.string())
+            for col in headers
+        ])
+        self.writer = pq.ParquetWriter(filename, self.schema, compression='zstd')
+        self.chunk_size = chunk_size
+        self.columns = {col: [] for col in headers}
+        self.pending = 0
+
+    def coerce(self, col, value):
+        if value is None or value == '':
+            return None
+        cast = self.NUMERIC_COLUMNS.get(col, str)
+        try:
+            return cast(value)
+        except (TypeError, ValueError):
+            return None
+
+    def write(self, row):
+        for col in headers:
+            self.columns[col].append(self.coerce(col, row.get(col)))
+        self.pending += 1
+        if self.pending >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.writer.write_table(self.pa.Table.from_pydict(self.columns, schema=self.schema))
+            self.columns = {col: [] for col in headers}
+            self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+WRITERS = {
+    'json': JsonArrayWriter,
+    'jsonl': JsonLinesWriter,
+    'csv': CsvWriter,
+    'parquet': ParquetWriter,
+}
+
+
+def export_rows(rows, targets):
+    """
+    Streams rows into several files at once, in a single pass over `rows`.
+
+    Args:
+        rows (iterable): Dictionaries keyed by column name, e.g. database.iter_products().
+        targets (dict): {format: filename}, where format is one of json, jsonl, csv or parquet.
+
+    Returns:
+        int: The number of rows written.
+    """
+    writers = []
+    try:
+        for fmt, filename in targets.items():
+            writers.append(WRITERS[fmt](filename))
+        count = 0
+        for row in rows:
+            for writer in writers:
+                writer.write(row)
+            count += 1
+    finally:
+        for writer in writers:
+            writer.close()
+    return count
+
+
+def export_database(targets, chunk_size=1000):
+    """Exports every product in the database to all `targets` in one pass. Returns the number of rows."""
+    return export_rows(database.iter_products(chunk_size), targets)
+
+
 def write_to_json(data, filename):
-    """Writes a list of dictionaries to a JSON file."""
+    """Writes an iterable of dictionaries to a JSON file."""
     try:
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+        export_rows(data, {'json': filename})
         print(f"Data successfully written to {filename}")
         return True
     except Exception as e:
         print(f"Error writing to JSON file: {e}")
         return False
 
-def write_to_csv(data, filename):
-    """Writes a list of dictionaries to a CSV file."""
-    if not data:
-        print("No data provided to write to CSV.")
-        # Still create an empty file with headers
-        data = []
-
-    # Define all possible headers based on the database schema
-    headers = [
-        "Product Name", "Brand", "Segment", "Positioning", "Animal Product Replicated",
-        "Consumption Format", "Storage Condition", "Availability", "In Stock", "Status",
-        "Price (INR)", "Weight", "Weight Unit", "Pack Size", "Distribution Channels",
-        "Channel", "Product Page", "Website", "Source Name", "Source Links",
-        "Ingredients List", "Ingredient Count", "Last Updated", "Notes"
-    ]
 
+def write_to_csv(data, filename):
+    """Writes an iterable of dictionaries to a CSV file."""
     try:
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=headers, extrasaction='ignore')
-            writer.writeheader()
-            if data:
-                writer.writerows(data)
+        # An empty iterable still creates the file with headers
+        export_rows(data or [], {'csv': filename})
         print(f"Data successfully written to {filename}")
         return True
     except Exception as e:
         print(f"Error writing to CSV file: {e}")
         return False
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export all products from scraper.db without the GUI.")
+    for fmt in WRITERS:
+        parser.add_argument(f'--{fmt}', metavar='FILE', help=f"Write a {fmt.upper()} export to FILE.")
+    parser.add_argument('--chunk-size', type=int, default=1000, help="Rows fetched from the database per batch.")
+    args = parser.parse_args(argv)
+
+    targets = {fmt: getattr(args, fmt) for fmt in WRITERS if getattr(args, fmt)}
+    if not targets:
+        parser.error("Choose at least one output, e.g. --csv products.csv")
+    count = export_database(targets, args.chunk_size)
+    for filename in targets.values():
+        print(f"Data successfully written to {filename}")
+    print(f"Exported {count} products.")
+
+
+if __name__ == '__main__':
+    main()
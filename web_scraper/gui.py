@@ -1,14 +1,16 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import os
-import subprocess
 import threading
+import time
 import database
-import concurrent.futures
-import sys
 import csv
 import file_exporter
 import platform_detector # Import the new module
+import crawl_runner
+import jobs
+import scheduler
+from log_pipeline import LEVELS, LogPipeline
 
 class ScraperGUI(tk.Frame):
     def __init__(self, master=None):
@@ -18,11 +20,23 @@ class ScraperGUI(tk.Frame):
         self.master.geometry("1200x700")
         self.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
-        self.project_dir = os.path.join(os.path.dirname(__file__), "product_scraper")
         self.companies_file_path = os.path.join(os.path.dirname(__file__), "companies.csv")
+        # name, type and url come first; optional per-company columns (e.g. cache_ttl) follow and are preserved on save
+        self.company_columns = ['name', 'type', 'url']
+        # Crawls run in the scheduler daemon (scheduler.py), which keeps running when the window
+        # is closed; the GUI asks it for runs and follows its events
+        self.scheduler = scheduler.SchedulerClient()
+        # The companies of the run started from this window that have not finished yet
+        self.requested_companies = set()
+        # When the scheduler accepted that run; older status snapshots do not know about it yet
+        self.requested_at = 0
+        self.requests_lock = threading.Lock()
+        self.completed_tasks = 0
+        self.master.protocol("WM_DELETE_WINDOW", self.on_close)
 
         self.create_widgets()
         self.load_companies_to_treeview()
+        threading.Thread(target=self.follow_scheduler, daemon=True).start()
 
     def create_widgets(self):
         # ... (same as before)
@@ -77,7 +91,18 @@ class ScraperGUI(tk.Frame):
         self.remove_button = ttk.Button(left_frame, text="Remove Selected Company", command=self.remove_company)
         self.remove_button.pack(fill=tk.X)
 
-        ttk.Label(right_frame, text="Scraper Log", font=("Arial", 12, "bold")).pack(anchor="w")
+        log_header = ttk.Frame(right_frame)
+        log_header.pack(fill=tk.X)
+        ttk.Label(log_header, text="Scraper Log", font=("Arial", 12, "bold")).pack(side=tk.LEFT)
+        self.log_company_filter = ttk.Combobox(log_header, state="readonly", width=20, values=["All companies"],
+                                               postcommand=self.refresh_log_company_choices)
+        self.log_company_filter.set("All companies")
+        self.log_company_filter.pack(side=tk.RIGHT)
+        self.log_level_filter = ttk.Combobox(log_header, state="readonly", width=10, values=LEVELS[:-1])
+        self.log_level_filter.set("INFO")
+        self.log_level_filter.pack(side=tk.RIGHT, padx=5)
+        for combobox in (self.log_level_filter, self.log_company_filter):
+            combobox.bind("<<ComboboxSelected>>", self.on_log_filter_change)
         log_frame = ttk.Frame(right_frame)
         log_frame.pack(fill=tk.BOTH, expand=True, pady=5)
         self.output_text = tk.Text(log_frame, wrap=tk.WORD, state=tk.DISABLED, height=20, bg="black", fg="white")
@@ -85,10 +110,17 @@ class ScraperGUI(tk.Frame):
         log_scrollbar = ttk.Scrollbar(log_frame, orient=tk.VERTICAL, command=self.output_text.yview)
         log_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.output_text.config(yscrollcommand=log_scrollbar.set)
+        # Crawl output reaches the widget only through this pipeline (batched on a Tk timer);
+        # the full log of each company is also written to logs/<company>.log
+        self.log = LogPipeline(self.master, self.output_text)
         self.progress_bar = ttk.Progressbar(right_frame, orient='horizontal', mode='determinate')
         self.progress_bar.pack(fill=tk.X, pady=(5,0))
         self.run_button = ttk.Button(right_frame, text="Run All Scrapers", command=self.start_scraper_thread)
-        self.run_button.pack(pady=10, fill=tk.X, ipady=5)
+        self.run_button.pack(pady=(10, 5), fill=tk.X, ipady=5)
+        self.resume_button = ttk.Button(right_frame, text="Resume Incomplete", command=self.resume_incomplete)
+        self.resume_button.pack(pady=(0, 5), fill=tk.X)
+        self.scheduler_status = ttk.Label(right_frame, text="Scheduler: not running")
+        self.scheduler_status.pack(anchor="w", pady=(0, 10))
 
     def on_detect_type(self):
         url = self.url_entry.get().strip()
@@ -133,57 +165,250 @@ class ScraperGUI(tk.Frame):
         self.export_button.pack(side=tk.LEFT, padx=(0, 5))
         self.refresh_button = ttk.Button(button_pack, text="Refresh Data", command=self.refresh_data_view)
         self.refresh_button.pack(side=tk.LEFT)
+        self.create_data_filter_widgets(parent_tab)
         tree_frame = ttk.Frame(parent_tab)
         tree_frame.pack(fill=tk.BOTH, expand=True)
-        columns = ("Brand", "Product Name", "Price (INR)", "Weight", "Availability", "Last Updated")
+        columns = ("Brand", "Product Name", "Price (INR)", "Weight", "Price per 100 (INR)", "Availability", "Last Updated")
         self.data_tree = ttk.Treeview(tree_frame, columns=columns, show='headings')
         for col in columns:
             self.data_tree.heading(col, text=col, command=lambda _col=col: self.sort_treeview(_col, False, self.data_tree))
             self.data_tree.column(col, width=150, anchor=tk.W)
         self.data_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.data_tree.yview)
-        vsb.pack(side='right', fill='y')
-        self.data_tree.configure(yscrollcommand=vsb.set)
+        # The tree only ever holds the rows on screen; this scrollbar moves a window over the whole table
+        self.data_vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.on_data_scroll)
+        self.data_vsb.pack(side='right', fill='y')
         hsb = ttk.Scrollbar(parent_tab, orient="horizontal", command=self.data_tree.xview)
         hsb.pack(side='bottom', fill='x')
         self.data_tree.configure(xscrollcommand=hsb.set)
+        self.data_status = ttk.Label(parent_tab, text="")
+        self.data_status.pack(side='bottom', anchor='w')
+        self.data_tree.bind("<Configure>", self.on_data_tree_resize)
+        self.data_tree.bind("<MouseWheel>", lambda e: self.scroll_data_view(-1 if e.delta > 0 else 1, 'units'))
+        self.data_tree.bind("<Button-4>", lambda e: self.scroll_data_view(-1, 'units'))
+        self.data_tree.bind("<Button-5>", lambda e: self.scroll_data_view(1, 'units'))
+        self.data_tree.bind("<Double-1>", self.on_data_row_double_click)
+        self.data_view = {'offset': 0, 'total': 0, 'rows': 25, 'order_by': None, 'descending': False, 'filters': {}}
+        self.data_view_request = 0
+        self.data_view_pending = None
+
+    def create_data_filter_widgets(self, parent_tab):
+        filter_frame = ttk.Frame(parent_tab)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        self.filter_widgets = {}
+        for key, label in (("brand", "Brand:"), ("availability", "Availability:"), ("segment", "Segment:")):
+            ttk.Label(filter_frame, text=label).pack(side=tk.LEFT)
+            combo = ttk.Combobox(filter_frame, width=14, state="readonly")
+            combo.pack(side=tk.LEFT, padx=(2, 8))
+            combo.bind("<<ComboboxSelected>>", lambda e: self.apply_data_filters())
+            self.filter_widgets[key] = combo
+        for key, label in (("min_price", "Price from:"), ("max_price", "to:")):
+            ttk.Label(filter_frame, text=label).pack(side=tk.LEFT)
+            entry = ttk.Entry(filter_frame, width=8)
+            entry.pack(side=tk.LEFT, padx=(2, 8))
+            entry.bind("<Return>", lambda e: self.apply_data_filters())
+            self.filter_widgets[key] = entry
+        ttk.Label(filter_frame, text="Ingredient:").pack(side=tk.LEFT)
+        ingredient_entry = ttk.Entry(filter_frame, width=14)
+        ingredient_entry.pack(side=tk.LEFT, padx=(2, 8))
+        ingredient_entry.bind("<Return>", lambda e: self.apply_data_filters())
+        self.filter_widgets["ingredient"] = ingredient_entry
+        ttk.Label(filter_frame, text="Search:").pack(side=tk.LEFT)
+        search_entry = ttk.Entry(filter_frame, width=24)
+        search_entry.pack(side=tk.LEFT, padx=(2, 8))
+        search_entry.bind("<Return>", lambda e: self.apply_data_filters())
+        self.filter_widgets["search"] = search_entry
+        ttk.Button(filter_frame, text="Clear", command=self.clear_data_filters).pack(side=tk.RIGHT)
+        ttk.Button(filter_frame, text="Apply", command=self.apply_data_filters).pack(side=tk.RIGHT, padx=(0, 5))
+
+    def load_filter_choices(self):
+        """Fills the filter drop-downs from the database on a background thread."""
+        def fetch():
+            try:
+                choices = {key: [""] + database.get_distinct_values(col)
+                           for key, col in (("brand", "Brand"), ("availability", "Availability"), ("segment", "Segment"))}
+            except Exception:
+                return
+            self.master.after(0, lambda: [self.filter_widgets[key].config(values=values) for key, values in choices.items()])
+        threading.Thread(target=fetch, daemon=True).start()
+
+    def apply_data_filters(self):
+        filters = {key: widget.get().strip() for key, widget in self.filter_widgets.items()}
+        for key in ("min_price", "max_price"):
+            if filters[key]:
+                try:
+                    float(filters[key])
+                except ValueError:
+                    messagebox.showwarning("Warning", "Prices must be numbers.")
+                    return
+        self.data_view['filters'] = {key: value for key, value in filters.items() if value}
+        self.data_view['offset'] = 0
+        self.schedule_data_fetch(recount=True)
+
+    def clear_data_filters(self):
+        for widget in self.filter_widgets.values():
+            if isinstance(widget, ttk.Combobox):
+                widget.set("")
+            else:
+                widget.delete(0, tk.END)
+        self.apply_data_filters()
 
     # ... (rest of the methods are the same as before)
     def export_data(self):
-        products = database.get_all_products()
-        if not products:
+        if not database.count_products():
             messagebox.showinfo("Export Data", "There is no data in the database to export.")
             return
-        json_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")], title="Save JSON As")
+        targets = {}
+        json_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json"), ("JSON Lines files", "*.jsonl")], title="Save JSON As")
         if json_path:
-            if file_exporter.write_to_json(products, json_path):
-                messagebox.showinfo("Success", f"Data successfully exported to {json_path}")
-            else:
-                messagebox.showerror("Error", f"Failed to export data to {json_path}")
-        csv_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")], title="Save CSV As")
+            targets['jsonl' if json_path.endswith('.jsonl') else 'json'] = json_path
+        csv_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv"), ("Parquet files", "*.parquet")], title="Save CSV As")
         if csv_path:
-            if file_exporter.write_to_csv(products, csv_path):
-                messagebox.showinfo("Success", f"Data successfully exported to {csv_path}")
+            targets['parquet' if csv_path.endswith('.parquet') else 'csv'] = csv_path
+        if not targets:
+            return
+        self.export_button.config(state=tk.DISABLED, text="Exporting...")
+        # Both files are written from a single streamed pass over the database, off the Tk thread
+        thread = threading.Thread(target=self.run_export, args=(targets,), daemon=True)
+        thread.start()
+
+    def run_export(self, targets):
+        try:
+            file_exporter.export_database(targets)
+            error = None
+        except Exception as e:
+            error = e
+
+        def update_gui():
+            self.export_button.config(state=tk.NORMAL, text="Export Data")
+            paths = ", ".join(targets.values())
+            if error is None:
+                messagebox.showinfo("Success", f"Data successfully exported to {paths}")
             else:
-                messagebox.showerror("Error", f"Failed to export data to {csv_path}")
+                messagebox.showerror("Error", f"Failed to export data to {paths}\n{error}")
+
+        self.master.after(0, update_gui)
 
     def sort_treeview(self, col, reverse, tree):
-        data = [(tree.set(child, col), child) for child in tree.get_children('')]
-        data.sort(reverse=reverse)
-        for index, (val, child) in enumerate(data):
-            tree.move(child, '', index)
+        self.data_view['order_by'] = col
+        self.data_view['descending'] = reverse
+        self.data_view['offset'] = 0
         tree.heading(col, command=lambda: self.sort_treeview(col, not reverse, tree))
+        self.schedule_data_fetch()
 
     def refresh_data_view(self):
-        for item in self.data_tree.get_children():
-            self.data_tree.delete(item)
+        self.data_view['offset'] = 0
+        self.load_filter_choices()
+        self.schedule_data_fetch(recount=True)
+
+    def on_data_tree_resize(self, event):
+        rowheight = ttk.Style().lookup("Treeview", "rowheight") or 20
+        rows = max(1, (event.height - 25) // int(rowheight))
+        if rows != self.data_view['rows']:
+            self.data_view['rows'] = rows
+            self.schedule_data_fetch()
+
+    def on_data_scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            total = self.data_view['total']
+            self.set_data_offset(int(float(amount) * total))
+        else:
+            self.scroll_data_view(int(amount), unit)
+
+    def scroll_data_view(self, amount, unit):
+        step = self.data_view['rows'] if unit == 'pages' else 3
+        self.set_data_offset(self.data_view['offset'] + amount * step)
+
+    def set_data_offset(self, offset):
+        offset = max(0, min(offset, self.data_view['total'] - self.data_view['rows']))
+        if offset != self.data_view['offset']:
+            self.data_view['offset'] = offset
+            self.schedule_data_fetch()
+
+    def schedule_data_fetch(self, recount=False):
+        """Coalesces scroll/resize events and loads the visible window on a background thread."""
+        if self.data_view_pending is not None:
+            self.master.after_cancel(self.data_view_pending)
+        self.data_view_pending = self.master.after(30, self.start_data_fetch, recount)
+
+    def start_data_fetch(self, recount=False):
+        self.data_view_pending = None
+        self.data_view_request += 1
+        request_id = self.data_view_request
+        view = dict(self.data_view)
+        # The variant's "Row ID" comes last and becomes the tree item id
+        columns = list(self.data_tree['columns']) + ["Row ID"]
+        thread = threading.Thread(target=self.fetch_data_window, args=(request_id, view, columns, recount), daemon=True)
+        thread.start()
+
+    def fetch_data_window(self, request_id, view, columns, recount):
         try:
-            products = database.get_all_products()
-            for product in products:
-                row_values = [product.get(col, "") for col in self.data_tree['columns']]
-                self.data_tree.insert("", tk.END, values=row_values)
+            filters = view['filters']
+            total = database.count_products(filters) if recount or not view['total'] else view['total']
+            offset = max(0, min(view['offset'], total - view['rows']))
+            rows = database.get_products_window(columns, offset, view['rows'], view['order_by'], view['descending'], filters)
         except Exception as e:
-            messagebox.showerror("Database Error", f"Could not fetch data from the database.\n{e}")
+            message = f"Could not fetch data from the database.\n{e}"
+            self.master.after(0, lambda: messagebox.showerror("Database Error", message))
+            return
+        self.master.after(0, self.show_data_window, request_id, total, offset, rows)
+
+    def show_data_window(self, request_id, total, offset, rows):
+        if request_id != self.data_view_request:
+            return  # A newer window was requested while this one loaded
+        self.data_view['total'] = total
+        self.data_view['offset'] = offset
+        for item in self.data_tree.get_children():
+            self.data_tree.delete(item)
+        for row in rows:
+            self.data_tree.insert("", tk.END, iid=str(row[-1]), values=["" if value is None else value for value in row[:-1]])
+        if total:
+            self.data_vsb.set(offset / total, min(1.0, (offset + len(rows)) / total))
+            self.data_status.config(text=f"Rows {offset + 1}-{offset + len(rows)} of {total}")
+        else:
+            self.data_vsb.set(0, 1)
+            self.data_status.config(text="No matching products." if self.data_view['filters'] else "No products in the database.")
+
+    def on_data_row_double_click(self, event):
+        """Opens the price and availability history of the variant under the cursor."""
+        row_id = self.data_tree.identify_row(event.y)
+        if not row_id:
+            return
+        product_name = self.data_tree.set(row_id, "Product Name")
+
+        def fetch():
+            try:
+                current = database.get_current_price(int(row_id))
+                history = database.get_price_history(int(row_id))
+            except Exception as e:
+                message = f"Could not load the price history.\n{e}"
+                self.master.after(0, lambda: messagebox.showerror("Database Error", message))
+                return
+            self.master.after(0, self.show_price_history, product_name, current, history)
+
+        threading.Thread(target=fetch, daemon=True).start()
+
+    def show_price_history(self, product_name, current, history):
+        def rupees(paise):
+            return "" if paise is None else f"{paise / 100:.2f}"
+
+        window = tk.Toplevel(self.master)
+        window.title(f"Price History - {product_name}")
+        window.geometry("520x320")
+        if current:
+            summary = f"Current price: {rupees(current['Price Paise']) or 'n/a'} ({current['Availability'] or 'n/a'}) since {current['Since']}"
+            if current['Previous Price Paise'] is not None:
+                summary += f", previously {rupees(current['Previous Price Paise'])}"
+            ttk.Label(window, text=summary).pack(anchor='w', padx=10, pady=(10, 5))
+        columns = ("Observed At", "Price (INR)", "Availability", "In Stock")
+        tree = ttk.Treeview(window, columns=columns, show='headings')
+        for col in columns:
+            tree.heading(col, text=col)
+            tree.column(col, width=120, anchor=tk.W)
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
+        # Newest change first
+        for observed_at, price_paise, availability, in_stock in reversed(history):
+            tree.insert("", tk.END, values=(observed_at, rupees(price_paise), availability or "",
+                                            "" if in_stock is None else ("Yes" if in_stock else "No")))
 
     def load_companies_to_treeview(self):
         for item in self.company_tree.get_children():
@@ -191,7 +416,7 @@ class ScraperGUI(tk.Frame):
         try:
             with open(self.companies_file_path, 'r', newline='', encoding='utf-8') as f:
                 reader = csv.reader(f)
-                header = next(reader)
+                self.company_columns = next(reader)
                 for row in reader:
                     self.company_tree.insert("", tk.END, values=row)
         except FileNotFoundError:
@@ -205,7 +430,7 @@ class ScraperGUI(tk.Frame):
         try:
             with open(self.companies_file_path, 'w', newline='', encoding='utf-8') as f:
                 writer = csv.writer(f)
-                writer.writerow(['name', 'type', 'url'])
+                writer.writerow(self.company_columns)
                 for child in self.company_tree.get_children():
                     writer.writerow(self.company_tree.item(child)['values'])
         except Exception as e:
@@ -216,7 +441,8 @@ class ScraperGUI(tk.Frame):
         scraper_type = self.type_entry.get().strip()
         url = self.url_entry.get().strip()
         if name and scraper_type and url:
-            self.company_tree.insert("", tk.END, values=(name, scraper_type, url))
+            extra_values = [''] * (len(self.company_columns) - 3)
+            self.company_tree.insert("", tk.END, values=[name, scraper_type, url] + extra_values)
             self.save_companies_from_treeview()
             self.name_entry.delete(0, tk.END)
             self.url_entry.delete(0, tk.END)
@@ -232,61 +458,153 @@ class ScraperGUI(tk.Frame):
         else:
             messagebox.showwarning("Warning", "Please select a company to remove.")
 
-    def start_scraper_thread(self):
-        self.run_button.config(state=tk.DISABLED, text="Scraping...")
-        self.output_text.config(state=tk.NORMAL)
-        self.output_text.delete(1.0, tk.END)
-        self.output_text.config(state=tk.DISABLED)
-        thread = threading.Thread(target=self.execute_scraper, daemon=True)
+    def start_scraper_thread(self, resume=False):
+        self.run_button.config(state=tk.DISABLED, text="Resuming..." if resume else "Scraping...")
+        self.resume_button.config(state=tk.DISABLED)
+        self.log.clear()
+        thread = threading.Thread(target=self.execute_scraper, args=(resume,), daemon=True)
         thread.start()
 
-    def execute_scraper(self):
-        python_executable = sys.executable
+    def resume_incomplete(self):
+        """Continues every company whose last crawl was interrupted, failed or crashed."""
         try:
-            with open(self.companies_file_path, 'r', newline='', encoding='utf-8') as f:
-                reader = list(csv.DictReader(f))
-            if not reader:
+            companies = jobs.resumable_companies(crawl_runner.load_companies(self.companies_file_path))
+        except FileNotFoundError:
+            companies = []
+        if not companies:
+            messagebox.showinfo("Resume", "There are no incomplete crawl jobs to resume.")
+            return
+        self.start_scraper_thread(resume=True)
+
+    def execute_scraper(self, resume=False):
+        try:
+            companies = crawl_runner.load_companies(self.companies_file_path)
+            if resume:
+                companies = jobs.resumable_companies(companies)
+            if not companies:
                 raise Exception("companies.csv is empty. Add a company to scrape.")
-            self.master.after(0, lambda: self.progress_bar.config(maximum=len(reader), value=0))
-            self.completed_tasks = 0
-            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                future_to_company = {executor.submit(self.run_spider, company, python_executable): company for company in reader}
-                for future in concurrent.futures.as_completed(future_to_company):
-                    company = future_to_company[future]
-                    try:
-                        future.result()
-                    except Exception as exc:
-                        self.append_to_output(f"Scraper for {company['name']} generated an exception: {exc}\n")
-                    finally:
-                        self.completed_tasks += 1
-                        self.master.after(0, lambda: self.progress_bar.config(value=self.completed_tasks))
+            self.scheduler.ensure_running(self.companies_file_path)
+            with self.requests_lock:
+                queued = self.scheduler.run([c['name'] for c in companies], resume=resume)
+                self.requested_companies = set(queued)
+                self.requested_at = time.time()
+                self.completed_tasks = 0
+            if not queued:
+                raise Exception("The scheduler did not accept any of the companies.")
+            self.master.after(0, lambda: self.progress_bar.config(maximum=len(queued), value=0))
+            self.log.message(f"--- Queued {len(queued)} companies with the scheduler ---\n")
         except FileNotFoundError:
-             self.master.after(0, self.append_to_output, "Error: companies.csv not found.")
+            self.log.message("Error: companies.csv not found.", level='ERROR')
+            self.master.after(0, self.finalize_scraper_run)
         except Exception as e:
-            self.master.after(0, self.append_to_output, f"\n--- An error occurred ---\n{e}\n")
-        finally:
+            self.log.message(f"\n--- An error occurred ---\n{e}\n", level='ERROR')
+            self.master.after(0, self.finalize_scraper_run)
+
+    def follow_scheduler(self):
+        """
+        Follows the scheduler's events for as long as the window is open: crawl output goes to
+        the log, progress events to handle_progress_event(). Scheduled crawls show up too.
+        """
+        seq, pid = None, None
+        while True:
+            checked_at = time.time()
+            try:
+                # The status is taken before the events, so a company it no longer lists has
+                # already reported how it ended in the events that follow
+                status = self.scheduler.status()
+                if seq is None or status['pid'] != pid:
+                    # Start from now rather than replaying the scheduler's whole buffer
+                    seq, pid = status['seq'], status['pid']
+                response = self.scheduler.events(seq)
+            except (OSError, ValueError):
+                seq = None
+                self.fail_requested("the scheduler stopped responding", checked_at)
+                self.master.after(0, lambda: self.scheduler_status.config(text="Scheduler: not running"))
+                time.sleep(2)
+                continue
+            seq = response['seq']
+            for event in response['events']:
+                if event.get('event') == 'log':
+                    self.log.put(event['line'])
+                else:
+                    self.handle_progress_event(event)
+            pending = {c['name'] for c in status['companies'] if c['running'] or c.get('queued')}
+            self.fail_requested("the scheduler no longer runs or queues it", checked_at, keep=pending)
+            self.show_scheduler_status(status)
+            time.sleep(0.5)
+
+    def fail_requested(self, reason, checked_at, keep=()):
+        """
+        Counts the companies of this window's run that the scheduler has lost (it crashed or
+        restarted) as failed, except those in `keep`, so the run can finish. `checked_at` is
+        when the scheduler was asked; a run it accepted later is left alone.
+        """
+        with self.requests_lock:
+            if checked_at < self.requested_at:
+                return
+            lost = self.requested_companies - set(keep)
+            if not lost:
+                return
+            self.requested_companies -= lost
+            done = not self.requested_companies
+        for name in sorted(lost):
+            self.log.message(f"Scraper for {name} failed: {reason}\n\n", company=name, level='ERROR')
+        if done:
             self.master.after(0, self.finalize_scraper_run)
 
-    def run_spider(self, company_info, python_executable):
-        name = company_info['name']
-        scraper_type = company_info['type']
-        url = company_info['url']
-        self.append_to_output(f"--- Starting scraper for: {name} ---\n")
-        command = [python_executable, '-m', 'scrapy', 'crawl', 'product_spider', '-a', f'name={name}', '-a', f'type={scraper_type}', '-a', f'url={url}']
-        process = subprocess.Popen(command, cwd=self.project_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, encoding='utf-8')
-        for line in iter(process.stdout.readline, ''):
-            self.master.after(0, self.append_to_output, line)
-        process.wait()
-        self.append_to_output(f"--- Finished scraper for: {name} ---\n\n")
-
-    def append_to_output(self, text):
-        self.output_text.config(state=tk.NORMAL)
-        self.output_text.insert(tk.END, text)
-        self.output_text.see(tk.END)
-        self.output_text.config(state=tk.DISABLED)
+    def show_scheduler_status(self, status):
+        waiting = [c for c in status['companies'] if not c['running'] and c['next_due']]
+        text = f"Scheduler: {len(status['running'])} of {status['max_concurrent']} crawl slots in use"
+        if waiting:
+            upcoming = min(waiting, key=lambda c: c['next_due'])
+            text += f", next: {upcoming['name']} at {time.strftime('%H:%M', time.localtime(upcoming['next_due']))}"
+        self.master.after(0, lambda: self.scheduler_status.config(text=text))
+
+    def on_close(self):
+        """Closes the window; crawls already running or scheduled carry on in the scheduler."""
+        self.log.close_files()
+        self.master.destroy()
+
+    def handle_progress_event(self, event):
+        kind = event.get('event')
+        if kind == 'company_started':
+            resumed = " (resuming)" if event.get('resumed') else ""
+            self.log.message(f"--- Starting scraper for: {event['company']}{resumed} ---\n", company=event['company'])
+        elif kind in ('company_finished', 'company_failed'):
+            if kind == 'company_finished':
+                self.log.message(f"--- Finished scraper for: {event['company']} ({event.get('items', 0)} items) ---\n\n",
+                                 company=event['company'])
+            else:
+                self.log.message(f"Scraper for {event['company']} failed: {event.get('reason')}\n\n",
+                                 company=event['company'], level='ERROR')
+            with self.requests_lock:
+                if event['company'] not in self.requested_companies:
+                    return
+                self.requested_companies.discard(event['company'])
+                if kind == 'company_finished':
+                    self.completed_tasks += 1
+                completed, done = self.completed_tasks, not self.requested_companies
+            self.master.after(0, lambda: self.progress_bar.config(value=completed))
+            if done:
+                self.master.after(0, self.finalize_scraper_run)
+        elif kind == 'enrichment_finished':
+            self.log.message(f"--- Enriched {event.get('variants', 0)} changed rows "
+                             f"({event.get('products_reclassified', 0)} products reclassified) ---\n")
+        elif kind == 'matching_finished':
+            self.log.message(f"--- Matched {event.get('changed', 0)} changed products into "
+                             f"{event.get('clusters', 0)} clusters ---\n")
+
+    def refresh_log_company_choices(self):
+        self.log_company_filter.config(values=["All companies"] + self.log.company_names())
+
+    def on_log_filter_change(self, event=None):
+        company = self.log_company_filter.get()
+        self.log.set_filter(self.log_level_filter.get(), None if company == "All companies" else company)
 
     def finalize_scraper_run(self):
+        self.log.close_files()
         self.run_button.config(state=tk.NORMAL, text="Run All Scrapers")
+        self.resume_button.config(state=tk.NORMAL)
         if self.progress_bar['value'] == self.progress_bar['maximum']:
              messagebox.showinfo("Success", "All scrapers have completed their runs!")
         else:
@@ -0,0 +1,111 @@
+import json
+import os
+import re
+import shutil
+import time
+
+JOBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs")
+
+# A job in one of these states did not complete and can be resumed
+RESUMABLE_STATUSES = ('interrupted', 'failed')
+
+
+def job_slug(company_name):
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', company_name or 'crawl').strip('_').lower() or 'crawl'
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except (OSError, SystemError):
+        return False
+    return True
+
+
+class Job:
+    """
+    One company's crawl job, kept in its own directory so an interrupted crawl can resume.
+
+    job.json holds the status (running, finished, interrupted or failed), why the last run
+    ended and the latest checkpoint: the extractor's crawl position and the number of items
+    written when it was taken. scheduler/ is the Scrapy JOBDIR with the pending request
+    queue and the seen-set. A finished job keeps job.json but drops scheduler/, and a
+    fresh (non-resumed) run starts from an empty directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state_file = os.path.join(path, "job.json")
+        self.scheduler_dir = os.path.join(path, "scheduler")
+        self.state = self.load()
+
+    def load(self):
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @classmethod
+    def for_company(cls, company_name, jobs_dir=JOBS_DIR):
+        return cls(os.path.join(jobs_dir, job_slug(company_name)))
+
+    @property
+    def status(self):
+        return self.state.get('status')
+
+    def is_resumable(self):
+        """True if the last run stopped early, or is marked running but its process is gone (a crash)."""
+        if self.status in RESUMABLE_STATUSES:
+            return True
+        return self.status == 'running' and not pid_alive(self.state.get('pid'))
+
+    def save(self, **changes):
+        # The runner and the spider hold separate Job objects for the same directory,
+        # so merge into what is on disk rather than overwrite it
+        self.state = {**self.load(), **changes, 'updated_at': time.time()}
+        os.makedirs(self.path, exist_ok=True)
+        tmp_path = self.state_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_file)
+
+    def start(self, company, resume=False):
+        """Marks the job running. Without `resume` the previous queue and checkpoint are discarded."""
+        if not resume:
+            shutil.rmtree(self.path, ignore_errors=True)
+        started_at = self.state.get('started_at') if resume else time.time()
+        runs = self.state.get('runs', 0) + 1 if resume else 1
+        self.save(
+            status='running',
+            pid=os.getpid(),
+            company=company['name'],
+            type=company['type'],
+            url=company['url'],
+            started_at=started_at,
+            runs=runs,
+            reason=None,
+        )
+
+    def checkpoint(self, position, items_written):
+        self.save(checkpoint=position, items_written=items_written, checkpointed_at=time.time())
+
+    def finish(self, status, reason=None):
+        self.save(status=status, reason=reason, pid=None, finished_at=time.time())
+        if status == 'finished':
+            shutil.rmtree(self.scheduler_dir, ignore_errors=True)
+
+
+def list_jobs(jobs_dir=JOBS_DIR):
+    """Every job with a job.json, sorted by company name."""
+    if not os.path.isdir(jobs_dir):
+        return []
+    jobs = [Job(os.path.join(jobs_dir, name)) for name in sorted(os.listdir(jobs_dir))]
+    return sorted((job for job in jobs if job.state), key=lambda job: job.state.get('company', ''))
+
+
+def resumable_companies(companies, jobs_dir=JOBS_DIR):
+    """The companies whose last crawl was interrupted, failed or crashed."""
+    return [c for c in companies if Job.for_company(c['name'], jobs_dir).is_resumable()]
@@ -0,0 +1,185 @@
+import collections
+import logging
+import logging.handlers
+import os
+import re
+import threading
+
+from jobs import job_slug
+
+LOGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+
+# crawl_runner.LOG_FORMAT: "2026-01-01 12:00:00 [Good Dot] [scrapy.core.engine] INFO: message"
+LOG_LINE_RE = re.compile(r'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d \[(?P<company>.*?)\] \[[^\]]+\] '
+                         r'(?P<level>DEBUG|INFO|WARNING|ERROR|CRITICAL): ')
+
+
+class LogPipeline:
+    """
+    Carries crawl output from the runner's reader thread to the Tk log widget without
+    flooding the event loop.
+
+    put() and message() may be called from any thread. They append the line to a bounded
+    queue for the widget; when the GUI falls behind, the oldest queued lines are dropped,
+    never the newest. Every line is also handed to a writer thread, which appends it to its
+    company's rotating log file in LOGS_DIR (the full, unfiltered log) in batches, so slow
+    disk I/O never holds up the thread reading the crawl output. drain()
+    runs on the Tk thread every `drain_interval_ms`, inserts everything queued in one batch,
+    and keeps only the last `max_lines` lines passing the level and company filters in the
+    widget. Those lines come from a ring buffer, so changing a filter redraws instantly.
+
+    Lines without a log header (tracebacks, stats dumps) belong to the line before them.
+    """
+
+    def __init__(self, master, text_widget, max_lines=5000, queue_size=20000, drain_interval_ms=100,
+                 max_file_bytes=5 * 1024 * 1024, file_backups=3, logs_dir=LOGS_DIR):
+        self.master = master
+        self.text = text_widget
+        self.max_lines = max_lines
+        self.drain_interval_ms = drain_interval_ms
+        self.max_file_bytes = max_file_bytes
+        self.file_backups = file_backups
+        self.logs_dir = logs_dir
+        self.queue = collections.deque(maxlen=queue_size)
+        self.dropped = 0
+        # (company, level, text) of the most recent lines, whether shown or filtered out
+        self.history = collections.deque(maxlen=max_lines)
+        self.companies = set()
+        self.level = 'INFO'
+        self.company = None
+        self.lock = threading.Lock()
+        self.file_loggers = {}
+        # (company, line) pairs not written to their log file yet; never dropped
+        self.file_lines = []
+        self.file_lines_ready = threading.Event()
+        self.closing = False
+        self.file_writer = threading.Thread(target=self.write_files, name='log-files', daemon=True)
+        self.file_writer.start()
+        self.last_company, self.last_level = None, 'INFO'
+        self.master.after(self.drain_interval_ms, self.drain)
+
+    def put(self, line):
+        """Queues one line of runner output, attributed to the company and level in its log header."""
+        match = LOG_LINE_RE.match(line)
+        with self.lock:
+            if match:
+                company = match.group('company')
+                self.last_company = None if company == '-' else company
+                self.last_level = match.group('level')
+            self.enqueue(self.last_company, self.last_level, line)
+
+    def message(self, text, company=None, level='INFO'):
+        """Queues a message of the GUI's own (run progress, errors)."""
+        with self.lock:
+            self.enqueue(company, level, text)
+
+    def enqueue(self, company, level, line):
+        if not line.endswith('\n'):
+            line += '\n'
+        self.file_lines.append((company, line))
+        self.file_lines_ready.set()
+        if company:
+            self.companies.add(company)
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append((company, level, line))
+
+    def write_files(self):
+        """
+        Writer thread: takes every line queued since its last pass and appends them to
+        logs/<company>.log (logs/run.log for lines of no company), one write per file.
+        """
+        while True:
+            self.file_lines_ready.wait()
+            with self.lock:
+                self.file_lines_ready.clear()
+                batch, self.file_lines = self.file_lines, []
+                closing = self.closing
+            by_name = {}
+            for company, line in batch:
+                by_name.setdefault(job_slug(company) if company else 'run', []).append(line)
+            for name, lines in by_name.items():
+                self.file_logger(name).info(''.join(lines))
+            if closing:
+                return
+
+    def file_logger(self, name):
+        file_logger = self.file_loggers.get(name)
+        if file_logger is None:
+            os.makedirs(self.logs_dir, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                os.path.join(self.logs_dir, f"{name}.log"), maxBytes=self.max_file_bytes,
+                backupCount=self.file_backups, encoding='utf-8')
+            handler.terminator = ''
+            file_logger = logging.getLogger(f"scraper_gui.logs.{name}")
+            file_logger.propagate = False
+            file_logger.setLevel(logging.DEBUG)
+            file_logger.handlers = [handler]
+            self.file_loggers[name] = file_logger
+        return file_logger
+
+    def close_files(self):
+        """Writes the lines still queued for the log files, stops the writer thread and closes the files."""
+        with self.lock:
+            self.closing = True
+            self.file_lines_ready.set()
+        self.file_writer.join()
+        for file_logger in self.file_loggers.values():
+            for handler in file_logger.handlers:
+                handler.close()
+            file_logger.handlers = []
+        self.file_loggers = {}
+
+    def company_names(self):
+        """Every company that has logged since the last clear(), for the company filter."""
+        with self.lock:
+            return sorted(self.companies)
+
+    def visible(self, company, level):
+        return (LEVELS.index(level) >= LEVELS.index(self.level)
+                and (self.company is None or company in (self.company, None)))
+
+    def drain(self):
+        """Tk timer: moves every queued line into the ring buffer and the widget in one batch."""
+        with self.lock:
+            batch = list(self.queue)
+            self.queue.clear()
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            batch.insert(0, (None, 'WARNING', f"--- {dropped} log lines skipped in the viewer (see the logs folder) ---\n"))
+        if batch:
+            self.history.extend(batch)
+            self.insert([text for company, level, text in batch if self.visible(company, level)])
+        self.master.after(self.drain_interval_ms, self.drain)
+
+    def insert(self, lines, replace=False):
+        if not lines and not replace:
+            return
+        # Follow the end of the log only if the user has not scrolled up to read something
+        at_end = self.text.yview()[1] >= 0.999
+        self.text.config(state='normal')
+        if replace:
+            self.text.delete('1.0', 'end')
+        self.text.insert('end', ''.join(lines[-self.max_lines:]))
+        excess = int(self.text.index('end-1c').split('.')[0]) - self.max_lines
+        if excess > 0:
+            self.text.delete('1.0', f'{excess + 1}.0')
+        self.text.config(state='disabled')
+        if at_end:
+            self.text.see('end')
+
+    def set_filter(self, level=None, company=None):
+        """Shows lines at `level` or above, from `company` only (None for all); redraws from the ring buffer."""
+        self.level = level or 'INFO'
+        self.company = company
+        self.insert([text for c, lv, text in self.history if self.visible(c, lv)], replace=True)
+
+    def clear(self):
+        with self.lock:
+            self.queue.clear()
+            self.dropped = 0
+            self.companies.clear()
+        self.history.clear()
+        self.insert([], replace=True)
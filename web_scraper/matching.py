@@ -0,0 +1,276 @@
+import argparse
+import collections
+import functools
+import hashlib
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import database
+from enrichment import QUANTITY_RE
+
+# What the matcher knows about a product: its brand, normalized title tokens, canonical
+# ingredient ids and the weight of one unit in grams or millilitres (None if unknown)
+ProductFeatures = collections.namedtuple('ProductFeatures', 'product_id brand tokens ingredients weight')
+
+# Words that say nothing about which product a listing is
+STOPWORDS = frozenset((
+    "a", "an", "and", "the", "of", "with", "in", "for", "by", "to", "new", "best", "premium", "special",
+    "plant", "based", "plantbased", "vegan", "veg", "vegetarian", "meat", "free", "mock", "alternative",
+    "pack", "packs", "combo", "set", "box", "pc", "pcs", "piece", "pieces", "x", "ready", "cook", "eat", "frozen",
+))
+
+# Words in brand names that do not tell brands apart ("Blue Tribe" and "Blue Tribe Foods")
+BRAND_SUFFIXES = frozenset(("foods", "food", "pvt", "private", "ltd", "limited", "llp", "inc", "co", "india"))
+
+# MinHash over a product's title tokens (within its brand) and separately over its ingredients
+# (listings often lack them), each cut into LSH_BANDS bands of LSH_ROWS values. Two products
+# are compared when any band of theirs is identical, which is likely above a Jaccard
+# similarity of about (1 / LSH_BANDS) ** (1 / LSH_ROWS) ~ 0.5.
+LSH_BANDS = 16
+LSH_ROWS = 4
+MINHASH_SEED = 1729
+# Bands shared by more products than this are generic ("chicken nuggets") and are skipped,
+# so one popular title cannot make the comparisons quadratic
+MAX_BUCKET_SIZE = 200
+# Candidates are matched when their weighted similarity reaches MATCH_THRESHOLD and their
+# unit weights, when both are known, differ by at most WEIGHT_TOLERANCE
+MATCH_THRESHOLD = 0.75
+WEIGHT_TOLERANCE = 0.1
+# Listings under different brands (a reseller's, a marketplace's) are the same product only
+# when their ingredient lists agree this closely; many brands sell "Peri Peri Chicken Nuggets"
+CROSS_BRAND_INGREDIENTS = 0.8
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def title_tokens(name, brand=None):
+    """
+    The tokens that identify a product in its title: lowercase words without quantities,
+    stopwords or the brand's own name, "soya" spelled "soy" and plurals made singular.
+    """
+    text = QUANTITY_RE.sub(' ', (name or '').lower())
+    brand_words = set(re.findall(r'[a-z0-9]+', (brand or '').lower()))
+    tokens = set()
+    for word in re.findall(r'[a-z]+', text.replace('soya', 'soy')):
+        if word in STOPWORDS or word in brand_words:
+            continue
+        if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        tokens.add(word)
+    return frozenset(tokens)
+
+
+@functools.lru_cache(maxsize=4096)
+def brand_key(brand):
+    """A brand name without case, punctuation or company suffixes."""
+    words = re.findall(r'[a-z0-9]+', (brand or '').lower())
+    return ' '.join(word for word in words if word not in BRAND_SUFFIXES) or None
+
+
+def features_hash(features):
+    """A fingerprint of everything the matcher looks at, to find products that changed since the last run."""
+    key = repr((features.brand, sorted(features.tokens), sorted(features.ingredients), features.weight,
+                MATCH_THRESHOLD, WEIGHT_TOLERANCE, CROSS_BRAND_INGREDIENTS, LSH_BANDS, LSH_ROWS))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+class MinHasher:
+    """
+    MinHash signatures with LSH_BANDS * LSH_ROWS universal hash functions. Each distinct
+    token is hashed by every function once and cached, so a signature is the elementwise
+    minimum of its tokens' cached rows, and the band keys of each distinct shingle set are
+    computed once (listings repeat titles and ingredient lists). Signatures are the same in
+    every process.
+    """
+
+    def __init__(self, bands=LSH_BANDS, rows=LSH_ROWS, seed=MINHASH_SEED):
+        self.bands = bands
+        self.rows = rows
+        rng = random.Random(seed)
+        self.coefficients = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+                             for _ in range(bands * rows)]
+        self.token_rows = {}
+        self.key_cache = {}
+
+    def token_row(self, token):
+        row = self.token_rows.get(token)
+        if row is None:
+            value = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+            row = self.token_rows[token] = tuple((a * value + b) % _MERSENNE_PRIME for a, b in self.coefficients)
+        return row
+
+    def signature(self, shingles):
+        return tuple(map(min, zip(*(self.token_row(shingle) for shingle in shingles))))
+
+    def band_keys(self, shingles, kind=''):
+        """(kind, band, bucket) keys of a shingle set; an empty set has none."""
+        if not shingles:
+            return []
+        cache_key = (kind, shingles)
+        keys = self.key_cache.get(cache_key)
+        if keys is None:
+            signature = self.signature(shingles)
+            keys = self.key_cache[cache_key] = [(kind, band, hash(signature[band * self.rows:(band + 1) * self.rows]))
+                                                for band in range(self.bands)]
+        return keys
+
+    def product_keys(self, features):
+        return (self.band_keys(features.tokens, ('t', brand_key(features.brand)))
+                + self.band_keys(frozenset(f"i:{ingredient}" for ingredient in features.ingredients), ('i',)))
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def similarity(a, b):
+    """
+    How likely two listings are the same product, from 0 to 1: title tokens weigh 0.6,
+    ingredients 0.3 (when both lists are known, otherwise the title weighs 0.85) and the
+    brand 0.1 (0.15). Listings whose unit weights differ are never the same product, nor are
+    listings of different brands without closely matching ingredients.
+    """
+    if a.weight and b.weight and abs(a.weight - b.weight) > WEIGHT_TOLERANCE * max(a.weight, b.weight):
+        return 0.0
+    brand = brand_key(a.brand)
+    same_brand = 1.0 if brand and brand == brand_key(b.brand) else 0.0
+    ingredients = jaccard(a.ingredients, b.ingredients) if a.ingredients and b.ingredients else None
+    if not same_brand and (ingredients or 0.0) < CROSS_BRAND_INGREDIENTS:
+        return 0.0
+    titles = jaccard(a.tokens, b.tokens)
+    if ingredients is not None:
+        return 0.6 * titles + 0.3 * ingredients + 0.1 * same_brand
+    return 0.85 * titles + 0.15 * same_brand
+
+
+class UnionFind:
+    """Disjoint sets of product ids; every set is labelled by its smallest id."""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        parent = self.parent.setdefault(item, item)
+        if parent != item:
+            parent = self.parent[item] = self.find(parent)
+        return parent
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def cluster_products(features, clusters=None, changed=None):
+    """
+    Groups listings of the same product. `features` maps product id -> ProductFeatures.
+    Incrementally, `clusters` holds the cluster id of every product from the last run and
+    `changed` the ids whose features changed since: only pairs involving a changed product
+    are compared, changed products leave their old clusters, and everything else keeps its
+    cluster unless a changed product joins two. Returns ({product id: cluster id}, stats).
+    """
+    started = time.perf_counter()
+    clusters = clusters or {}
+    changed = set(features) if changed is None else set(changed) & set(features)
+    hasher = MinHasher()
+    buckets = collections.defaultdict(list)
+    keys = {}
+    for product_id, product in features.items():
+        keys[product_id] = hasher.product_keys(product)
+        for key in keys[product_id]:
+            buckets[key].append(product_id)
+    indexed = time.perf_counter()
+
+    sets = UnionFind()
+    by_old_cluster = collections.defaultdict(list)
+    for product_id in features:
+        sets.find(product_id)
+        if product_id not in changed and clusters.get(product_id) is not None:
+            by_old_cluster[clusters[product_id]].append(product_id)
+    for members in by_old_cluster.values():
+        for member in members[1:]:
+            sets.union(members[0], member)
+
+    compared = matched = oversized = 0
+    for product_id in changed:
+        product = features[product_id]
+        candidates = set()
+        for key in keys[product_id]:
+            members = buckets[key]
+            if len(members) > MAX_BUCKET_SIZE:
+                oversized += 1
+                continue
+            candidates.update(members)
+        for other_id in candidates:
+            # Each pair of changed products is compared once, from its smaller id
+            if other_id == product_id or (other_id in changed and other_id < product_id):
+                continue
+            compared += 1
+            if similarity(product, features[other_id]) >= MATCH_THRESHOLD:
+                matched += 1
+                sets.union(product_id, other_id)
+    labels = {product_id: sets.find(product_id) for product_id in features}
+    stats = {
+        'products': len(features),
+        'changed': len(changed),
+        'pairs_compared': compared,
+        'pairs_matched': matched,
+        'oversized_buckets_skipped': oversized,
+        'clusters': len(set(labels.values())),
+        'index_seconds': round(indexed - started, 3),
+        'match_seconds': round(time.perf_counter() - indexed, 3),
+    }
+    return labels, stats
+
+
+def load_features():
+    """Reads every stored product's features; returns ({id: ProductFeatures}, {id: cluster id}, {id: match hash})."""
+    features, clusters, hashes = {}, {}, {}
+    for product_id, brand, name, ingredient_ids, weight, cluster_id, match_hash in database.iter_match_features():
+        ingredients = frozenset(int(i) for i in ingredient_ids.split(',')) if ingredient_ids else frozenset()
+        features[product_id] = ProductFeatures(product_id, brand, title_tokens(name, brand), ingredients,
+                                               round(weight, 1) if weight else None)
+        clusters[product_id] = cluster_id
+        hashes[product_id] = match_hash
+    return features, clusters, hashes
+
+
+def update_clusters(full=False):
+    """
+    Brings catalog_products.cluster_id up to date: products added or changed since the last run
+    are matched against every stored product, or all products with `full` (which also splits
+    clusters whose products no longer match). Returns the cluster_products() stats plus 'updated'
+    and 'elapsed'.
+    """
+    started = time.monotonic()
+    features, clusters, stored_hashes = load_features()
+    hashes = {product_id: features_hash(product) for product_id, product in features.items()}
+    changed = None if full else {product_id for product_id, value in hashes.items() if stored_hashes[product_id] != value}
+    labels, stats = cluster_products(features, None if full else clusters, changed)
+    updates = [(labels[product_id], hashes[product_id], product_id) for product_id in features
+               if labels[product_id] != clusters[product_id] or hashes[product_id] != stored_hashes[product_id]]
+    database.save_clusters(updates)
+    stats.update(updated=len(updates), elapsed=round(time.monotonic() - started, 3))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Group listings of the same product across brands and sites "
+                                     "into clusters (catalog_products.cluster_id, product_clusters view).")
+    parser.add_argument('--full', action='store_true', help="Re-match every product and rebuild all clusters.")
+    args = parser.parse_args(argv)
+    database.migrate()
+    stats = update_clusters(full=args.full)
+    print(f"Matched {stats['changed']} of {stats['products']} products ({stats['pairs_compared']} pairs compared, "
+          f"{stats['pairs_matched']} matched) into {stats['clusters']} clusters in {stats['elapsed']:.2f}s.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
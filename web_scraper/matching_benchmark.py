@@ -0,0 +1,131 @@
+import argparse
+import os
+import random
+import sys
+import time
+from math import comb
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import matching
+
+FLAVOURS = ["peri peri", "tandoori", "smoky", "classic", "spicy", "garlic", "lemon pepper", "chilli", "herb",
+            "barbecue", "malai", "achari", "schezwan", "butter", "hariyali", "kolhapuri", "pudina", "cheesy",
+            "masaledar", "teriyaki", "cajun", "mughlai", "chettinad", "afghani", "mexican", "korean", "thai",
+            "italian", "jalapeno", "honey chilli"]
+ANIMALS = ["chicken", "mutton", "fish", "prawn", "egg", "keema", "pork", "beef", "seafood", "turkey"]
+FORMATS = ["nuggets", "seekh kebab", "burger patty", "sausages", "chunks", "strips", "shawarma", "momos",
+           "tikka", "mince", "popcorn", "fingers", "cutlets", "salami", "meatballs", "wings", "biryani", "curry"]
+MARKETING = ["plant based", "vegan", "100% veg", "new", "premium", "ready to cook", "frozen", "high protein"]
+INGREDIENTS = list(range(1, 121))
+WEIGHTS = [150, 200, 250, 300, 350, 400, 450, 500, 1000]
+SYLLABLES = ["ve", "zo", "ra", "ki", "lo", "ta", "mi", "nu", "sha", "bo", "gri", "pla", "tri", "be", "vo", "da"]
+
+
+def make_listings(count, seed=42):
+    """
+    Builds synthetic listings: products of many brands, each listed one to four times (on its
+    own site, by resellers and on marketplaces) with reworded titles, brand spellings and
+    stated weights.
+    Returns ({product id: ProductFeatures}, {product id: true product}).
+    """
+    rng = random.Random(seed)
+    brands = sorted({''.join(rng.choices(SYLLABLES, k=4)).title() for _ in range(max(10, count // 200))})
+    resellers = [f"{name} Mart" for name in rng.sample(brands, 20)]
+    features, truth = {}, {}
+    product_id = base = 0
+    while product_id < count:
+        base += 1
+        brand = rng.choice(brands)
+        words = [rng.choice(FLAVOURS), rng.choice(ANIMALS), rng.choice(FORMATS)]
+        ingredients = rng.sample(INGREDIENTS, rng.randint(5, 12))
+        weight = rng.choice(WEIGHTS)
+        for _ in range(min(rng.choice((1, 1, 2, 2, 3, 4)), count - product_id)):
+            product_id += 1
+            title = words[:]
+            if rng.random() < 0.5:
+                title.insert(rng.randrange(len(title) + 1), rng.choice(MARKETING))
+            if rng.random() < 0.5:
+                title.append(f"{weight}g" if rng.random() < 0.5 else f"({weight / 1000:g} kg)")
+            listing_brand = rng.choice((brand, brand, f"{brand} Foods", rng.choice(resellers)))
+            if listing_brand in resellers:
+                title.insert(0, brand)
+            listed_ingredients = ingredients if rng.random() < 0.6 else ingredients[:-1]
+            known_ingredients = frozenset(listed_ingredients) if rng.random() < 0.8 else frozenset()
+            features[product_id] = matching.ProductFeatures(
+                product_id, listing_brand, matching.title_tokens(' '.join(title).title(), listing_brand),
+                known_ingredients, weight if rng.random() < 0.9 else None)
+            truth[product_id] = base
+    return features, truth
+
+
+def pair_scores(labels, truth):
+    """Pairwise precision and recall of `labels` against the true products."""
+    def pairs(groups):
+        return sum(comb(size, 2) for size in groups.values())
+
+    def sizes(keys):
+        groups = {}
+        for key in keys:
+            groups[key] = groups.get(key, 0) + 1
+        return groups
+
+    predicted = pairs(sizes(labels.values()))
+    actual = pairs(sizes(truth.values()))
+    correct = pairs(sizes((labels[i], truth[i]) for i in labels))
+    return (correct / predicted if predicted else 1.0), (correct / actual if actual else 1.0)
+
+
+def brute_force(features):
+    """Compares every pair; only feasible for small inputs, to check what the LSH blocking misses."""
+    sets = matching.UnionFind()
+    ids = sorted(features)
+    for i, a in enumerate(ids):
+        sets.find(a)
+        for b in ids[i + 1:]:
+            if matching.similarity(features[a], features[b]) >= matching.MATCH_THRESHOLD:
+                sets.union(a, b)
+    return {product_id: sets.find(product_id) for product_id in ids}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure product matching speed and accuracy on synthetic listings.")
+    parser.add_argument('--listings', type=int, default=100000)
+    parser.add_argument('--changed', type=float, default=0.01, help="Share of listings changed for the incremental run.")
+    parser.add_argument('--brute-force', type=int, default=2000, metavar='N',
+                        help="Also compare every pair of the first N listings (0 to skip).")
+    args = parser.parse_args(argv)
+
+    features, truth = make_listings(args.listings)
+
+    started = time.perf_counter()
+    labels, stats = matching.cluster_products(features)
+    elapsed = time.perf_counter() - started
+    precision, recall = pair_scores(labels, truth)
+    print(f"full        : {len(features) / elapsed:10.1f} listings/sec ({elapsed:.2f}s), "
+          f"{stats['pairs_compared']} pairs compared, {stats['clusters']} clusters, "
+          f"precision {precision:.3f}, recall {recall:.3f}")
+
+    changed = set(random.Random(7).sample(sorted(features), int(len(features) * args.changed)))
+    started = time.perf_counter()
+    labels, stats = matching.cluster_products(features, labels, changed)
+    elapsed = time.perf_counter() - started
+    precision, recall = pair_scores(labels, truth)
+    print(f"incremental : {len(changed)} changed in {elapsed:.2f}s, {stats['pairs_compared']} pairs compared, "
+          f"precision {precision:.3f}, recall {recall:.3f}")
+
+    if args.brute_force:
+        sample = {product_id: features[product_id] for product_id in sorted(features)[:args.brute_force]}
+        sample_truth = {product_id: truth[product_id] for product_id in sample}
+        started = time.perf_counter()
+        exact = brute_force(sample)
+        elapsed = time.perf_counter() - started
+        labels, stats = matching.cluster_products(sample)
+        precision, recall = pair_scores(exact, sample_truth)
+        print(f"brute force : {len(sample)} listings in {elapsed:.2f}s, {comb(len(sample), 2)} pairs compared, "
+              f"precision {precision:.3f}, recall {recall:.3f}")
+        _, lsh_recall = pair_scores(labels, exact)
+        print(f"LSH finds {lsh_recall:.1%} of the brute-force matches with {stats['pairs_compared']} comparisons")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,46 +1,302 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
 import requests
+from requests.adapters import HTTPAdapter
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_FILE = os.path.join(BASE_DIR, "platform_cache.json")
+# Detections are reused for a week; pass refresh=True (or --refresh) to re-check sooner
+CACHE_TTL = 7 * 24 * 3600
+# At most this much of a page body is read when looking for markers
+MAX_BODY_BYTES = 64 * 1024
+TIMEOUT = 10
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+# Cheapest signals first: response header names (by prefix) and cookie names
+HEADER_FINGERPRINTS = {
+    'shopify': ('x-shopify', 'x-shopid', 'x-sorting-hat'),
+    'magento': ('x-magento',),
+    'bigcommerce': ('x-bc-',),
+}
+COOKIE_FINGERPRINTS = {
+    'shopify': ('_shopify_', 'cart_sig'),
+    'woocommerce': ('woocommerce_', 'wp_woocommerce_session'),
+    'magento': ('mage-', 'x-magento-vary'),
+    'bigcommerce': ('shop_session_token', 'fornax_anonymousid'),
+}
+# Lower-case substrings looked for in the first MAX_BODY_BYTES of the homepage
+BODY_MARKERS = {
+    'shopify': ('cdn.shopify.com', 'shopify.theme', 'shopify-section'),
+    'woocommerce': ('wp-content/plugins/woocommerce', 'woocommerce-page', 'wc-block'),
+    'magento': ('text/x-magento-init', 'data-mage-init', 'mage/cookies'),
+    'bigcommerce': ('cdn11.bigcommerce.com', 'bigcommerce.com/s-', 'bcdata'),
+}
+
+
+class PlatformCache:
+    """
+    Detection results stored in a JSON file as {url: {platform, signal, detected_at}}.
+    Entries older than `ttl` seconds are ignored; errors are never cached.
+    """
+
+    def __init__(self, path=CACHE_FILE, ttl=CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, url):
+        with self.lock:
+            entry = self.entries.get(url)
+        if entry and time.time() - entry.get('detected_at', 0) < self.ttl:
+            return entry
+        return None
+
+    def put(self, url, platform, signal):
+        with self.lock:
+            self.entries[url] = {'platform': platform, 'signal': signal, 'detected_at': time.time()}
+
+    def save(self):
+        with self.lock:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+
+
+def normalize_url(url):
+    url = url.strip().rstrip('/')
+    if not url.startswith('http'):
+        url = 'https://' + url
+    return url
+
+
+def make_session(pool_size):
+    """A requests session whose connection pool holds one connection per concurrent detection."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['User-Agent'] = USER_AGENT
+    return session
+
+
+def platform_from_headers(headers):
+    """Returns (platform, signal) from response headers and cookies, or (None, None)."""
+    names = [name.lower() for name in headers]
+    for platform, prefixes in HEADER_FINGERPRINTS.items():
+        for name in names:
+            if name.startswith(prefixes):
+                return platform, f"header {name}"
+    if 'shopify' in headers.get('powered-by', '').lower():
+        return 'shopify', "header powered-by"
+    cookies = headers.get('set-cookie', '').lower()
+    for platform, cookie_names in COOKIE_FINGERPRINTS.items():
+        for name in cookie_names:
+            if name in cookies:
+                return platform, f"cookie {name}"
+    return None, None
+
+
+def platform_from_body(text):
+    text = text.lower()
+    for platform, markers in BODY_MARKERS.items():
+        for marker in markers:
+            if marker in text:
+                return platform, f"body {marker}"
+    return None, None
+
+
+def read_prefix(response, max_bytes):
+    """Reads at most `max_bytes` of a streamed response's (decoded) body, then closes it."""
+    data = b''
+    try:
+        for chunk in response.iter_content(8192):
+            data += chunk
+            if len(data) >= max_bytes:
+                break
+    finally:
+        response.close()
+    return data[:max_bytes].decode(response.encoding or 'utf-8', errors='replace')
+
 
-def detect_platform(url):
+class _Prober:
+    """Issues the requests for one URL and remembers whether any of them reached the server."""
+
+    def __init__(self, session):
+        self.session = session
+        self.reached = False
+        self.last_error = None
+
+    def request(self, method, url, **kwargs):
+        try:
+            response = self.session.request(method, url, timeout=TIMEOUT, allow_redirects=True, **kwargs)
+        except requests.exceptions.RequestException as e:
+            self.last_error = e
+            return None
+        self.reached = True
+        return response
+
+
+def detect_with_session(session, url, max_body_bytes=MAX_BODY_BYTES):
+    """
+    Classifies one site as shopify, woocommerce, magento, bigcommerce, unknown or error,
+    returning (platform, signal). Header-only probes run before any body is read.
+    """
+    base = normalize_url(url)
+    if '.myshopify.com' in base:
+        return 'shopify', "myshopify.com domain"
+    probe = _Prober(session)
+
+    response = probe.request('HEAD', base)
+    if response is not None:
+        platform, signal = platform_from_headers(response.headers)
+        if platform:
+            return platform, signal
+        # Probe the shop's endpoints on the host the homepage redirected to
+        final = urlparse(response.url)
+        if final.scheme and final.netloc:
+            base = f"{final.scheme}://{final.netloc}"
+
+    response = probe.request('HEAD', base + '/products.json')
+    if response is not None and response.status_code == 200 and 'json' in response.headers.get('content-type', ''):
+        return 'shopify', "/products.json"
+
+    response = probe.request('GET', base + '/wp-json/', stream=True)
+    if response is not None:
+        if response.status_code == 200:
+            # The namespaces list comes first in the REST index, so the prefix is enough
+            index = read_prefix(response, max_body_bytes)
+            if '"wc/' in index:
+                return 'woocommerce', "/wp-json wc namespace"
+        else:
+            response.close()
+
+    response = probe.request('GET', base, stream=True)
+    if response is not None:
+        platform, signal = platform_from_headers(response.headers)
+        if platform:
+            response.close()
+            return platform, signal
+        platform, signal = platform_from_body(read_prefix(response, max_body_bytes))
+        if platform:
+            return platform, signal
+
+    if not probe.reached:
+        print(f"Could not fetch URL {base}: {probe.last_error}")
+        return 'error', str(probe.last_error)
+    return 'unknown', None
+
+
+async def detect_platforms_async(urls, concurrency=8, max_body_bytes=MAX_BODY_BYTES,
+                                 cache=None, refresh=False):
+    """
+    Detects the platform of many URLs in parallel, at most `concurrency` at a time over one
+    pooled session. Cached results younger than the cache's TTL are returned without a request.
+
+    Returns:
+        dict: {url: (platform, signal)} for every URL given.
+    """
+    cache = cache if cache is not None else PlatformCache()
+    results = {}
+    pending = []
+    for url in dict.fromkeys(urls):
+        entry = None if refresh else cache.get(normalize_url(url))
+        if entry:
+            results[url] = (entry['platform'], entry.get('signal'))
+        else:
+            pending.append(url)
+    if pending:
+        loop = asyncio.get_running_loop()
+        workers = max(1, min(concurrency, len(pending)))
+        session = make_session(workers)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                detected = await asyncio.gather(*[
+                    loop.run_in_executor(pool, detect_with_session, session, url, max_body_bytes) for url in pending
+                ])
+        finally:
+            session.close()
+        for url, (platform, signal) in zip(pending, detected):
+            results[url] = (platform, signal)
+            if platform != 'error':
+                cache.put(normalize_url(url), platform, signal)
+        cache.save()
+    return results
+
+
+def detect_platforms(urls, concurrency=8, max_body_bytes=MAX_BODY_BYTES, cache=None, refresh=False):
+    """Blocking wrapper around detect_platforms_async(); returns {url: platform}."""
+    results = asyncio.run(detect_platforms_async(urls, concurrency, max_body_bytes, cache, refresh))
+    return {url: platform for url, (platform, _) in results.items()}
+
+
+def detect_platform(url, refresh=False):
     """
     Analyzes a URL to detect the e-commerce platform.
-    Currently, it only detects Shopify.
 
     Args:
         url (str): The URL of the website to analyze.
+        refresh (bool): Ignore a cached result and detect again.
 
     Returns:
-        str: The name of the platform ('shopify') or 'unknown'.
+        str: 'shopify', 'woocommerce', 'magento', 'bigcommerce', 'unknown' or 'error'.
     """
-    if not url.startswith('http'):
-        url = 'https://' + url
+    return detect_platforms([url], concurrency=1, refresh=refresh)[url]
 
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        content = response.text
 
-        # Simple checks for Shopify fingerprints
-        if 'Shopify' in content or 'cdn.shopify.com' in content or '.myshopify.com' in url:
-            return 'shopify'
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect the e-commerce platform of one or more sites.")
+    parser.add_argument('urls', nargs='*', help="Sites to classify.")
+    parser.add_argument('--companies', metavar='CSV', help="Classify every url in a companies CSV file.")
+    parser.add_argument('--write', action='store_true', help="Fill empty `type` cells in --companies with the detected platform.")
+    parser.add_argument('--concurrency', type=int, default=8, help="Sites checked at once.")
+    parser.add_argument('--max-body-kb', type=int, default=MAX_BODY_BYTES // 1024, help="Body bytes read per page, in KB.")
+    parser.add_argument('--refresh', action='store_true', help="Ignore cached results.")
+    args = parser.parse_args(argv)
+
+    rows, fieldnames = [], None
+    urls = list(args.urls)
+    if args.companies:
+        with open(args.companies, 'r', newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(f)
+            fieldnames = reader.fieldnames
+            rows = list(reader)
+        urls += [row['url'] for row in rows if row.get('url')]
+    if not urls:
+        parser.error("Give at least one URL or --companies.")
 
-        # Future checks for other platforms can be added here
-        # elif 'woocommerce' in content:
-        #     return 'woocommerce'
+    started = time.time()
+    results = asyncio.run(detect_platforms_async(urls, args.concurrency, args.max_body_kb * 1024, refresh=args.refresh))
+    for url, (platform, signal) in results.items():
+        print(f"{url}: {platform}" + (f" ({signal})" if signal and platform != 'error' else ""))
+    print(f"Classified {len(results)} sites in {time.time() - started:.2f}s.")
 
-        return 'unknown'
+    if args.write and rows:
+        filled = 0
+        for row in rows:
+            platform = results.get(row.get('url'), (None, None))[0]
+            if not row.get('type') and platform not in (None, 'unknown', 'error'):
+                row['type'] = platform
+                filled += 1
+        with open(args.companies, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"Filled in the type of {filled} companies.")
 
-    except requests.exceptions.RequestException as e:
-        print(f"Could not fetch URL {url}: {e}")
-        return 'error'
 
 if __name__ == '__main__':
-    # Example usage for testing
-    test_urls = {
-        "Good Dot (Shopify)": "https://gooddot.in",
-        "Blue Tribe (Shopify)": "https://www.bluetribefoods.com",
-        "Google (Unknown)": "https://google.com",
-        "Invalid URL": "https://thissitedoesnotexist12345.com"
-    }
-    for name, url in test_urls.items():
-        platform = detect_platform(url)
-        print(f"The platform for '{name}' ({url}) is: {platform}")
+    main()
@@ -0,0 +1,284 @@
+import asyncio
+import functools
+import hashlib
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # pragma: no cover - lxml ships with Scrapy, BeautifulSoup is the fallback
+    lxml = None
+
+from product_scraper import ingredients
+
+# Bump when the extraction rules change so cached results from older rules are not reused
+EXTRACTOR_VERSION = "4"
+
+BLOCK_TAGS = ('address', 'article', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+              'hr', 'li', 'ol', 'p', 'section', 'table', 'td', 'th', 'tr', 'ul')
+# Stands in for a block boundary until whitespace is collapsed (a private-use character, never in page text)
+BLOCK_BREAK = '\ue000'
+TITLE_WEIGHT_RE = re.compile(r'\((\d+)\s*g\)', re.IGNORECASE)
+
+# body hash -> (ingredients, ingredient count); shared by every spider in the process
+_ingredient_cache = {}
+_new_cache_entries = {}
+_cache_preloaded = False
+
+_process_pool = None
+
+
+def html_to_text(body_html):
+    """
+    Returns the visible text of an HTML fragment with whitespace collapsed and a line break
+    after every block element, so an ingredient list ends where its paragraph does.
+    """
+    if lxml is not None:
+        try:
+            doc = lxml.html.fromstring(body_html)
+            etree.strip_elements(doc, etree.Comment, 'script', 'style', with_tail=False)
+            for element in doc.iter(*BLOCK_TAGS):
+                element.tail = BLOCK_BREAK + (element.tail or '')
+            text = ' '.join(''.join(doc.itertext()).split())
+            return re.sub(rf'\s*{BLOCK_BREAK}[\s{BLOCK_BREAK}]*', '\n', text).strip()
+        except (etree.ParserError, ValueError):
+            pass
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(body_html, 'html.parser').get_text(separator=' ', strip=True)
+
+
+def body_hash(body_html):
+    return hashlib.sha1(f"{EXTRACTOR_VERSION}:{body_html}".encode('utf-8')).hexdigest()
+
+
+def source_version(updated_at):
+    """
+    The sync_state value for a product the source last updated at `updated_at`. It carries
+    EXTRACTOR_VERSION, so incremental crawls re-extract every product once the rules change.
+    """
+    return f"{EXTRACTOR_VERSION}:{updated_at}" if updated_at else None
+
+
+def parse_ingredients_text(text):
+    """The ingredient list in a page's text as stored text (see ingredients.format_ingredients) and its length."""
+    parsed = ingredients.parse_ingredients(text)
+    if not parsed or not parsed[0]:
+        return "", 0
+    ingredient_list, allergens = parsed
+    return ingredients.format_ingredients(ingredient_list, allergens), len(ingredient_list)
+
+
+def extract_ingredients(body_html):
+    if not body_html:
+        return "", 0
+    key = body_hash(body_html)
+    cached = _ingredient_cache.get(key)
+    if cached is not None:
+        return cached
+    result = parse_ingredients_text(html_to_text(body_html))
+    _ingredient_cache[key] = _new_cache_entries[key] = result
+    return result
+
+
+def parse_weight_from_title(title):
+    match = TITLE_WEIGHT_RE.search(title)
+    if match:
+        return int(match.group(1))
+    return 0
+
+
+# Keyword rules of infer_product_details(). A title is scanned once with KEYWORD_RE, a single
+# alternation of every keyword (longest first, so "egg free" wins over "egg"). When several
+# animals are named, the one listed first here wins, so "Egg Chicken Roll" is an egg product.
+ANIMAL_KEYWORDS = {
+    "Egg": ("egg", "eggs"),
+    "Mutton": ("mutton", "unmutton", "lamb", "goat"),
+    "Chicken": ("chicken", "vegicken", "chikn", "chick'n"),
+    "Seafood": ("fish", "prawn", "prawns", "shrimp", "tuna", "crab", "salmon", "seafood"),
+    "Pork": ("pork", "bacon", "ham", "pepperoni"),
+    "Beef": ("beef", "steak"),
+    "Meat": ("meat", "mock meat", "keema", "kheema", "sausage", "sausages", "salami", "mince", "minced",
+             "meatball", "meatballs", "jerky"),
+}
+# Dishes that are usually made of one animal but name none: they only decide the animal when
+# the title names neither an animal nor a non-analogue product ("Paneer Tikka" is neither)
+FORMAT_KEYWORDS = {
+    "Egg": ("bhurji", "omelette", "omelet", "scrambled"),
+    "Meat": ("kebab", "kabab", "seekh", "nugget", "nuggets", "patty", "patties", "burger", "tikka", "shawarma",
+             "kofta", "cutlet", "cutlets", "momos"),
+}
+# Mentions that say the animal is absent; they never classify a title
+NEGATED_KEYWORDS = ("egg free", "eggless", "no egg", "without egg", "meat free", "meatless")
+# Foods that are not meat analogues unless the title also names an animal ("Peri Peri Mayo"
+# is a condiment, "Vegicken Mayo Wrap" is not). Ingredients that flavour analogues as often
+# as not ("masala", "spices", "butter") are not listed.
+NON_ANALOGUE_KEYWORDS = (
+    "sauce", "mayo", "mayonnaise", "dip", "chutney", "seasoning", "spice mix", "spice blend", "masala mix",
+    "masala powder", "peanut butter", "milk", "cheese", "paneer", "ghee", "yogurt", "curd",
+)
+# Listings that are not food at all. These are the only ones the extractors drop while
+# crawling; everything else is stored and classified again by every enrichment pass.
+NON_FOOD_KEYWORDS = (
+    "gift card", "gift box", "voucher", "merchandise", "t shirt", "tshirt", "tote", "mug", "sticker", "hoodie",
+    "cookbook", "subscription", "donation",
+)
+READY_TO_EAT_KEYWORDS = (
+    "ready to eat", "heat and eat", "heat & eat", "heat n eat", "biryani", "curry", "gravy", "meal",
+    "wrap", "sandwich", "roll", "jerky", "chips", "snack", "snacks", "pickle",
+)
+
+
+def _keyword_key(text):
+    return re.sub(r'[\s-]+', ' ', text.lower())
+
+
+def _build_keyword_table():
+    table = {}
+    for rank, (animal, keywords) in enumerate(ANIMAL_KEYWORDS.items()):
+        for keyword in keywords:
+            table.setdefault(keyword, ('animal', rank, animal))
+    for keyword in NEGATED_KEYWORDS:
+        table[keyword] = ('negated', None, None)
+    for keyword in NON_FOOD_KEYWORDS:
+        table.setdefault(keyword, ('non_food', None, None))
+    for keyword in NON_ANALOGUE_KEYWORDS:
+        table.setdefault(keyword, ('non_analogue', None, None))
+    for rank, (animal, keywords) in enumerate(FORMAT_KEYWORDS.items()):
+        for keyword in keywords:
+            table.setdefault(keyword, ('format', rank, animal))
+    for keyword in READY_TO_EAT_KEYWORDS:
+        table.setdefault(keyword, ('ready_to_eat', None, None))
+    return table
+
+
+KEYWORDS = _build_keyword_table()
+# Spaces in a keyword also match hyphens and runs of whitespace ("ready-to-eat", "egg  free")
+KEYWORD_RE = re.compile(r'(?<!\w)(?:{})(?!\w)'.format('|'.join(
+    re.escape(keyword).replace(r'\ ', r'[\s-]+') for keyword in sorted(KEYWORDS, key=len, reverse=True))),
+    re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=65536)
+def infer_product_details(title):
+    """
+    Classifies a product title as (segment, animal product replicated, consumption format).
+    Products that are not meat or egg analogues come back as ("n/a", "n/a", "n/a"); titles
+    naming no animal take the animal of a dish they name ("Bhurji" is egg), else the catalog
+    defaults, PBM and Meat. Results are cached, since the same titles come back on every
+    crawl and in every enrichment pass.
+    """
+    animal_rank, animal, format_rank, format_animal = None, None, None, None
+    non_analogue, consumption_format = False, "RTC"
+    for match in KEYWORD_RE.finditer(title or ''):
+        kind, rank, value = KEYWORDS[_keyword_key(match.group())]
+        if kind == 'animal' and (animal_rank is None or rank < animal_rank):
+            animal_rank, animal = rank, value
+        elif kind == 'format' and (format_rank is None or rank < format_rank):
+            format_rank, format_animal = rank, value
+        elif kind in ('non_analogue', 'non_food'):
+            non_analogue = True
+        elif kind == 'ready_to_eat':
+            consumption_format = "RTE"
+    if animal is None:
+        if non_analogue:
+            return "n/a", "n/a", "n/a"
+        animal = format_animal or "Meat"
+    return ("PBE" if animal == "Egg" else "PBM"), animal, consumption_format
+
+
+@functools.lru_cache(maxsize=65536)
+def is_non_food(title):
+    """Whether a title names merchandise, a gift card or another listing that is not food."""
+    return any(KEYWORDS[_keyword_key(match.group())][0] == 'non_food' for match in KEYWORD_RE.finditer(title or ''))
+
+
+def extract_product_fields(product):
+    """
+    Computes every field that depends only on the Shopify product (not on a variant).
+    Called once per product; the result is shared by all of its variants.
+    """
+    title = product['title']
+    ingredients, ingredient_count = extract_ingredients(product.get('body_html') or '')
+    return {
+        'title_weight': parse_weight_from_title(title),
+        'ingredients_list': ingredients,
+        'ingredient_count': ingredient_count,
+        'last_updated': (product.get('updated_at') or '').split('T')[0],
+    }
+
+
+def extract_products_fields(products):
+    """Runs extract_product_fields over a batch of products; this is the function executed in pool workers."""
+    return [extract_product_fields(product) for product in products]
+
+
+def is_body_cached(body_html):
+    return not body_html or body_hash(body_html) in _ingredient_cache
+
+
+def remember_product_fields(product, fields):
+    """Stores a worker's ingredient result in this process's cache so it is persisted and reused."""
+    body_html = product.get('body_html')
+    if body_html:
+        key = body_hash(body_html)
+        if key not in _ingredient_cache:
+            result = (fields['ingredients_list'], fields['ingredient_count'])
+            _ingredient_cache[key] = _new_cache_entries[key] = result
+
+
+def slim_product(product):
+    """The keys extract_product_fields() reads; only these are sent to pool workers, to keep pickling cheap."""
+    return {'title': product['title'], 'body_html': product.get('body_html'), 'updated_at': product.get('updated_at')}
+
+
+async def extract_in_pool(pool, products, chunk_size):
+    """
+    Parses the HTML of the products whose body is not cached in `pool`, `chunk_size` products
+    per task, and caches the results, so extract_product_fields() only parses titles for them.
+    """
+    pending = [slim_product(p) for p in products if not is_body_cached(p.get('body_html'))]
+    if not pending:
+        return
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    results = await asyncio.gather(*[
+        asyncio.wrap_future(pool.submit(extract_products_fields, chunk)) for chunk in chunks
+    ])
+    for product, fields in zip(pending, [f for chunk in results for f in chunk]):
+        remember_product_fields(product, fields)
+
+
+def get_process_pool(workers):
+    """
+    Returns the process-wide extraction pool. The first caller creates it with `workers`
+    processes; every spider then shares it, at that size, until shutdown_process_pool().
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=workers)
+    return _process_pool
+
+
+def shutdown_process_pool():
+    """Stops the pool's workers. Only call this once no crawl is using the pool (see CrawlRunner.run)."""
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=True)
+    _process_pool = None
+
+
+def preload_ingredient_cache(entries):
+    """Seeds the cache once per process with {body hash: (ingredients, count)} from earlier crawls."""
+    global _cache_preloaded
+    if _cache_preloaded:
+        return
+    for key, value in entries.items():
+        _ingredient_cache.setdefault(key, tuple(value))
+    _cache_preloaded = True
+
+
+def drain_new_cache_entries():
+    """Returns and forgets the cache entries computed since the last call, for persisting."""
+    entries = dict(_new_cache_entries)
+    _new_cache_entries.clear()
+    return entries
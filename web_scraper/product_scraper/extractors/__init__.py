@@ -0,0 +1,76 @@
+"""
+Extractor registry. Each platform is a BaseExtractor subclass, looked up by the `type`
+column of companies.csv. Modules are only imported when a spider asks for their type.
+
+Extractors come from three places, later ones overriding earlier ones:
+  1. BUILTIN_EXTRACTORS below;
+  2. installed packages exposing the `product_scraper.extractors` entry point group
+     (`name = "package.module:Class"`);
+  3. the EXTRACTORS setting, a dict of {type: "package.module:Class"}.
+"""
+import importlib
+import inspect
+from importlib.metadata import entry_points
+
+from product_scraper.extractors.base import BaseExtractor
+
+ENTRY_POINT_GROUP = "product_scraper.extractors"
+
+BUILTIN_EXTRACTORS = {
+    'shopify': 'product_scraper.extractors.shopify:ShopifyExtractor',
+    'woocommerce': 'product_scraper.extractors.woocommerce:WooCommerceExtractor',
+    'magento': 'product_scraper.extractors.magento:MagentoExtractor',
+    'sitemap': 'product_scraper.extractors.sitemap:SitemapExtractor',
+    # BigCommerce has no unauthenticated bulk API; its product pages carry JSON-LD
+    'bigcommerce': 'product_scraper.extractors.sitemap:SitemapExtractor',
+    'trekky': 'product_scraper.extractors.trekky:TrekkyExtractor',
+    'playwright': 'product_scraper.extractors.trekky:PlaywrightExtractor',
+}
+
+_loaded = {}
+
+
+def _entry_points():
+    return {ep.name: ep for ep in entry_points(group=ENTRY_POINT_GROUP)}
+
+
+def _targets(settings=None):
+    targets = dict(BUILTIN_EXTRACTORS)
+    targets.update(_entry_points())
+    if settings is not None:
+        targets.update(settings.getdict('EXTRACTORS'))
+    return targets
+
+
+def _import_target(target):
+    if not isinstance(target, str):
+        return target.load()
+    module_name, _, attr = target.partition(':')
+    if not attr:
+        module_name, _, attr = target.rpartition('.')
+    return getattr(importlib.import_module(module_name), attr)
+
+
+def available_extractors(settings=None):
+    """Returns the sorted scraper type names that have an extractor."""
+    return sorted(_targets(settings))
+
+
+def get_extractor_class(name, settings=None):
+    """
+    Returns the extractor class registered for scraper type `name`, importing its module
+    on first use, or None when no extractor is registered under that name.
+    """
+    target = _targets(settings).get(name)
+    if target is None:
+        return None
+    key = target if isinstance(target, str) else target.value
+    if key not in _loaded:
+        cls = _import_target(target)
+        if not (isinstance(cls, type) and issubclass(cls, BaseExtractor)):
+            raise TypeError(f"Extractor '{name}' ({key}) is not a BaseExtractor subclass.")
+        if inspect.isabstract(cls):
+            missing = ', '.join(sorted(cls.__abstractmethods__))
+            raise TypeError(f"Extractor '{name}' ({key}) does not implement {missing}.")
+        _loaded[key] = cls
+    return _loaded[key]
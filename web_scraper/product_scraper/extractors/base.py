@@ -0,0 +1,238 @@
+import abc
+import contextlib
+
+import scrapy
+
+from product_scraper import extraction, metrics
+from product_scraper.extraction import infer_product_details
+from product_scraper.frontier import UrlFrontier, url_fingerprint
+from product_scraper.items import ProductItem
+
+# Sent with `urls` once the items of those pages are written (see BaseExtractor.persisted)
+pages_persisted = object()
+
+
+class BaseExtractor(abc.ABC):
+    """
+    Crawl logic for one platform. ProductSpider creates one extractor per crawl and
+    delegates to it: start_requests() yields the entry requests, and every response is
+    handed to the extractor method named by request(..., handler) via ProductSpider.dispatch.
+
+    Subclasses implement start_requests() and declare:
+        name: the scraper type, as written in companies.csv.
+        bulk_endpoint: path of the JSON API paged through, if the platform has one.
+        page_size: products requested per bulk page.
+        uses_playwright: downloads go through Playwright instead of Scrapy's downloader.
+    """
+    name = None
+    bulk_endpoint = None
+    page_size = None
+    uses_playwright = False
+
+    def __init__(self, spider):
+        self.spider = spider
+        self.settings = spider.settings
+        self.logger = spider.logger
+        self.company_name = spider.company_name
+        self.start_url = spider.start_url
+        self._frontier = None
+        # Fingerprints already requested in this run, so a URL found again is not re-queued
+        self.requested = set()
+        # Bulk API pages requested in this run, and pages whose items all reached the pipeline
+        self.requested_pages = set()
+        self.done_pages = set()
+        # (request URL, frontier fingerprint, lastmod) of handled responses whose items may still be buffered
+        self.completed = []
+        self.resumed = False
+        # Parser helpers are timed into the stage/* stats only when CrawlMetrics reports them
+        self.stage_timing = self.settings.getbool('METRICS_ENABLED')
+
+    @property
+    def stats(self):
+        return self.spider.crawler.stats
+
+    @property
+    def frontier(self):
+        """The persistent UrlFrontier (FRONTIER_DB), opened on first use; None when FRONTIER_ENABLED is off."""
+        if self._frontier is None and self.settings.getbool('FRONTIER_ENABLED'):
+            self._frontier = UrlFrontier(self.settings.get('FRONTIER_DB'))
+        return self._frontier
+
+    @abc.abstractmethod
+    def start_requests(self):
+        """Yields the crawl's entry requests."""
+
+    def closed(self, reason):
+        if self._frontier is not None:
+            for state, count in self._frontier.counts(self.start_url).items():
+                self.stats.set_value(f'frontier/{state}', count)
+            self._frontier.close()
+
+    def request(self, url, handler, cb_kwargs=None, **kwargs):
+        """
+        A request whose response goes to this extractor's `handler` method. The callback is
+        always the spider's dispatch method, so the request stays serializable.
+        """
+        return scrapy.Request(url, callback=self.spider.dispatch,
+                              cb_kwargs={'handler': handler, **(cb_kwargs or {})}, **kwargs)
+
+    def timed(self, stage):
+        """Context manager timing a block as crawl stage `stage` (see metrics.timed)."""
+        return metrics.timed(self.stats, stage) if self.stage_timing else contextlib.nullcontext()
+
+    def checkpoint(self):
+        """
+        The crawl position saved in the job checkpoint (JSON-serializable). restore() gets
+        it back when the job resumes, before start_requests() runs.
+        """
+        return {'done_pages': sorted(self.done_pages)}
+
+    def restore(self, position):
+        self.done_pages = set(position.get('done_pages') or [])
+        self.resumed = True
+
+    def page_meta(self):
+        """
+        Meta for bulk page requests. After a crash a page may be in the response cache without
+        its items having been written, so a resumed job parses cached pages again.
+        """
+        return {'cache_reparse': True} if self.resumed else {}
+
+    def pages_to_request(self, pages):
+        """The pages among `pages` neither requested in this run nor completed before a resume."""
+        wanted = [page for page in pages if page not in self.requested_pages and page not in self.done_pages]
+        self.requested_pages.update(wanted)
+        return wanted
+
+    def frontier_request(self, fingerprint, url, kind, handler, lastmod, previous_state, **kwargs):
+        meta = {**kwargs.pop('meta', {}), 'frontier_fingerprint': fingerprint,
+                'frontier_lastmod': lastmod, 'frontier_state': previous_state}
+        if previous_state == 'pending':
+            # Fetched by an interrupted run perhaps, but never handled: parse even if cached
+            meta['cache_reparse'] = True
+        # Deduplicated by self.requested; Scrapy's seen-set may outlive a crashed run
+        return self.request(url, handler, meta=meta, errback=self.spider.dispatch_error, dont_filter=True, **kwargs)
+
+    def discover(self, entries, **kwargs):
+        """
+        Requests for discovered (url, kind, handler, lastmod) entries, skipping URLs the
+        frontier already fetched at the same lastmod. `entries` may be any iterable; it is
+        consumed in chunks so a large sitemap is never held in memory at once.
+        """
+        if self.frontier is None:
+            for url, kind, handler, lastmod in entries:
+                yield self.request(url, handler, **kwargs)
+            return
+        batch = []
+        for entry in entries:
+            batch.append(entry)
+            if len(batch) >= 500:
+                yield from self._offer(batch, **kwargs)
+                batch = []
+        if batch:
+            yield from self._offer(batch, **kwargs)
+
+    def _offer(self, batch, **kwargs):
+        fresh = []
+        for entry in batch:
+            fingerprint = url_fingerprint(entry[0])
+            if fingerprint not in self.requested:
+                self.requested.add(fingerprint)
+                fresh.append(entry)
+        wanted = self.frontier.offer(self.start_url, fresh)
+        self.stats.inc_value('frontier/discovered', len(batch))
+        self.stats.inc_value('frontier/skipped_unchanged', len(fresh) - len(wanted))
+        for entry in wanted:
+            yield self.frontier_request(*entry, **kwargs)
+
+    def resume_requests(self, **kwargs):
+        """
+        Requests for the URLs an earlier, interrupted crawl of this website discovered but never
+        finished, and for failed URLs, up to FRONTIER_MAX_ATTEMPTS failures in a row. A failed URL
+        is retried here even if the sitemap that lists it is unchanged and not read again.
+        """
+        if self.frontier is None:
+            return
+        max_attempts = self.settings.getint('FRONTIER_MAX_ATTEMPTS', 3)
+        # Only handlers this extractor has, in case the company's type changed since
+        pending = [entry for entry in self.frontier.unfinished(self.start_url, max_attempts) if hasattr(self, entry[3])]
+        if pending:
+            retried = sum(1 for entry in pending if entry[5] == 'failed')
+            self.logger.info(f"Resuming {len(pending)} unfinished URLs for {self.company_name} "
+                             f"({retried} failed before).")
+            self.stats.inc_value('frontier/resumed', len(pending) - retried)
+            self.stats.inc_value('frontier/retried', retried)
+        for entry in pending:
+            self.requested.add(entry[0])
+            yield self.frontier_request(*entry, **kwargs)
+
+    def fetched(self, response):
+        """
+        Called by the spider once a response's handler has finished without error. Its items
+        may still be buffered, so the page only counts as done once persisted() is called.
+        """
+        page = response.cb_kwargs.get('page')
+        if page is not None:
+            self.done_pages.add(page)
+        url = response.request.url if response.request is not None else response.url
+        self.completed.append((url, response.meta.get('frontier_fingerprint'), response.meta.get('frontier_lastmod')))
+
+    def take_completed(self):
+        """The pages handled since the last call; read before a flush, so all of their items are queued."""
+        completed, self.completed = self.completed, []
+        return completed
+
+    def persisted(self, completed):
+        """
+        Called by the pipeline once the items of `completed` (from take_completed()) are
+        written: the frontier marks them done and the response cache stops re-parsing them.
+        """
+        if self.frontier is not None:
+            self.frontier.mark_done(self.start_url, [(fingerprint, lastmod) for _, fingerprint, lastmod in completed
+                                                     if fingerprint])
+        if completed:
+            self.spider.crawler.signals.send_catch_log(pages_persisted, urls=[url for url, _, _ in completed])
+
+    def failed(self, request):
+        fingerprint = request.meta.get('frontier_fingerprint')
+        if fingerprint and self.frontier is not None:
+            self.frontier.mark_failed(self.start_url, fingerprint)
+
+    def preload_extraction_cache(self):
+        """Loads ingredient results persisted by earlier crawls so unchanged descriptions are not parsed again."""
+        import database
+        extraction.preload_ingredient_cache(database.get_extraction_cache())
+
+    def is_food(self, title):
+        """
+        Whether a listing is stored. Only listings that are not food are dropped; the rest are
+        classified when stored and again by every enrichment pass, so improved title rules reach
+        them without a re-crawl.
+        """
+        with self.timed('is_non_food'):
+            non_food = extraction.is_non_food(title)
+        if non_food:
+            self.logger.info(f"Skipping product '{title}' as it does not seem to be food.")
+            return False
+        return True
+
+    def product_item(self, **fields):
+        """A ProductItem with this company's defaults, overridden by `fields`."""
+        item = ProductItem()
+        item['brand'] = self.company_name
+        item['positioning'] = "Plant-based"
+        item['segment'], item['animal_product_replicated'], item['consumption_format'] = \
+            infer_product_details(fields.get('product_name') or '')
+        item['storage_condition'] = "Frozen" if self.company_name == "Blue Tribe" else "Ambient"
+        item['status'] = "Launched"
+        item['weight_unit'] = "g"
+        item['distribution_channels'] = "Brand website"
+        item['channel'] = "D2C"
+        item['website'] = self.start_url
+        item['source_name'] = f"{self.company_name} Official Website"
+        item['notes'] = ""
+        for key, value in fields.items():
+            item[key] = value
+        if 'product_page' in fields:
+            item.setdefault('source_links', fields['product_page'])
+        return item
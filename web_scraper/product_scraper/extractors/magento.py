@@ -0,0 +1,111 @@
+import json
+from urllib.parse import urlencode
+
+from product_scraper import extraction
+from product_scraper.extractors.base import BaseExtractor
+
+# Every catalog product has a price >= 0, so this filter matches the whole catalog.
+# GET (rather than POST) keeps the query cacheable by Magento's full-page cache and ours.
+PRODUCTS_QUERY = """
+{
+  products(filter: {price: {from: "0"}}, pageSize: %(page_size)d, currentPage: %(page)d) {
+    page_info { current_page total_pages }
+    items {
+      __typename id sku name url_key url_suffix stock_status updated_at
+      description { html }
+      price_range { minimum_price { final_price { value } } }
+      ... on ConfigurableProduct {
+        variants {
+          attributes { label }
+          product {
+            id sku stock_status
+            price_range { minimum_price { final_price { value } } }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def final_price(product):
+    value = (((product.get('price_range') or {}).get('minimum_price') or {}).get('final_price') or {}).get('value')
+    return None if value is None else f"{float(value):.2f}"
+
+
+class MagentoExtractor(BaseExtractor):
+    """
+    Pages through Magento 2's GraphQL `products` query, MAGENTO_PAGE_SIZE products (with
+    their configurable variants) per request. The first page's total_pages gives the page
+    count, so every remaining page is requested at once.
+    """
+    name = 'magento'
+    bulk_endpoint = '/graphql'
+    total_pages = None
+
+    def start_requests(self):
+        self.page_size = max(1, self.settings.getint('MAGENTO_PAGE_SIZE', 100))
+        self.preload_extraction_cache()
+        # On resume the page count is known, so every unfinished page is requested at once
+        yield from self.page_requests(range(1, (self.total_pages or 1) + 1))
+
+    def checkpoint(self):
+        return {**super().checkpoint(), 'total_pages': self.total_pages}
+
+    def restore(self, position):
+        super().restore(position)
+        self.total_pages = position.get('total_pages')
+
+    def page_requests(self, pages):
+        for page in self.pages_to_request(pages):
+            query = ' '.join((PRODUCTS_QUERY % {'page_size': self.page_size, 'page': page}).split())
+            url = f"{self.start_url}{self.bulk_endpoint}?{urlencode({'query': query})}"
+            # Pages are deduplicated by pages_to_request(), not by Scrapy's seen-set
+            yield self.request(url, 'parse_page', cb_kwargs={'page': page}, dont_filter=True, meta=self.page_meta(),
+                               headers={'Content-Type': 'application/json', 'Store': 'default'})
+
+    def parse_page(self, response, page=1):
+        try:
+            data = json.loads(response.body)
+        except json.JSONDecodeError:
+            self.logger.error(f"Failed to parse JSON from {response.url}")
+            return
+        if data.get('errors'):
+            self.logger.error(f"GraphQL errors from {response.url}: {data['errors'][0].get('message')}")
+        products = ((data.get('data') or {}).get('products')) or {}
+        total_pages = (products.get('page_info') or {}).get('total_pages')
+        if total_pages:
+            self.total_pages = int(total_pages)
+            yield from self.page_requests(range(2, self.total_pages + 1))
+        self.stats.inc_value('magento/pages')
+        if 'unchanged' in response.flags:
+            self.stats.inc_value('magento/unchanged_pages')
+            return
+        for product in products.get('items') or []:
+            title = product.get('name') or ''
+            if not title or not self.is_food(title):
+                continue
+            product_url = f"{self.start_url}/{product.get('url_key')}{product.get('url_suffix') or '.html'}"
+            with self.timed('extract_ingredients'):
+                ingredients, ingredient_count = extraction.extract_ingredients((product.get('description') or {}).get('html') or '')
+            weight = extraction.parse_weight_from_title(title)
+            # A configurable product is one item per child product; anything else is one item
+            variants = [(v.get('product') or {}, ' / '.join(a.get('label') for a in v.get('attributes') or [] if a.get('label')))
+                        for v in product.get('variants') or []] or [(product, "")]
+            for variant, label in variants:
+                in_stock = variant.get('stock_status') == 'IN_STOCK'
+                yield self.product_item(
+                    product_name=title,
+                    availability="Active" if in_stock else "OOS",
+                    in_stock=1 if in_stock else 0,
+                    price_inr=final_price(variant) or final_price(product),
+                    weight=weight,
+                    pack_size=label or (f"{weight}g" if weight else ""),
+                    product_page=product_url,
+                    ingredients_list=ingredients,
+                    ingredient_count=ingredient_count,
+                    last_updated=(product.get('updated_at') or '').split(' ')[0],
+                    variant_id=variant.get('sku') or variant.get('id'),
+                    source_updated_at=extraction.source_version(product.get('updated_at')),
+                )
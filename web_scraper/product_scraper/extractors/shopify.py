@@ -0,0 +1,131 @@
+import json
+
+from product_scraper import extraction
+from product_scraper.extractors.base import BaseExtractor
+
+
+class ShopifyExtractor(BaseExtractor):
+    """Pages through /products.json, up to SHOPIFY_PAGE_LIMIT products (all variants) per request."""
+    name = 'shopify'
+    bulk_endpoint = '/products.json'
+
+    def __init__(self, spider):
+        super().__init__(spider)
+        self.known_versions = {}
+        self.highest_page = 0
+        self.last_page = None
+
+    def start_requests(self):
+        self.page_size = self.settings.getint('SHOPIFY_PAGE_LIMIT', 250)
+        self.page_window = max(1, self.settings.getint('SHOPIFY_PAGE_WINDOW', 3))
+        incremental_arg = self.spider.incremental_arg
+        if incremental_arg is None:
+            self.incremental = self.settings.getbool('SHOPIFY_INCREMENTAL', False)
+        else:
+            self.incremental = incremental_arg.lower() in ('1', 'true', 'yes')
+        import database
+        if self.incremental:
+            self.known_versions = database.get_sync_state(self.start_url)
+            self.logger.info(f"Incremental mode: {len(self.known_versions)} known products for {self.company_name}.")
+        self.preload_extraction_cache()
+        self.extraction_workers = self.settings.getint('EXTRACTION_WORKERS', 0)
+        self.extraction_chunk_size = max(1, self.settings.getint('EXTRACTION_CHUNK_SIZE', 25))
+        if not self.done_pages:
+            self.highest_page = 1
+            yield from self.page_requests([1])
+            return
+        # Resuming: fetch the pages the interrupted run had not finished, then keep going
+        top = self.last_page or max(self.done_pages)
+        self.highest_page = top
+        yield from self.page_requests(range(1, top + 1))
+        yield from self.schedule_pages(top)
+
+    def checkpoint(self):
+        return {**super().checkpoint(), 'last_page': self.last_page}
+
+    def restore(self, position):
+        super().restore(position)
+        self.last_page = position.get('last_page')
+
+    def page_requests(self, pages):
+        for page in self.pages_to_request(pages):
+            url = f"{self.start_url}{self.bulk_endpoint}?limit={self.page_size}&page={page}"
+            # Pages are deduplicated by pages_to_request(), not by Scrapy's seen-set
+            yield self.request(url, 'parse_page', cb_kwargs={'page': page}, dont_filter=True,
+                               meta=self.page_meta())
+
+    def schedule_pages(self, page):
+        """
+        Keeps up to SHOPIFY_PAGE_WINDOW pages in flight ahead of the last full page,
+        so a large catalog is fetched concurrently instead of one page at a time.
+        """
+        if self.last_page is not None:
+            return
+        first = self.highest_page + 1
+        last = page + self.page_window
+        self.highest_page = max(self.highest_page, last)
+        yield from self.page_requests(range(first, last + 1))
+
+    async def extract_fields(self, products):
+        """
+        Returns extract_product_fields() for each product. With EXTRACTION_WORKERS > 0 the
+        uncached products are parsed in a process pool so HTML parsing does not block the reactor.
+        """
+        if not self.extraction_workers:
+            return [extraction.extract_product_fields(product) for product in products]
+        pool = extraction.get_process_pool(self.extraction_workers)
+        await extraction.extract_in_pool(pool, products, self.extraction_chunk_size)
+        # Everything is cached now, so this pass only does cheap title parsing
+        return [extraction.extract_product_fields(product) for product in products]
+
+    async def parse_page(self, response, page=1):
+        try:
+            data = json.loads(response.body)
+        except json.JSONDecodeError:
+            self.logger.error(f"Failed to parse JSON from {response.url}")
+            return
+        products = data.get('products', [])
+        if len(products) < self.page_size:
+            # A short page is the end of the catalog; later pages already in flight come back empty
+            if self.last_page is None or page < self.last_page:
+                self.last_page = page
+        else:
+            for request in self.schedule_pages(page):
+                yield request
+        self.stats.inc_value('shopify/pages')
+        if 'unchanged' in response.flags:
+            # Same bytes as last crawl, so every product on this page is already stored
+            self.stats.inc_value('shopify/unchanged_pages')
+            return
+        selected = []
+        for product in products:
+            product_url = f"{self.start_url}/products/{product['handle']}"
+            if "(copy)" in product['title'].lower(): continue
+            if self.incremental and self.known_versions.get(product_url) == extraction.source_version(product.get('updated_at')):
+                self.stats.inc_value('shopify/unchanged_products')
+                continue
+            if not self.is_food(product['title']):
+                continue
+            selected.append(product)
+        # Ingredient and title parsing for the page (wall time, including any wait for the process pool)
+        with self.timed('extract_product_fields'):
+            all_fields = await self.extract_fields(selected)
+        for product, fields in zip(selected, all_fields):
+            product_url = f"{self.start_url}/products/{product['handle']}"
+            for variant in product.get('variants', []):
+                weight = variant.get('grams') or fields['title_weight']
+                pack_size = variant.get('title') if variant.get('title') != 'Default Title' else f"{weight}g" if weight else ""
+                yield self.product_item(
+                    product_name=product['title'],
+                    availability="Active" if variant.get('available') else "OOS",
+                    in_stock=1 if variant.get('available') else 0,
+                    price_inr=variant.get('price'),
+                    weight=weight,
+                    pack_size=pack_size,
+                    product_page=product_url,
+                    ingredients_list=fields['ingredients_list'],
+                    ingredient_count=fields['ingredient_count'],
+                    last_updated=fields['last_updated'],
+                    variant_id=variant.get('id'),
+                    source_updated_at=extraction.source_version(product.get('updated_at')),
+                )
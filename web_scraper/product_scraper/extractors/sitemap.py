@@ -0,0 +1,181 @@
+import hashlib
+import json
+import re
+from urllib.parse import urljoin, urlparse
+
+from lxml import etree
+from scrapy.utils.sitemap import sitemap_urls_from_robots
+
+from product_scraper import extraction
+from product_scraper.extractors.base import BaseExtractor
+from product_scraper.frontier import iter_sitemap
+
+JSON_LD_XPATH = '//script[@type="application/ld+json"]/text()'
+# The number in a price such as "1,299.00", "₹499" or "Rs. 499"
+PRICE_RE = re.compile(r'\d[\d,]*(?:\.\d+)?')
+
+
+def json_ld_products(texts):
+    """Yields every schema.org Product object in a page's JSON-LD blocks, including @graph members."""
+    stack = []
+    for text in texts:
+        try:
+            stack.append(json.loads(text))
+        except ValueError:
+            continue
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            types = node.get('@type')
+            types = types if isinstance(types, list) else [types]
+            if 'Product' in types:
+                yield node
+            stack.extend(node.get('@graph') or [])
+
+
+def offers_of(product):
+    offers = product.get('offers') or []
+    offers = offers if isinstance(offers, list) else [offers]
+    flat = []
+    for offer in offers:
+        if not isinstance(offer, dict):
+            continue
+        # An AggregateOffer may list the individual offers
+        nested = offer.get('offers') or [offer]
+        flat.extend(nested if isinstance(nested, list) else [nested])
+    return flat or [{}]
+
+
+def offer_price(offer):
+    """An offer's price (or an AggregateOffer's lowPrice) as "1299.00"; None when it is missing or not a number."""
+    value = offer.get('price', offer.get('lowPrice'))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"{value:.2f}"
+    match = PRICE_RE.search(str(value or ''))
+    return f"{float(match.group().replace(',', '')):.2f}" if match else None
+
+
+def offer_variant_ids(product, offers):
+    """
+    The variant_id of each offer, unique within the product: the offer's sku, else (for a lone
+    offer) the product's sku, else a hash of the offer's url and name, else its position.
+    """
+    if len(offers) == 1:
+        return [str(offers[0].get('sku') or product.get('sku') or '')]
+    identities = [f"{offer.get('url') or ''}|{offer.get('name') or ''}" for offer in offers]
+    # A hash only tells the sku-less offers apart when each has its own url or name
+    unnamed = [identity for offer, identity in zip(offers, identities) if not offer.get('sku')]
+    hashable = len(set(unnamed)) == len(unnamed) and '|' not in unnamed
+    ids = []
+    for index, (offer, identity) in enumerate(zip(offers, identities)):
+        if offer.get('sku'):
+            ids.append(str(offer['sku']))
+        elif hashable:
+            ids.append(hashlib.sha1(identity.encode('utf-8')).hexdigest()[:16])
+        else:
+            ids.append(f"{product.get('sku') or ''}#{index}")
+    return ids
+
+
+def within_start_path(url, start_url):
+    """Whether `url` lies under the start URL's path (any URL does when the start URL is a bare domain)."""
+    path = urlparse(start_url).path.rstrip('/')
+    return not path or urlparse(url).path.startswith(path + '/')
+
+
+class SitemapDiscovery:
+    """
+    Page discovery for a BaseExtractor from the sitemaps listed in the site's robots.txt, or
+    from `<start URL>/sitemap.xml` when it lists none. Page URLs under the start URL that
+    match the pattern given to sitemap_requests() go to the `page_handler` method, and
+    no_sitemap() is called when the site has no sitemap at all.
+
+    Sitemaps are parsed as a stream and every URL goes through the frontier, so pages
+    whose <lastmod> has not changed since they were last fetched are not requested again.
+    """
+    page_handler = 'parse_product'
+
+    def sitemap_requests(self, page_pattern):
+        self.page_pattern = re.compile(page_pattern)
+        # A missing robots.txt still reaches parse_robots, which then falls back to /sitemap.xml
+        yield self.request(urljoin(self.start_url, '/robots.txt'), 'parse_robots', meta={'handle_httpstatus_all': True})
+
+    def parse_robots(self, response):
+        sitemaps = list(sitemap_urls_from_robots(response.text, base_url=response.url)) if response.status == 200 else []
+        if sitemaps:
+            yield from self.discover((url, 'sitemap', 'parse_sitemap', None) for url in sitemaps)
+            return
+        # Requested outside the frontier so that a missing sitemap (404) reaches parse_sitemap on every run
+        yield self.request(f"{self.start_url.rstrip('/')}/sitemap.xml", 'parse_sitemap',
+                           meta={'handle_httpstatus_list': [404, 410]})
+
+    def parse_sitemap(self, response):
+        if response.status in (404, 410):
+            yield from self.no_sitemap(response)
+            return
+        if 'unchanged' in response.flags and response.meta.get('frontier_state') == 'done':
+            # Same bytes as the last complete read: its URLs are already in the frontier
+            self.stats.inc_value('sitemap/unchanged_sitemaps')
+            return
+        self.stats.inc_value('sitemap/sitemaps')
+        try:
+            yield from self.discover(self.sitemap_entries(response))
+        except etree.LxmlError as e:
+            self.logger.error(f"Failed to parse sitemap {response.url}: {e}")
+
+    def sitemap_entries(self, response):
+        for kind, url, lastmod in iter_sitemap(response.body):
+            if kind == 'sitemap':
+                yield url, kind, 'parse_sitemap', lastmod
+            elif self.page_pattern.search(url) and within_start_path(url, self.start_url):
+                yield url, kind, self.page_handler, lastmod
+
+    def no_sitemap(self, response):
+        """Requests to make when the site has no sitemap; none by default."""
+        self.logger.warning(f"No sitemap found for {self.company_name} ({response.url} returned {response.status}).")
+        return ()
+
+
+class SitemapExtractor(SitemapDiscovery, BaseExtractor):
+    """
+    Generic HTML sites: follows sitemap URLs matching SITEMAP_PRODUCT_PATTERN (see
+    SitemapDiscovery) and builds items from each page's schema.org Product JSON-LD.
+    Used for platforms without a public bulk API, such as BigCommerce. URLs left over by
+    an interrupted crawl are requested first.
+    """
+    name = 'sitemap'
+
+    def start_requests(self):
+        self.preload_extraction_cache()
+        yield from self.resume_requests()
+        yield from self.sitemap_requests(self.settings.get('SITEMAP_PRODUCT_PATTERN', r'/products?/'))
+
+    def parse_product(self, response):
+        if 'unchanged' in response.flags:
+            return
+        for product in json_ld_products(response.xpath(JSON_LD_XPATH).getall()):
+            title = (product.get('name') or '').strip()
+            if not title or not self.is_food(title):
+                continue
+            self.stats.inc_value('sitemap/products')
+            with self.timed('extract_ingredients'):
+                ingredients, ingredient_count = extraction.extract_ingredients(product.get('description') or '')
+            weight = extraction.parse_weight_from_title(title)
+            offers = offers_of(product)
+            for offer, variant_id in zip(offers, offer_variant_ids(product, offers)):
+                in_stock = 'InStock' in str(offer.get('availability') or '')
+                yield self.product_item(
+                    product_name=title,
+                    availability="Active" if in_stock else "OOS",
+                    in_stock=1 if in_stock else 0,
+                    price_inr=offer_price(offer),
+                    weight=weight,
+                    pack_size=f"{weight}g" if weight else "",
+                    product_page=response.url,
+                    ingredients_list=ingredients,
+                    ingredient_count=ingredient_count,
+                    last_updated="",
+                    variant_id=variant_id,
+                )
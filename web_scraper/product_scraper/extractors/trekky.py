@@ -0,0 +1,98 @@
+from w3lib.url import add_or_replace_parameter, url_query_parameter
+
+from product_scraper.extractors.base import BaseExtractor
+from product_scraper.extractors.sitemap import SitemapDiscovery
+from product_scraper.items import ProductItem
+from product_scraper.rendering import RenderPool
+
+
+class TrekkyExtractor(SitemapDiscovery, BaseExtractor):
+    """
+    The trekky-reviews hotels: hotel pages are found through the site's sitemaps (see
+    SitemapDiscovery) and, when it has none, by walking the Paris listing page by page.
+    Either way every hotel URL goes through the frontier, so an interrupted crawl resumes
+    where it stopped.
+    """
+    name = 'trekky'
+    page_handler = 'parse_hotel'
+
+    def start_requests(self):
+        yield from self.resume_requests()
+        yield from self.sitemap_requests(self.settings.get('TREKKY_HOTEL_PATTERN', r'/hotels?/'))
+
+    def no_sitemap(self, response):
+        self.logger.info(f"No sitemap at {response.url}; walking the hotel listing instead.")
+        yield self.listing_request(self.listing_url())
+
+    def listing_url(self):
+        return f"{self.start_url}/cities?city=paris&page=1"
+
+    def listing_request(self, url):
+        # Listing pages change as hotels are added, so they are always fetched
+        return self.request(url, 'parse_listing')
+
+    def parse_listing(self, response):
+        self.logger.info(f"Parsing hotel listing on {response.url}")
+        hotel_urls = [response.urljoin(href) for href in response.css('.hotel-link::attr(href)').getall()]
+        # Hotel pages are plain HTML, so they never need the Playwright meta flag
+        yield from self.discover((url, 'page', 'parse_hotel', None) for url in hotel_urls)
+        if not hotel_urls:
+            return
+        next_page = response.css('a[rel="next"]::attr(href), .pagination .next a::attr(href)').get()
+        if next_page:
+            yield self.listing_request(response.urljoin(next_page))
+        elif url_query_parameter(response.url, 'page', '').isdigit():
+            page = int(url_query_parameter(response.url, 'page'))
+            yield self.listing_request(add_or_replace_parameter(response.url, 'page', str(page + 1)))
+
+    def parse_hotel(self, response):
+        self.logger.info(f"Parsing hotel details on {response.url}")
+        if 'unchanged' in response.flags:
+            return
+        item = ProductItem()
+        item['brand'] = self.company_name
+        item['product_name'] = response.css('.hotel-name::text').get(default='').strip()
+        email = response.css('.hotel-email::text').get(default='').strip()
+        reviews = response.css('.hotel-review .review-rating::text').getall()
+        review_ratings = [r.strip() for r in reviews]
+        item['notes'] = f"Email: {email}, Reviews: {', '.join(review_ratings)}"
+        item['product_page'] = response.url
+        item['website'] = self.start_url
+        item['last_updated'] = 'n/a'
+        yield item
+
+
+class PlaywrightExtractor(TrekkyExtractor):
+    """
+    The same hotels, for sites that build the listing with JavaScript. When there is no
+    sitemap, listing pages are rendered through the RenderPool's pre-warmed contexts, waiting for
+    `wait_selector` rather than the full page load; hotel pages are fetched like any other request.
+    """
+    name = 'playwright'
+    uses_playwright = True
+    wait_selector = '.hotel-link'
+
+    def __init__(self, spider):
+        super().__init__(spider)
+        self.render_pool = RenderPool(self.settings, self.stats, self.wait_selector)
+
+    def listing_url(self):
+        return self.start_url
+
+    def closed(self, reason):
+        if self.render_pool.pages:
+            self.logger.info(self.render_pool.summary())
+        super().closed(reason)
+
+    def listing_request(self, url):
+        # The errback closes the page a failed render left open
+        return self.request(url, 'parse_rendered', meta=self.render_pool.meta(), errback=self.spider.dispatch_error)
+
+    async def parse_rendered(self, response):
+        response, found = await self.render_pool.settle(response)
+        if found:
+            self.logger.info(f"Successfully rendered and fetched page with Playwright: {response.url}")
+        else:
+            self.logger.info(f"Rendered {response.url}, but '{self.render_pool.wait_selector}' never appeared")
+        for output in self.parse_listing(response):
+            yield output
@@ -0,0 +1,158 @@
+import gzip
+import hashlib
+import sqlite3
+import threading
+import time
+from io import BytesIO
+
+from lxml import etree
+from w3lib.url import canonicalize_url
+
+# Rows looked up per SELECT ... IN (...) (SQLite's default limit is 999 parameters)
+LOOKUP_CHUNK_SIZE = 500
+
+
+def url_fingerprint(url):
+    """Stable across runs and processes: the SHA-1 of the canonical URL."""
+    return hashlib.sha1(canonicalize_url(url).encode('utf-8')).hexdigest()
+
+
+def iter_sitemap(body):
+    """
+    Streams a sitemap or sitemap index (gzipped or not), yielding (kind, loc, lastmod) where
+    kind is 'sitemap' for index entries and 'page' for urlset entries. Elements are freed as
+    soon as they are read, so memory stays flat for 50,000-URL sitemaps.
+    """
+    stream = BytesIO(body)
+    if body[:2] == b'\x1f\x8b':
+        stream = gzip.GzipFile(fileobj=stream)
+    context = etree.iterparse(stream, events=('end',), tag=('{*}url', '{*}sitemap'),
+                              resolve_entities=False, no_network=True, huge_tree=True, recover=True)
+    for _, element in context:
+        loc = lastmod = None
+        for child in element:
+            name = etree.QName(child).localname
+            if name == 'loc':
+                loc = (child.text or '').strip()
+            elif name == 'lastmod':
+                lastmod = (child.text or '').strip() or None
+        if loc:
+            yield ('sitemap' if etree.QName(element).localname == 'sitemap' else 'page'), loc, lastmod
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
+class UrlFrontier:
+    """
+    Every URL discovered for a website, kept across runs in one SQLite table keyed by
+    website and URL fingerprint. A URL is 'pending' from discovery until the items parsed
+    from its response have been written, then 'done' with the sitemap lastmod it was fetched
+    at; 'failed' if the download failed, with the number of failed attempts in a row.
+
+    offer() decides which discovered URLs need a request: new ones, ones whose lastmod
+    changed since they were fetched (or that have no lastmod), and unfinished ones.
+    unfinished() returns the URLs an interrupted crawl left behind and the failed ones worth
+    another attempt, to resume them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS frontier (
+            website TEXT NOT NULL,
+            fingerprint TEXT NOT NULL,
+            url TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            handler TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            lastmod TEXT,
+            fetched_lastmod TEXT,
+            discovered_at REAL,
+            fetched_at REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (website, fingerprint)
+        ) WITHOUT ROWID
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(frontier)")}
+        if 'attempts' not in columns:
+            self.conn.execute("ALTER TABLE frontier ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS frontier_website_state ON frontier (website, state)")
+
+    def offer(self, website, entries):
+        """
+        Records discovered (url, kind, handler, lastmod) entries and returns the subset that
+        should be requested now, as (fingerprint, url, kind, handler, lastmod, previous state)
+        tuples; the previous state is None for a URL seen for the first time.
+        """
+        by_fingerprint = {}
+        for url, kind, handler, lastmod in entries:
+            by_fingerprint[url_fingerprint(url)] = (url, kind, handler, lastmod)
+        if not by_fingerprint:
+            return []
+        fingerprints = list(by_fingerprint)
+        known = {}
+        with self.lock:
+            for i in range(0, len(fingerprints), LOOKUP_CHUNK_SIZE):
+                chunk = fingerprints[i:i + LOOKUP_CHUNK_SIZE]
+                known.update((row[0], row[1:]) for row in self.conn.execute(
+                    f"SELECT fingerprint, state, fetched_lastmod FROM frontier "
+                    f"WHERE website = ? AND fingerprint IN ({', '.join('?' * len(chunk))})", [website, *chunk]))
+            wanted = []
+            for fingerprint, (url, kind, handler, lastmod) in by_fingerprint.items():
+                state, fetched_lastmod = known.get(fingerprint, (None, None))
+                if state == 'done' and lastmod is not None and lastmod == fetched_lastmod:
+                    continue
+                wanted.append((fingerprint, url, kind, handler, lastmod, state))
+            now = time.time()
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "INSERT INTO frontier (fingerprint, website, url, kind, handler, state, lastmod, discovered_at) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', ?, ?) "
+                "ON CONFLICT(website, fingerprint) DO UPDATE SET state = 'pending', lastmod = excluded.lastmod, "
+                "handler = excluded.handler",
+                [(fingerprint, website, url, kind, handler, lastmod, now)
+                 for fingerprint, url, kind, handler, lastmod, _ in wanted])
+            self.conn.execute("COMMIT")
+        return wanted
+
+    def unfinished(self, website, max_attempts):
+        """
+        Entries shaped like offer()'s that were discovered but not fetched yet, and failed ones
+        that have failed fewer than `max_attempts` times in a row, in discovery order.
+        """
+        with self.lock:
+            return self.conn.execute(
+                "SELECT fingerprint, url, kind, handler, lastmod, state FROM frontier "
+                "WHERE website = ? AND (state = 'pending' OR (state = 'failed' AND attempts < ?)) "
+                "ORDER BY discovered_at", (website, max_attempts)).fetchall()
+
+    def mark_done(self, website, entries):
+        """Marks (fingerprint, lastmod) entries done, at the lastmod each was fetched at."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(
+                "UPDATE frontier SET state = 'done', fetched_lastmod = ?, fetched_at = ?, attempts = 0 "
+                "WHERE website = ? AND fingerprint = ?",
+                [(lastmod, now, website, fingerprint) for fingerprint, lastmod in entries])
+            self.conn.execute("COMMIT")
+
+    def mark_failed(self, website, fingerprint):
+        with self.lock:
+            self.conn.execute("UPDATE frontier SET state = 'failed', fetched_at = ?, attempts = attempts + 1 "
+                              "WHERE website = ? AND fingerprint = ?", (time.time(), website, fingerprint))
+
+    def counts(self, website):
+        """{state: number of URLs} for one website."""
+        with self.lock:
+            return dict(self.conn.execute(
+                "SELECT state, COUNT(*) FROM frontier WHERE website = ? GROUP BY state", (website,)))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
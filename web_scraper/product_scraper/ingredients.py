@@ -0,0 +1,280 @@
+import collections
+import re
+
+# One ingredient of a list: its name as written, the percentage declared for it (or None)
+# and the sub-ingredients listed in its parentheses, e.g. "Spices (Cumin, Coriander 2%)"
+Ingredient = collections.namedtuple('Ingredient', 'name percentage children')
+
+# "Ingredients:" is preferred over a bare "ingredients"
+INGREDIENTS_HEADER_RES = (
+    re.compile(r'\bingredients?\s*[:\-–]\s*', re.IGNORECASE),
+    re.compile(r'\bingredients?\b\s*[:\-–]?\s*', re.IGNORECASE),
+)
+# "Made with" also opens marketing copy, so it only counts when a short list follows it
+MADE_WITH_HEADER_RE = re.compile(r'\bmade\s+(?:from|with)\b\s*[:\-–]?\s*', re.IGNORECASE)
+ALLERGENS_HEADER_RE = re.compile(r'\b(?:contains|allergens?(?:\s+(?:information|info|advice))?)\b\s*[:\-–]?\s*',
+                                 re.IGNORECASE)
+CONTAINS_RE = re.compile(r'contains\b\s*[:\-–]?\s*', re.IGNORECASE)
+# Headings of the sections that follow an ingredient list on product pages; the list ends at the first one
+SECTION_HEADING_RE = re.compile(
+    r'\b(?:contains|allergens?|may\s+contain|nutrition(?:al)?|storage|store\s+(?:in|at|below)|shelf\s+life|'
+    r'best\s+before|how\s+to\s+(?:cook|use|prepare|make)|cooking\s+instructions|directions|preparation|serving\s+suggestions?|'
+    r'net\s+(?:wt|weight|quantity|content)|manufactured|marketed|fssai|disclaimer|details|description|'
+    r'customer\s+care|country\s+of\s+origin|mrp)\b', re.IGNORECASE)
+CONJUNCTION_RE = re.compile(r'\s+(?:and|&)\s+', re.IGNORECASE)
+PERCENTAGE_RE = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+# A declared amount in parentheses, "Vitamin B12 (0.5 mg)"; like a percentage, not a sub-ingredient
+AMOUNT_RE = re.compile(r'\d+(?:\.\d+)?\s*(?:mcg|µg|ug|mg|g|kg|ml|l|iu|kcal)', re.IGNORECASE)
+# Words of a sentence, not of an ingredient list ("spices for rich flavour", "that you will love")
+PROSE_RE = re.compile(r'\b(?:for|that|which|this|these|they|them|their|you|your|our|we)\b', re.IGNORECASE)
+# Words of a claim ("no added sugar", "zero trans fat", "goodness in every bite"). A short claim inside
+# a list is skipped; a longer entry with one of them is a sentence, and ends the list
+CLAIM_RE = re.compile(r'\b(?:no|zero|without|out|every)\b', re.IGNORECASE)
+# An entry longer than this is prose that followed the list, not an ingredient
+MAX_INGREDIENT_WORDS = 8
+# Every entry after "made with" must be this short, and there must be at least two
+MAX_MADE_WITH_WORDS = 4
+
+OPENING, CLOSING = '([{', ')]}'
+
+# Canonical ingredient -> the other names it is sold under. Names are compared after
+# normalize_name(), so "Soya Protein Isolate" and "soy protein isolate" are the same alias.
+ALIASES = {
+    "soy protein": ("soy protein isolate", "isolated soy protein", "soy protein concentrate", "textured soy protein",
+                    "soy chunks", "soy granules", "soy nuggets", "tvp", "textured vegetable protein"),
+    "pea protein": ("pea protein isolate", "pea protein concentrate", "textured pea protein", "yellow pea protein"),
+    "wheat gluten": ("vital wheat gluten", "gluten", "wheat protein"),
+    "refined wheat flour": ("maida", "refined flour", "all purpose flour", "wheat flour (maida)"),
+    "whole wheat flour": ("atta", "wheat flour (atta)"),
+    "chickpea flour": ("besan", "gram flour", "bengal gram flour"),
+    "sunflower oil": ("sunflower seed oil", "high oleic sunflower oil"),
+    "canola oil": ("rapeseed oil",),
+    "palm oil": ("palmolein", "palmolein oil", "palm olein"),
+    "coconut oil": ("virgin coconut oil",),
+    "salt": ("common salt", "table salt"),
+    "water": ("drinking water", "potable water"),
+    "methylcellulose": ("methyl cellulose", "ins 461", "e461", "e 461"),
+    "spices": ("mixed spices", "spice mix", "condiments"),
+    "natural flavor": ("natural flavour", "natural flavours", "natural flavors", "natural flavouring",
+                       "natural flavoring"),
+    "jackfruit": ("raw jackfruit", "young jackfruit", "green jackfruit"),
+    "mushroom": ("mushrooms",),
+    "soy sauce": ("soya sauce",),
+    "sugar": ("cane sugar",),
+}
+# Allergen declarations ("Contains: Soya, Wheat") -> canonical allergen
+ALLERGEN_ALIASES = {
+    "soy": ("soybean", "soybeans", "soy bean", "soy beans", "soy products"),
+    "gluten": ("wheat", "wheat gluten", "cereals containing gluten"),
+    "milk": ("dairy", "lactose", "milk products"),
+    "tree nuts": ("nuts", "nut", "cashew", "cashews", "almond", "almonds"),
+    "peanuts": ("peanut", "groundnut", "groundnuts"),
+    "sesame": ("sesame seeds",),
+    "mustard": ("mustard seeds",),
+}
+# Words that describe how an ingredient was processed rather than what it is
+DESCRIPTORS = frozenset(("refined", "organic", "iodised", "iodized", "edible", "pure", "premium"))
+
+
+def normalize_name(name):
+    """Lowercase, "soya" spelled "soy", '&' as "and", without percentages and punctuation."""
+    name = PERCENTAGE_RE.sub(' ', name.lower())
+    name = re.sub(r'\bsoya\b', 'soy', name.replace('&', ' and '))
+    name = re.sub(r'[^\w\s()-]+', ' ', name)
+    name = re.sub(r'\s*\(\s*', ' (', re.sub(r'\s*\)', ')', name))
+    return ' '.join(name.split()).strip(' -')
+
+
+def _alias_index(aliases):
+    index = {}
+    for canonical, names in aliases.items():
+        for name in (canonical,) + names:
+            index[normalize_name(name)] = canonical
+    return index
+
+
+ALIAS_INDEX = _alias_index(ALIASES)
+ALLERGEN_INDEX = _alias_index(ALLERGEN_ALIASES)
+
+
+def _without_descriptors(normalized):
+    return ' '.join(word for word in normalized.split() if word not in DESCRIPTORS)
+
+
+def known_alias(name, index=ALIAS_INDEX):
+    """The canonical ingredient a name is an alias of, with or without descriptors, or None."""
+    normalized = normalize_name(name)
+    return index.get(normalized) or index.get(_without_descriptors(normalized))
+
+
+def canonical_name(name, index=ALIAS_INDEX):
+    """The canonical ingredient for a name: its alias entry, else the name without descriptors."""
+    return known_alias(name, index) or _without_descriptors(normalize_name(name))
+
+
+def canonical_allergen(name):
+    return canonical_name(name, ALLERGEN_INDEX)
+
+
+def split_top_level(text, conjunctions=False):
+    """
+    Splits at commas, semicolons and line breaks outside parentheses (and at "and"/"&" with `conjunctions`);
+    an unbalanced closing bracket is ignored.
+    """
+    depths, depth = [], 0
+    for char in text:
+        if char in OPENING:
+            depth += 1
+        elif char in CLOSING:
+            depth = max(0, depth - 1)
+        depths.append(depth)
+    cuts = [(i, i + 1) for i, char in enumerate(text) if char in ',;\n' and depths[i] == 0]
+    if conjunctions:
+        cuts += [match.span() for match in CONJUNCTION_RE.finditer(text) if depths[match.start()] == 0]
+    parts, start = [], 0
+    for cut_start, cut_end in sorted(cuts):
+        parts.append(text[start:cut_start])
+        start = cut_end
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def list_end(text):
+    """
+    Where an ingredient list ends: at the first section heading, a full stop outside
+    parentheses, or the end of a line holding a comma-separated list. A list of one
+    ingredient per line (html_to_text() of a bulleted list) continues to the next line.
+    """
+    heading = SECTION_HEADING_RE.search(text)
+    end = heading.start() if heading else len(text)
+    depth, line_has_list = 0, False
+    for i, char in enumerate(text[:end]):
+        if char in OPENING:
+            depth += 1
+        elif char in CLOSING:
+            depth = max(0, depth - 1)
+        elif depth:
+            continue
+        elif char == '.' and not text[i + 1:i + 2].isdigit():
+            return i
+        elif char in ',;':
+            line_has_list = True
+        elif char == '\n' and line_has_list:
+            return i
+    return end
+
+
+def parse_entry(entry):
+    """One list entry -> Ingredient, or None if it is empty or reads like prose."""
+    entry = entry.strip(' *.:-')
+    percentage, children = None, []
+    # An alias may carry its own parentheses, "Wheat Flour (Maida)"
+    if known_alias(entry):
+        match = PERCENTAGE_RE.search(entry)
+        name = ' '.join(PERCENTAGE_RE.sub(' ', entry).split())
+        return Ingredient(name, float(match.group(1)) if match else None, [])
+    open_at = next((i for i, char in enumerate(entry) if char in OPENING), None)
+    name = entry
+    if open_at is not None:
+        name = entry[:open_at]
+        inner = entry[open_at + 1:]
+        close_at = inner.rfind(CLOSING[OPENING.index(entry[open_at])])
+        inner, rest = (inner[:close_at], inner[close_at + 1:]) if close_at >= 0 else (inner, '')
+        name = f"{name} {rest}"
+        if PERCENTAGE_RE.fullmatch(inner.strip()):
+            percentage = float(PERCENTAGE_RE.fullmatch(inner.strip()).group(1))
+        elif AMOUNT_RE.fullmatch(inner.strip()):
+            pass
+        else:
+            children = [child for child in map(parse_entry, split_top_level(inner, conjunctions=True)) if child]
+    match = PERCENTAGE_RE.search(name)
+    if match:
+        percentage = float(match.group(1)) if percentage is None else percentage
+        name = PERCENTAGE_RE.sub(' ', name)
+    name = ' '.join(name.split()).strip(' *.:-')
+    if (not name or not re.search(r'[^\W\d_]', name) or len(name.split()) > MAX_INGREDIENT_WORDS
+            or PROSE_RE.search(name) or CLAIM_RE.search(name)):
+        return None
+    return Ingredient(name, percentage, children)
+
+
+def is_claim(entry):
+    """A short claim inside a list, such as "No Added Sugar": not an ingredient, but not the end of the list."""
+    return (bool(CLAIM_RE.search(entry)) and len(entry.split()) <= MAX_MADE_WITH_WORDS
+            and not PROSE_RE.search(entry))
+
+
+def parse_ingredient_list(text):
+    """
+    Parses an ingredient list without its "Ingredients:" heading, e.g. the stored text.
+    Returns (ingredients, allergens): Ingredient tuples in order, and the names declared in a
+    "Contains:" section right after the list. Short claims after the first ingredient are
+    skipped, and entries after the first one that reads like prose are dropped.
+    """
+    end = list_end(text)
+    ingredients = []
+    for entry in split_top_level(text[:end], conjunctions=True):
+        ingredient = parse_entry(entry)
+        if ingredient is None:
+            # A list that opens with a claim ("no maida, palm oil or preservatives") is all claim
+            if ingredients and is_claim(entry):
+                continue
+            break
+        ingredients.append(ingredient)
+    allergens = []
+    # Only a declaration right after the list; "contains" further on is usually prose
+    match = ALLERGENS_HEADER_RE.match(text, len(text) - len(text[end:].lstrip(' .;:\n')))
+    if match:
+        section = text[match.end():]
+        # "Allergen Information: Contains Soy" - the "contains" would end the section at once
+        contains = CONTAINS_RE.match(section)
+        if contains:
+            section = section[contains.end():]
+        section = section[:list_end(section)]
+        names = (' '.join(part.split()).strip(' *.:-') for part in split_top_level(section, conjunctions=True))
+        allergens = [name for name in names if name and len(name.split()) <= 4]
+    return ingredients, allergens
+
+
+def is_list_shaped(text):
+    """Whether the text up to list_end() is two or more short entries without sentence or claim words."""
+    entries = split_top_level(text[:list_end(text)], conjunctions=True)
+    return len(entries) >= 2 and all(
+        len(entry.split()) <= MAX_MADE_WITH_WORDS and not PROSE_RE.search(entry) and not CLAIM_RE.search(entry)
+        for entry in entries)
+
+
+def parse_ingredients(text):
+    """Finds the ingredient list in a page's text; returns (ingredients, allergens), or None if there is none."""
+    for header_re in INGREDIENTS_HEADER_RES:
+        match = header_re.search(text)
+        if match:
+            return parse_ingredient_list(text[match.end():])
+    match = MADE_WITH_HEADER_RE.search(text)
+    if match and is_list_shaped(text[match.end():]):
+        return parse_ingredient_list(text[match.end():])
+    return None
+
+
+def format_ingredient(ingredient):
+    text = ingredient.name
+    if ingredient.percentage is not None:
+        text += f" {ingredient.percentage:g}%"
+    if ingredient.children:
+        text += f" ({', '.join(format_ingredient(child) for child in ingredient.children)})"
+    return text
+
+
+def format_ingredients(ingredients, allergens=()):
+    """The text stored as a product's ingredient list; parse_ingredient_list() reads it back."""
+    text = ', '.join(format_ingredient(ingredient) for ingredient in ingredients)
+    if allergens:
+        text += f". Contains: {', '.join(allergens)}"
+    return text
+
+
+def flatten(ingredients, parent=None):
+    """Yields (ingredient, parent ingredient or None) for every ingredient and sub-ingredient, in order."""
+    for ingredient in ingredients:
+        yield ingredient, parent
+        yield from flatten(ingredient.children, ingredient)
@@ -27,4 +27,8 @@ class ProductItem(scrapy.Item):
     ingredient_count = scrapy.Field()
     last_updated = scrapy.Field()
     notes = scrapy.Field()
+    # The source's id for this variant (Shopify variant id); keys the variants table
+    variant_id = scrapy.Field()
+    # Not stored in the products table; used for incremental sync bookkeeping
+    source_updated_at = scrapy.Field()
 pass
@@ -0,0 +1,285 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the response time histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The latest snapshot of every crawl in this process, by company, for the Prometheus endpoint
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+_endpoint = None
+
+
+def record_duration(stats, stage, seconds):
+    """Adds one timed call of `stage` to the crawl stats (calls, total and slowest seconds)."""
+    stats.inc_value(f'stage/{stage}/calls')
+    stats.inc_value(f'stage/{stage}/seconds', seconds)
+    stats.max_value(f'stage/{stage}/max_seconds', seconds)
+
+
+@contextlib.contextmanager
+def timed(stats, stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_duration(stats, stage, time.perf_counter() - started)
+
+
+def stage_times(stats):
+    """{stage: {'calls', 'seconds', 'max_seconds'}} from the stage/* stats."""
+    stages = {}
+    for key, value in stats.items():
+        if key.startswith('stage/'):
+            _, stage, field = key.split('/', 2)
+            stages.setdefault(stage, {})[field] = round(value, 6) if isinstance(value, float) else value
+    return stages
+
+
+class CrawlMetrics:
+    """
+    Per-company crawl instrumentation. Counts requests, network responses and bytes
+    (cache hits separately), builds a response time histogram, and reads items/sec and the
+    stage/* timings (parser helpers, DB flushes) from the crawl stats.
+
+    A snapshot is appended to METRICS_FILE as a JSON line every METRICS_INTERVAL seconds and
+    when the crawl closes. With METRICS_PROMETHEUS_PORT set, every crawl in the process is
+    also served in the Prometheus text format at http://localhost:<port>/metrics.
+    """
+
+    def __init__(self, crawler, path, interval, port):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.path = path
+        self.interval = interval
+        self.port = port
+        self.loop = None
+        self.spider = None
+        self.started_at = None
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self.responses = 0
+        self.cached_responses = 0
+        self.bytes = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        extension = cls(crawler, settings.get('METRICS_FILE'), settings.getfloat('METRICS_INTERVAL', 30),
+                        settings.getint('METRICS_PROMETHEUS_PORT') or None)
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(extension.response_received, signal=signals.response_received)
+        return extension
+
+    def spider_opened(self, spider):
+        self.spider = spider
+        self.started_at = time.monotonic()
+        if self.port:
+            start_endpoint(self.port)
+        if self.interval > 0:
+            self.loop = task.LoopingCall(self.emit, 'snapshot')
+            self.loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.loop is not None and self.loop.running:
+            self.loop.stop()
+        self.emit('final', reason=reason)
+
+    def response_received(self, response, request, spider):
+        if 'cached' in response.flags:
+            self.cached_responses += 1
+            return
+        self.responses += 1
+        self.bytes += len(response.body)
+        latency = request.meta.get('download_latency')
+        if latency is None:
+            return
+        self.latency_sum += latency
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.latency_counts[i] += 1
+                break
+        else:
+            self.latency_counts[-1] += 1
+
+    def snapshot(self):
+        stats = self.stats.get_stats()
+        elapsed = time.monotonic() - self.started_at
+        items = stats.get('item_scraped_count', 0)
+        return {
+            'company': getattr(self.spider, 'company_name', self.spider.name),
+            'type': getattr(self.spider, 'scraper_type', None),
+            'elapsed': round(elapsed, 3),
+            'requests': stats.get('downloader/request_count', 0),
+            'responses': self.responses,
+            'cached_responses': self.cached_responses,
+            'bytes': self.bytes,
+            'items': items,
+            'items_per_second': round(items / elapsed, 3) if elapsed > 0 else 0.0,
+            'errors': stats.get('log_count/ERROR', 0),
+            'response_time': {
+                'buckets': dict(zip([str(b) for b in LATENCY_BUCKETS] + ['+Inf'], self.latency_counts)),
+                'count': sum(self.latency_counts),
+                'sum': round(self.latency_sum, 6),
+            },
+            'stages': stage_times(stats),
+        }
+
+    def emit(self, event, **extra):
+        data = {'event': event, 'time': time.time(), **self.snapshot(), **extra}
+        with _snapshots_lock:
+            _snapshots[data['company']] = data
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(data) + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write crawl metrics to {self.path}: {e}")
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def prometheus_text(snapshots):
+    """Renders snapshots in the Prometheus text exposition format."""
+    lines = []
+
+    def metric(name, kind, helptext, samples):
+        """`samples` are (series suffix, labels, value); the histogram's series are _bucket, _sum and _count."""
+        lines.append(f"# HELP product_scraper_{name} {helptext}")
+        lines.append(f"# TYPE product_scraper_{name} {kind}")
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f"product_scraper_{name}{suffix}{{{label_text}}} {value}")
+
+    def per_company(field):
+        return [('', {'company': s['company']}, s[field]) for s in snapshots]
+
+    metric('requests_total', 'counter', 'Requests sent to the downloader.', per_company('requests'))
+    metric('responses_total', 'counter', 'Responses downloaded from the network.', per_company('responses'))
+    metric('cached_responses_total', 'counter', 'Responses served by the response cache.', per_company('cached_responses'))
+    metric('response_bytes_total', 'counter', 'Body bytes downloaded from the network.', per_company('bytes'))
+    metric('items_total', 'counter', 'Items scraped.', per_company('items'))
+    metric('items_per_second', 'gauge', 'Items scraped per second since the crawl started.', per_company('items_per_second'))
+    metric('errors_total', 'counter', 'Errors logged.', per_company('errors'))
+    histogram = []
+    for s in snapshots:
+        cumulative = 0
+        for bound, count in s['response_time']['buckets'].items():
+            cumulative += count
+            histogram.append(('_bucket', {'company': s['company'], 'le': bound}, cumulative))
+        histogram.append(('_sum', {'company': s['company']}, s['response_time']['sum']))
+        histogram.append(('_count', {'company': s['company']}, s['response_time']['count']))
+    metric('response_seconds', 'histogram', 'Download latency of network responses.', histogram)
+    stages = [(s['company'], stage, times) for s in snapshots for stage, times in sorted(s['stages'].items())]
+    metric('stage_seconds_total', 'counter', 'Time spent in each crawl stage (parser helpers, DB flushes).',
+           [('', {'company': c, 'stage': stage}, t.get('seconds', 0)) for c, stage, t in stages])
+    metric('stage_calls_total', 'counter', 'Calls of each crawl stage.',
+           [('', {'company': c, 'stage': stage}, t.get('calls', 0)) for c, stage, t in stages])
+    metric('stage_max_seconds', 'gauge', 'Slowest single call of each crawl stage.',
+           [('', {'company': c, 'stage': stage}, t.get('max_seconds', 0)) for c, stage, t in stages])
+    return "\n".join(lines) + "\n"
+
+
+def start_endpoint(port):
+    """Serves /metrics for every crawl in this process; started once, by the first crawl that asks."""
+    global _endpoint
+    if _endpoint is not None:
+        return
+    from twisted.internet import reactor
+    from twisted.web import resource, server
+
+    class MetricsResource(resource.Resource):
+        isLeaf = True
+
+        def render_GET(self, request):
+            with _snapshots_lock:
+                snapshots = sorted(_snapshots.values(), key=lambda s: s['company'])
+            request.setHeader(b'Content-Type', b'text/plain; version=0.0.4; charset=utf-8')
+            return prometheus_text(snapshots).encode('utf-8')
+
+    root = resource.Resource()
+    root.putChild(b'metrics', MetricsResource())
+    _endpoint = reactor.listenTCP(port, server.Site(root), interface='127.0.0.1')
+    logger.info(f"Serving crawl metrics at http://127.0.0.1:{port}/metrics")
+
+
+class SpiderProfiler:
+    """
+    Profiles one crawl with cProfile or pyinstrument (PROFILER setting) and writes the result
+    to PROFILE_DIR: <company>.prof for cProfile (open with `python -m pstats` or snakeviz),
+    <company>.html for pyinstrument. Profilers see the whole process, so when several
+    companies are crawled at once only the first one is profiled; use --max-concurrent 1
+    to profile each company on its own.
+    """
+    active = None
+
+    def __init__(self, crawler, kind, directory):
+        self.crawler = crawler
+        self.kind = kind
+        self.directory = directory
+        self.profiler = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        kind = (crawler.settings.get('PROFILER') or '').lower()
+        if not kind:
+            raise NotConfigured
+        if kind not in ('cprofile', 'pyinstrument'):
+            raise NotConfigured(f"Unknown PROFILER {kind!r}; use 'cprofile' or 'pyinstrument'.")
+        if kind == 'pyinstrument':
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                raise NotConfigured("PROFILER = 'pyinstrument' requires pyinstrument (pip install pyinstrument).")
+        extension = cls(crawler, kind, crawler.settings.get('PROFILE_DIR'))
+        crawler.signals.connect(extension.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(extension.spider_closed, signal=signals.spider_closed)
+        return extension
+
+    def spider_opened(self, spider):
+        if SpiderProfiler.active is not None:
+            spider.logger.info(f"Not profiling {spider.company_name}: another crawl is already being profiled.")
+            return
+        SpiderProfiler.active = self
+        if self.kind == 'cprofile':
+            import cProfile
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            from pyinstrument import Profiler
+            self.profiler = Profiler(async_mode='disabled')
+            self.profiler.start()
+
+    def spider_closed(self, spider, reason):
+        if SpiderProfiler.active is not self:
+            return
+        SpiderProfiler.active = None
+        from jobs import job_slug
+        os.makedirs(self.directory, exist_ok=True)
+        if self.kind == 'cprofile':
+            self.profiler.disable()
+            path = os.path.join(self.directory, f"{job_slug(spider.company_name)}.prof")
+            self.profiler.dump_stats(path)
+        else:
+            self.profiler.stop()
+            path = os.path.join(self.directory, f"{job_slug(spider.company_name)}.html")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(self.profiler.output_html())
+        spider.logger.info(f"Profile of {spider.company_name} written to {path}")
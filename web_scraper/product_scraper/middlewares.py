@@ -0,0 +1,423 @@
+# Define here the models for your spider and downloader middlewares
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
+
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+
+
+class ResponseCacheStore:
+    """
+    A compact on-disk response cache: one SQLite table keyed by URL, with zlib-compressed
+    bodies, the validators needed for conditional requests, and LRU eviction by total size.
+    Each entry records the extractor version (`version`) its body was last parsed with, once
+    the items parsed from it are written (confirm()); until then it is NULL.
+    """
+
+    def __init__(self, path, max_bytes, version=''):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = version
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            status INTEGER,
+            headers TEXT,
+            body BLOB,
+            etag TEXT,
+            last_modified TEXT,
+            stored_at REAL,
+            last_used REAL,
+            size INTEGER,
+            extractor_version TEXT
+        )
+        """)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(responses)")}
+        if 'extractor_version' not in columns:
+            self.conn.execute("ALTER TABLE responses ADD COLUMN extractor_version TEXT")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    def get(self, url):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT status, headers, body, etag, last_modified, stored_at, extractor_version FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, headers, body, etag, last_modified, stored_at, version = row
+        return {
+            'status': status,
+            'headers': json.loads(headers),
+            'body': zlib.decompress(body),
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored_at': stored_at,
+            'version': version,
+        }
+
+    def put(self, url, status, headers, body, etag, last_modified):
+        compressed = zlib.compress(body, 6)
+        encoded_headers = json.dumps(headers)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                (url, status, encoded_headers, compressed, etag, last_modified, now, now,
+                 len(compressed) + len(encoded_headers))
+            )
+
+    def touch(self, url, revalidated=False):
+        """Marks an entry as used. A successful revalidation also restarts its freshness period."""
+        now = time.time()
+        with self.lock:
+            if revalidated:
+                self.conn.execute("UPDATE responses SET last_used = ?, stored_at = ? WHERE url = ?", (now, now, url))
+            else:
+                self.conn.execute("UPDATE responses SET last_used = ? WHERE url = ?", (now, url))
+
+    def confirm(self, urls):
+        """Marks entries as parsed by the current extractor version, once their items are written."""
+        with self.lock:
+            self.conn.execute("BEGIN")
+            self.conn.executemany("UPDATE responses SET extractor_version = ? WHERE url = ?",
+                                  [(self.version, url) for url in urls])
+            self.conn.execute("COMMIT")
+
+    def evict(self):
+        """Deletes the least recently used entries until the cache fits in max_bytes. Returns the number removed."""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            doomed = []
+            for url, size in self.conn.execute("SELECT url, size FROM responses ORDER BY last_used"):
+                if total <= self.max_bytes:
+                    break
+                doomed.append((url,))
+                total -= size
+            self.conn.execute("BEGIN")
+            self.conn.executemany("DELETE FROM responses WHERE url = ?", doomed)
+            self.conn.execute("COMMIT")
+            return len(doomed)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class ConditionalCacheMiddleware:
+    """
+    Caches GET responses and revalidates them with If-None-Match / If-Modified-Since.
+
+    A cached response younger than the company's TTL (spider attribute `cache_ttl`,
+    else RESPONSE_CACHE_DEFAULT_TTL) is served without touching the network. Older
+    entries are revalidated. On a 304 the cached body is returned, and both kinds of
+    cache hit carry the 'unchanged' flag so callbacks can skip re-parsing content
+    that is already in the database. That is only known for entries confirmed by the
+    extractor's pages_persisted signal, sent once a page's items are written: entries
+    never confirmed (the crawl stopped before its items were flushed), entries last
+    parsed under an older EXTRACTOR_VERSION, so changed extraction rules reach every
+    page once, and requests with meta['cache_reparse'] get cache hits without the flag.
+
+    It sits just before HttpCompressionMiddleware, so bodies are stored decoded.
+    """
+
+    def __init__(self, crawler, store):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.store = store
+        self.default_ttl = crawler.settings.getfloat('RESPONSE_CACHE_DEFAULT_TTL', 0)
+        self.stores_since_eviction = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('RESPONSE_CACHE_ENABLED'):
+            raise NotConfigured
+        from product_scraper.extraction import EXTRACTOR_VERSION
+        store = ResponseCacheStore(settings.get('RESPONSE_CACHE_DB'),
+                                   settings.getint('RESPONSE_CACHE_MAX_BYTES', 200 * 1024 * 1024), EXTRACTOR_VERSION)
+        middleware = cls(crawler, store)
+        from scrapy import signals
+        from product_scraper.extractors.base import pages_persisted
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(middleware.pages_persisted, signal=pages_persisted)
+        return middleware
+
+    def pages_persisted(self, urls):
+        self.store.confirm(urls)
+
+    def spider_closed(self, spider):
+        evicted = self.store.evict()
+        if evicted:
+            self.stats.inc_value('response_cache/evicted', evicted)
+        self.store.close()
+
+    def is_cacheable(self, request):
+        return (request.method == 'GET'
+                and not request.meta.get('dont_cache')
+                and not request.meta.get('playwright'))
+
+    def spider_ttl(self, spider):
+        ttl = getattr(spider, 'cache_ttl', None)
+        try:
+            return float(ttl) if ttl not in (None, '') else self.default_ttl
+        except (TypeError, ValueError):
+            return self.default_ttl
+
+    def process_request(self, request, spider):
+        if not self.is_cacheable(request):
+            return None
+        entry = self.store.get(request.url)
+        if entry is None:
+            self.stats.inc_value('response_cache/miss')
+            return None
+        if time.time() - entry['stored_at'] < self.spider_ttl(spider):
+            self.stats.inc_value('response_cache/fresh_hit')
+            self.store.touch(request.url)
+            return self.build_response(request, entry)
+        if entry['etag']:
+            request.headers['If-None-Match'] = entry['etag']
+        if entry['last_modified']:
+            request.headers['If-Modified-Since'] = entry['last_modified']
+        if entry['etag'] or entry['last_modified']:
+            request.meta['_response_cache_entry'] = entry
+        return None
+
+    def process_response(self, request, response, spider):
+        if not self.is_cacheable(request) or 'unchanged' in response.flags:
+            return response
+        entry = request.meta.pop('_response_cache_entry', None)
+        if response.status == 304 and entry is not None:
+            self.stats.inc_value('response_cache/not_modified')
+            self.store.touch(request.url, revalidated=True)
+            return self.build_response(request, entry)
+        if response.status == 200:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            headers = {
+                key.decode('latin1'): [value.decode('latin1') for value in values]
+                for key, values in response.headers.items()
+                if key.lower() not in (b'content-encoding', b'content-length', b'set-cookie')
+            }
+            self.store.put(request.url, response.status, headers, response.body,
+                           etag.decode('latin1') if etag else None,
+                           last_modified.decode('latin1') if last_modified else None)
+            self.stats.inc_value('response_cache/store')
+            self.stores_since_eviction += 1
+            if self.stores_since_eviction >= 500:
+                self.stores_since_eviction = 0
+                self.store.evict()
+        return response
+
+    def build_response(self, request, entry):
+        headers = Headers(entry['headers'])
+        respcls = responsetypes.from_args(headers=headers, url=request.url, body=entry['body'])
+        reparse = request.meta.get('cache_reparse') or entry['version'] != self.store.version
+        flags = ['cached'] if reparse else ['cached', 'unchanged']
+        return respcls(url=request.url, status=entry['status'], headers=headers, body=entry['body'],
+                       request=request, flags=flags)
+
+
+class TokenBucket:
+    """
+    Request budget for one domain: `rate` tokens per second accumulate up to `burst`, and each
+    request spends one. The rate adapts AIMD-style: it creeps up while responses are fast and
+    is halved on 429/503 or slow responses. Retry-After pauses the bucket altogether.
+    """
+
+    def __init__(self, rate, burst, min_rate, max_rate):
+        self.min_rate = min_rate
+        self.max_rate = max(min_rate, max_rate)
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def configure(self, rate=None, burst=None, min_rate=None, max_rate=None):
+        if min_rate is not None:
+            self.min_rate = min_rate
+        if max_rate is not None:
+            self.max_rate = max(self.min_rate, max_rate)
+        if burst is not None:
+            self.burst = max(1.0, burst)
+        if rate is not None:
+            self.rate = rate
+        self.rate = min(max(self.rate, self.min_rate), self.max_rate)
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self):
+        """Spends a token and returns how many seconds the caller must wait before sending."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens -= 1
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    def speed_up(self, step):
+        self.rate = min(self.max_rate, self.rate + step)
+
+    def slow_down(self, factor=0.5):
+        self.rate = max(self.min_rate, self.rate * factor)
+
+    def pause(self, seconds):
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+        self.paused_until = max(self.paused_until, now + seconds)
+
+
+# Buckets are per domain and shared by every crawler in the process, so what one
+# company's crawl learned about a host carries over to the next crawl of it
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(domain, rate, burst, min_rate, max_rate):
+    with _buckets_lock:
+        bucket = _buckets.get(domain)
+        if bucket is None:
+            bucket = _buckets[domain] = TokenBucket(rate, burst, min_rate, max_rate)
+        return bucket
+
+
+class AdaptiveThrottleMiddleware:
+    """
+    Spaces requests to each domain with a TokenBucket fed by what the server tells us: download
+    latency above THROTTLE_TARGET_LATENCY or a 429/503 lowers the rate, fast responses raise it,
+    and Retry-After pauses the domain. Defaults come from the THROTTLE_* settings; a company can
+    override them with the `start_rate`, `max_rate` and `burst` columns in companies.csv.
+
+    Waiting happens per domain, so one slow host never holds back requests to the others.
+    Responses served from the response cache never reach the network and cost no token.
+    """
+
+    BACKOFF_STATUSES = (429, 503)
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.start_rate = settings.getfloat('THROTTLE_START_RATE', 1.0)
+        self.min_rate = settings.getfloat('THROTTLE_MIN_RATE', 0.2)
+        self.max_rate = settings.getfloat('THROTTLE_MAX_RATE', 8.0)
+        self.burst = settings.getfloat('THROTTLE_BURST', 2.0)
+        self.rate_step = settings.getfloat('THROTTLE_RATE_STEP', 0.25)
+        self.target_latency = settings.getfloat('THROTTLE_TARGET_LATENCY', 1.0)
+        self.max_retry_after = settings.getfloat('THROTTLE_MAX_RETRY_AFTER', 300)
+        self.configured = set()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('THROTTLE_ENABLED'):
+            raise NotConfigured
+        middleware = cls(crawler)
+        from scrapy import signals
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def spider_policy(self, spider):
+        """The company's overrides from companies.csv, falling back to the THROTTLE_* settings."""
+        def value(name, default):
+            try:
+                raw = getattr(spider, name, None)
+                return float(raw) if raw not in (None, '') else default
+            except (TypeError, ValueError):
+                return default
+        return {
+            'rate': value('start_rate', self.start_rate),
+            'burst': value('burst', self.burst),
+            'min_rate': self.min_rate,
+            'max_rate': value('max_rate', self.max_rate),
+        }
+
+    def bucket_for(self, request, spider):
+        domain = urlparse_cached(request).hostname or ''
+        policy = self.spider_policy(spider)
+        bucket = get_bucket(domain, **policy)
+        if domain not in self.configured:
+            # The first request of this crawl applies the company's limits to the shared bucket
+            self.configured.add(domain)
+            bucket.configure(burst=policy['burst'], max_rate=policy['max_rate'])
+        return domain, bucket
+
+    async def process_request(self, request, spider):
+        if request.meta.get('dont_throttle'):
+            return None
+        domain, bucket = self.bucket_for(request, spider)
+        wait = bucket.reserve()
+        if wait > 0:
+            self.stats.inc_value('throttle/delayed')
+            self.stats.inc_value('throttle/wait_seconds', wait)
+            from twisted.internet import reactor
+            from twisted.internet.task import deferLater
+            from scrapy.utils.defer import maybe_deferred_to_future
+            await maybe_deferred_to_future(deferLater(reactor, wait, lambda: None))
+        request.meta['_throttle_domain'] = domain
+        return None
+
+    def process_response(self, request, response, spider):
+        domain = request.meta.pop('_throttle_domain', None)
+        if domain is None or 'cached' in response.flags:
+            return response
+        bucket = _buckets[domain]
+        if response.status in self.BACKOFF_STATUSES:
+            bucket.slow_down()
+            retry_after = self.retry_after_seconds(response)
+            if retry_after:
+                bucket.pause(min(retry_after, self.max_retry_after))
+            self.stats.inc_value(f'throttle/backoff/{response.status}')
+        else:
+            latency = request.meta.get('download_latency')
+            if latency is not None and latency > self.target_latency:
+                bucket.slow_down(max(0.5, self.target_latency / latency))
+            else:
+                bucket.speed_up(self.rate_step)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        domain = request.meta.pop('_throttle_domain', None)
+        if domain is not None:
+            # Timeouts and refused connections usually mean the server is struggling
+            _buckets[domain].slow_down()
+            self.stats.inc_value('throttle/backoff/exception')
+        return None
+
+    @staticmethod
+    def retry_after_seconds(response):
+        """Parses Retry-After as seconds or an HTTP date; returns None if absent or invalid."""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        value = value.decode('latin1').strip()
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def spider_closed(self, spider):
+        for domain in self.configured:
+            bucket = _buckets.get(domain)
+            if bucket is not None:
+                self.stats.set_value(f'throttle/final_rate/{domain}', round(bucket.rate, 3))
@@ -1,25 +1,110 @@
 import sys
 import os
-import threading
+import sqlite3
+
+from twisted.internet import task
 
 # Add the parent directory to the path to allow importing the database module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 import database
+from product_scraper.metrics import record_duration
 
 class DatabasePipeline:
+    def __init__(self, batch_size=500, flush_interval_ms=1000, write_mode='staging', checkpoint_interval=10, stats=None):
+        self.batch_size = batch_size
+        self.flush_interval_ms = flush_interval_ms
+        # 'staging': write to a per-spider database and merge it into scraper.db on close,
+        # so concurrent crawl processes do not fight over the main database's lock.
+        # 'direct': write straight to scraper.db (fine when all spiders share one process).
+        self.write_mode = write_mode
+        self.staging_file = None
+        # Seconds between checkpoints: job checkpoints for spiders run with a job directory,
+        # and the pages whose items are written for every spider
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_loop = None
+        # Crawl stats that DB flush latency is recorded in (when METRICS_ENABLED)
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(
+            batch_size=crawler.settings.getint('DB_BATCH_SIZE', 500),
+            flush_interval_ms=crawler.settings.getint('DB_FLUSH_INTERVAL_MS', 1000),
+            write_mode=crawler.settings.get('DB_WRITE_MODE', 'staging'),
+            checkpoint_interval=crawler.settings.getfloat('JOB_CHECKPOINT_INTERVAL', 10),
+            stats=crawler.stats if crawler.settings.getbool('METRICS_ENABLED') else None,
+        )
+
     def open_spider(self, spider):
         """
         This method is called when the spider is opened.
         """
-        self.db_lock = threading.Lock()
         # Ensure the table is created before any spider starts running
         database.create_table()
-        spider.logger.info("Database pipeline opened.")
+        if self.write_mode == 'staging':
+            self.staging_file = database.create_staging_database(getattr(spider, 'company_name', spider.name))
+        self.writer = database.BatchWriter(self.batch_size, self.flush_interval_ms, db_file=self.staging_file,
+                                           on_flush=self.flushed if self.stats is not None else None)
+        self.items_queued = 0
+        job = getattr(spider, 'job', None)
+        # A resumed job keeps counting from its last checkpoint
+        self.items_before = job.state.get('items_written', 0) if job is not None else 0
+        if self.checkpoint_interval > 0:
+            self.checkpoint_loop = task.LoopingCall(self.checkpoint, spider)
+            self.checkpoint_loop.start(self.checkpoint_interval, now=False)
+        spider.logger.info(f"Database pipeline opened ({self.write_mode} mode).")
+
+    def flushed(self, seconds, rows):
+        record_duration(self.stats, 'db_flush', seconds)
+        self.stats.inc_value('stage/db_flush/rows', rows)
+
+    def checkpoint(self, spider):
+        """
+        Saves the job's crawl position (for spiders run with a job) and tells the extractor
+        which pages are done. Both are read before the flush, so every item they cover has
+        already been queued and is on disk once the flush returns.
+        If the flush fails, nothing is recorded and the next checkpoint tries again.
+        """
+        extractor = getattr(spider, 'extractor', None)
+        position = extractor.checkpoint() if extractor is not None else {}
+        completed = extractor.take_completed() if extractor is not None else []
+        items = self.items_queued
+        try:
+            self.writer.flush()
+        except sqlite3.Error as e:
+            if extractor is not None:
+                extractor.completed[:0] = completed
+            spider.logger.warning(f"Checkpoint skipped, {self.writer.pending()} items are not written yet: {e}")
+            return
+        if getattr(spider, 'job', None) is not None:
+            spider.job.checkpoint(position, self.items_before + items)
+        if completed:
+            extractor.persisted(completed)
 
     def close_spider(self, spider):
         """
         This method is called when the spider is closed.
+        It writes whatever is still buffered and merges the staging database, if any.
         """
+        if self.checkpoint_loop is not None:
+            self.checkpoint_loop.stop()
+        self.checkpoint(spider)
+        try:
+            self.writer.close()
+        except sqlite3.Error as e:
+            # The crawl counts as failed, so its job resumes from the last checkpoint that was written
+            unwritten = self.writer.pending()
+            spider.logger.error(f"Could not write {unwritten} items to the database: {e}")
+            spider.crawler.stats.set_value('database/items_unwritten', unwritten)
+        if self.write_mode != 'staging':
+            spider.crawler.stats.set_value('database/items_written', self.writer.written)
+            spider.crawler.stats.set_value('database/items_unchanged', self.writer.unchanged)
+        if self.staging_file:
+            merged = database.merge_staging_database(self.staging_file)
+            if merged is None:
+                spider.logger.error(f"Could not merge {self.staging_file}; it will be merged on a later run.")
+            else:
+                spider.logger.info(f"Merged {merged} staged items into the database.")
         spider.logger.info("Database pipeline closed.")
 
     def process_item(self, item, spider):
@@ -60,7 +145,8 @@ class DatabasePipeline:
             "Notes": product_data.get("notes"),
         }
 
-        database.upsert_product(db_data, self.db_lock)
-        spider.logger.debug(f"Upserted item to DB: {item['product_name']}")
+        self.writer.add_product(db_data, product_data.get("source_updated_at"), product_data.get("variant_id"))
+        self.items_queued += 1
+        spider.logger.debug(f"Queued item for DB: {item['product_name']}")
 
         return item
@@ -0,0 +1,141 @@
+import itertools
+import time
+from urllib.parse import urlparse
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from scrapy.utils.defer import deferred_from_coro
+
+# Chromium exposes the page's JS heap; other browsers return null
+JS_HEAP_SCRIPT = "() => (performance.memory ? performance.memory.usedJSHeapSize : null)"
+
+
+def configure_playwright(settings):
+    """
+    Tunes the Playwright download handler before it is built (called from
+    ProductSpider.from_crawler): PLAYWRIGHT_POOL_SIZE contexts are launched at startup
+    and no others are created, and requests for blocked resource types and domains are aborted.
+    """
+    pool_size = max(1, settings.getint('PLAYWRIGHT_POOL_SIZE', 2))
+    context_kwargs = settings.getdict('PLAYWRIGHT_CONTEXT_KWARGS')
+    settings.set('PLAYWRIGHT_CONTEXTS', {name: dict(context_kwargs) for name in context_names(pool_size)},
+                 priority='spider')
+    settings.set('PLAYWRIGHT_MAX_CONTEXTS', pool_size, priority='spider')
+    blocker = ResourceBlocker(settings.getlist('PLAYWRIGHT_BLOCKED_RESOURCE_TYPES'),
+                              settings.getlist('PLAYWRIGHT_BLOCKED_DOMAINS'))
+    if blocker:
+        settings.set('PLAYWRIGHT_ABORT_REQUEST', blocker, priority='spider')
+
+
+def close_page(request):
+    """Closes the Playwright page a failed request kept open; returns a Deferred, or None if there is none."""
+    page = request.meta.pop('playwright_page', None)
+    return deferred_from_coro(page.close()) if page is not None else None
+
+
+def context_names(pool_size):
+    return [f"render-{i}" for i in range(pool_size)]
+
+
+class ResourceBlocker:
+    """
+    PLAYWRIGHT_ABORT_REQUEST callable: aborts sub-requests whose resource type is blocked
+    (images, fonts, stylesheets, media) or whose host is a blocked domain or a subdomain of one.
+    The page's own document request is never aborted.
+    """
+
+    def __init__(self, resource_types, domains):
+        self.resource_types = frozenset(resource_types)
+        self.domains = tuple(d.lower().lstrip('.') for d in domains)
+
+    def __bool__(self):
+        return bool(self.resource_types or self.domains)
+
+    def __call__(self, request):
+        if request.resource_type == 'document' and request.is_navigation_request():
+            return False
+        if request.resource_type in self.resource_types:
+            return True
+        host = (urlparse(request.url).hostname or '').lower()
+        return any(host == domain or host.endswith('.' + domain) for domain in self.domains)
+
+
+class RenderPool:
+    """
+    Hands out Playwright request meta for the startup contexts in turn, and measures the
+    rendering: pages rendered per context, the largest JS heap seen in each, and overall
+    pages/second from the first render request to the last rendered response.
+
+    Navigation returns at PLAYWRIGHT_WAIT_UNTIL with the page still open, and settle() waits
+    for the wait selector in the callback. scrapy-playwright waits for the full page load
+    after every PageMethod, so the wait is deliberately not one.
+    """
+
+    def __init__(self, settings, stats, wait_selector=None):
+        self.stats = stats
+        self.contexts = context_names(max(1, settings.getint('PLAYWRIGHT_POOL_SIZE', 2)))
+        self._next_context = itertools.cycle(self.contexts)
+        self.wait_selector = settings.get('PLAYWRIGHT_WAIT_SELECTOR') or wait_selector
+        self.wait_timeout_ms = settings.getint('PLAYWRIGHT_WAIT_TIMEOUT_MS', 10000)
+        self.wait_until = settings.get('PLAYWRIGHT_WAIT_UNTIL', 'domcontentloaded')
+        self.started_at = None
+        self.finished_at = None
+        self.pages = 0
+        self.heap_peaks = {}
+
+    def meta(self):
+        if self.started_at is None:
+            self.started_at = time.monotonic()
+        return {
+            'playwright': True,
+            'playwright_context': next(self._next_context),
+            'playwright_page_goto_kwargs': {'wait_until': self.wait_until},
+            # The callback gets the open page and must close it (settle(), or close_page() on errors)
+            'playwright_include_page': True,
+        }
+
+    async def settle(self, response):
+        """
+        Waits for the wait selector on the response's page (a page without it, such as an empty
+        last listing page, is taken as it is once the timeout passes), records the rendering and
+        closes the page. Returns (the response with the page's HTML at that point, whether the
+        selector appeared).
+        """
+        page = response.meta.pop('playwright_page', None)
+        if page is None:
+            return response, True
+        found = True
+        try:
+            if self.wait_selector:
+                try:
+                    await page.wait_for_selector(self.wait_selector, state='attached', timeout=self.wait_timeout_ms)
+                except PlaywrightTimeoutError:
+                    found = False
+            heap = await page.evaluate(JS_HEAP_SCRIPT)
+            body = await page.content()
+        finally:
+            await page.close()
+        self.rendered(response.meta.get('playwright_context', 'default'), heap, found)
+        return response.replace(body=body, encoding='utf-8'), found
+
+    def rendered(self, context, heap, found):
+        self.finished_at = time.monotonic()
+        self.pages += 1
+        self.stats.inc_value(f'playwright/pool/{context}/pages')
+        if heap:
+            self.heap_peaks[context] = max(self.heap_peaks.get(context, 0), heap)
+            self.stats.max_value(f'playwright/pool/{context}/js_heap_max_mb', round(heap / 2 ** 20, 1))
+        if not found:
+            self.stats.inc_value('playwright/wait_selector_missing')
+
+    @property
+    def pages_per_second(self):
+        if not self.pages or self.started_at is None:
+            return 0.0
+        return self.pages / max(self.finished_at - self.started_at, 1e-3)
+
+    def summary(self):
+        """One log line: throughput and each context's peak JS heap."""
+        self.stats.set_value('playwright/pages_per_second', round(self.pages_per_second, 2))
+        heaps = ', '.join(f"{context} {peak / 2 ** 20:.0f} MB" for context, peak in sorted(self.heap_peaks.items()))
+        return (f"Rendered {self.pages} pages at {self.pages_per_second:.2f} pages/s "
+                f"across {len(self.contexts)} contexts" + (f" (peak JS heap: {heaps})" if heaps else ""))
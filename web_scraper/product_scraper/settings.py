@@ -7,6 +7,8 @@
 #     https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
 #     https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import os
+
 BOT_NAME = "product_scraper"
 
 SPIDER_MODULES = ["product_scraper.spiders"]
@@ -23,8 +25,11 @@ ROBOTSTXT_OBEY = True
 
 # Concurrency and throttling settings
 #CONCURRENT_REQUESTS = 16
-CONCURRENT_REQUESTS_PER_DOMAIN = 1
-DOWNLOAD_DELAY = 1
+# Requests are spaced by AdaptiveThrottleMiddleware (see THROTTLE_* below) rather than a fixed
+# delay; set DOWNLOAD_DELAY again if you disable it. A company's `concurrency` column in
+# companies.csv overrides the per-domain limit.
+CONCURRENT_REQUESTS_PER_DOMAIN = 4
+DOWNLOAD_DELAY = 0
 
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
@@ -46,15 +51,19 @@ DOWNLOAD_DELAY = 1
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "product_scraper.middlewares.ProductScraperDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    # Just before HttpCompressionMiddleware (590), so cached bodies are stored decoded
+    "product_scraper.middlewares.ConditionalCacheMiddleware": 585,
+    # After the cache, so cache hits spend no token; sees responses before RetryMiddleware (550)
+    "product_scraper.middlewares.AdaptiveThrottleMiddleware": 600,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    "product_scraper.metrics.CrawlMetrics": 500,
+    "product_scraper.metrics.SpiderProfiler": 510,
+}
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -62,6 +71,42 @@ ITEM_PIPELINES = {
    "product_scraper.pipelines.DatabasePipeline": 300,
 }
 
+# Items are written to scraper.db in batches of DB_BATCH_SIZE, or every
+# DB_FLUSH_INTERVAL_MS milliseconds, whichever comes first
+DB_BATCH_SIZE = 500
+DB_FLUSH_INTERVAL_MS = 1000
+# 'staging' gives each spider its own database, merged into scraper.db when it closes;
+# 'direct' writes to scraper.db through one shared connection (used by crawl_runner.py)
+DB_WRITE_MODE = "staging"
+
+# crawl_runner.py runs every company as a job (see jobs.py) whose directory holds the Scrapy
+# JOBDIR and a checkpoint of the crawl position, saved every JOB_CHECKPOINT_INTERVAL seconds
+# right after buffered items are flushed. `crawl_runner.py --resume` continues from there.
+# Pages only count as done in the URL frontier and the response cache at these checkpoints.
+JOB_CHECKPOINT_INTERVAL = 10
+
+# Number of worker processes used to parse product HTML off the reactor thread
+# (0 parses inline); products are sent to workers in chunks of EXTRACTION_CHUNK_SIZE.
+# One pool, sized by the first crawl that uses it, serves every crawl in the process
+EXTRACTION_WORKERS = 0
+EXTRACTION_CHUNK_SIZE = 25
+
+# Adaptive per-domain throttling (AdaptiveThrottleMiddleware). Each domain gets a token
+# bucket starting at THROTTLE_START_RATE requests/second with bursts of THROTTLE_BURST.
+# The rate rises by THROTTLE_RATE_STEP after every response faster than
+# THROTTLE_TARGET_LATENCY seconds, up to THROTTLE_MAX_RATE. It drops on slow responses,
+# 429/503 and connection errors, down to THROTTLE_MIN_RATE. Retry-After pauses the domain
+# for up to THROTTLE_MAX_RETRY_AFTER seconds. The `start_rate`, `max_rate` and `burst`
+# columns in companies.csv override the defaults per company.
+THROTTLE_ENABLED = True
+THROTTLE_START_RATE = 1.0
+THROTTLE_MIN_RATE = 0.2
+THROTTLE_MAX_RATE = 8.0
+THROTTLE_BURST = 2
+THROTTLE_RATE_STEP = 0.25
+THROTTLE_TARGET_LATENCY = 1.0
+THROTTLE_MAX_RETRY_AFTER = 300
+
 # Enable and configure the AutoThrottle extension (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/autothrottle.html
 #AUTOTHROTTLE_ENABLED = True
@@ -75,6 +120,25 @@ ITEM_PIPELINES = {
 # Enable showing throttling stats for every response received:
 #AUTOTHROTTLE_DEBUG = False
 
+# Conditional response cache (see ConditionalCacheMiddleware). Responses are kept in
+# RESPONSE_CACHE_DB and revalidated with ETag/Last-Modified on later crawls. A cached
+# response younger than the company's `cache_ttl` column in companies.csv (seconds,
+# else RESPONSE_CACHE_DEFAULT_TTL) is reused without a request. Unchanged pages are not
+# re-parsed, so disable the cache to force a full re-import into a fresh database.
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "httpcache.db")
+RESPONSE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+RESPONSE_CACHE_DEFAULT_TTL = 0
+
+# Persistent URL frontier (product_scraper/frontier.py). URLs discovered from sitemaps and
+# listing pages are kept in FRONTIER_DB across runs: pages whose sitemap <lastmod> has not
+# changed since they were fetched are skipped, and URLs an interrupted crawl never fetched
+# are requested first on the next run. Delete FRONTIER_DB to rediscover everything.
+FRONTIER_ENABLED = True
+FRONTIER_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "frontier.db")
+# URLs whose download failed are retried on later runs until they have failed this many times in a row
+FRONTIER_MAX_ATTEMPTS = 3
+
 # Enable and configure HTTP caching (disabled by default)
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html#httpcache-middleware-settings
 #HTTPCACHE_ENABLED = True
@@ -86,9 +150,69 @@ ITEM_PIPELINES = {
 # Set settings whose default value is deprecated to a future-proof value
 FEED_EXPORT_ENCODING = "utf-8"
 
+# --- Extractors ---
+# Each companies.csv `type` maps to an extractor class (see product_scraper/extractors).
+# Add or override types here as {type: "package.module:Class"}; installed packages can
+# also register them under the "product_scraper.extractors" entry point group.
+EXTRACTORS = {}
+
+# --- Shopify settings ---
+# Products per /products.json page (Shopify's maximum is 250)
+SHOPIFY_PAGE_LIMIT = 250
+# Number of pages requested ahead of the last full page
+SHOPIFY_PAGE_WINDOW = 3
+# Skip products whose updated_at matches the last crawl (also `-a incremental=1`)
+SHOPIFY_INCREMENTAL = False
+
+# --- WooCommerce / Magento / sitemap settings ---
+# Products per Store API page (WooCommerce allows at most 100)
+WOOCOMMERCE_PAGE_SIZE = 100
+# Products per GraphQL `products` page
+MAGENTO_PAGE_SIZE = 100
+# Sitemap URLs matching this regex are fetched as product pages (sitemap and bigcommerce types)
+SITEMAP_PRODUCT_PATTERN = r"/products?/"
+# Sitemap URLs matching this regex are fetched as hotel pages (trekky and playwright types)
+TREKKY_HOTEL_PATTERN = r"/hotels?/"
+
 # --- Playwright settings ---
-DOWNLOAD_HANDLERS = {
+# Only installed as DOWNLOAD_HANDLERS by ProductSpider for extractors with uses_playwright
+# or types listed in PLAYWRIGHT_SCRAPER_TYPES; every other type uses Scrapy's native
+# downloader and never starts Playwright.
+PLAYWRIGHT_DOWNLOAD_HANDLERS = {
     "http": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
     "https": "scrapy_playwright.handler.ScrapyPlaywrightDownloadHandler",
 }
+PLAYWRIGHT_SCRAPER_TYPES = ["playwright"]
+# Browser contexts launched at startup and shared round-robin by rendered requests
+# (PLAYWRIGHT_MAX_CONTEXTS is set to match, so no other context is ever created)
+PLAYWRIGHT_POOL_SIZE = 2
+PLAYWRIGHT_CONTEXT_KWARGS = {"java_script_enabled": True, "viewport": {"width": 1280, "height": 800}}
+PLAYWRIGHT_MAX_PAGES_PER_CONTEXT = 4
+PLAYWRIGHT_LAUNCH_OPTIONS = {"headless": True}
+# Sub-requests aborted during rendering: the page's data arrives through its document and scripts
+PLAYWRIGHT_BLOCKED_RESOURCE_TYPES = ["image", "media", "font", "stylesheet", "texttrack", "eventsource", "websocket", "manifest"]
+PLAYWRIGHT_BLOCKED_DOMAINS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "facebook.net", "hotjar.com", "clarity.ms", "segment.io", "mixpanel.com",
+    "newrelic.com", "nr-data.net", "sentry.io", "intercom.io", "tiktok.com", "snapchat.com",
+]
+# Rendering returns once navigation reaches PLAYWRIGHT_WAIT_UNTIL and the extractor's wait
+# selector (or PLAYWRIGHT_WAIT_SELECTOR, if set) is in the DOM, giving up on the selector
+# after PLAYWRIGHT_WAIT_TIMEOUT_MS
+PLAYWRIGHT_WAIT_UNTIL = "domcontentloaded"
+PLAYWRIGHT_WAIT_SELECTOR = None
+PLAYWRIGHT_WAIT_TIMEOUT_MS = 10000
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
+
+# --- Metrics and profiling ---
+# Per-company metrics (requests, bytes, response time histogram, items/sec, time spent in
+# parser helpers and DB flushes), appended to METRICS_FILE as JSON lines every
+# METRICS_INTERVAL seconds and when each crawl closes
+METRICS_ENABLED = True
+METRICS_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "metrics", "crawl_metrics.jsonl")
+METRICS_INTERVAL = 30
+# Port of a Prometheus text endpoint (http://127.0.0.1:<port>/metrics) for the whole run; None disables it
+METRICS_PROMETHEUS_PORT = None
+# 'cprofile' or 'pyinstrument' profiles each crawl into PROFILE_DIR; None disables profiling
+PROFILER = None
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profiles")
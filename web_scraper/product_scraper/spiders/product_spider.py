@@ -1,46 +1,33 @@
 import scrapy
-import json
-import re
-from product_scraper.items import ProductItem
+import os
+import sys
+from product_scraper import extraction
+from product_scraper.extractors import available_extractors, get_extractor_class
 
-# Helper functions
-def extract_ingredients(body_html):
-    if not body_html:
-        return "", 0
-    from bs4 import BeautifulSoup
-    soup = BeautifulSoup(body_html, 'html.parser')
-    text = soup.get_text(separator=' ', strip=True)
-    match = re.search(r'(Ingredients|Made from|Made with)\s*[:-]?\s*([\w\s,()\[\]\.-]+)', text, re.IGNORECASE)
-    if match:
-        ingredients_str = match.group(2).strip()
-        ingredients_str = re.sub(r'\.?\s*Contains.*', '', ingredients_str, flags=re.IGNORECASE)
-        ingredients_list = [ing.strip() for ing in ingredients_str.split(',') if ing.strip()]
-        return ", ".join(ingredients_list), len(ingredients_list)
-    return "", 0
-
-def parse_weight_from_title(title):
-    match = re.search(r'\((\d+)\s*g\)', title, re.IGNORECASE)
-    if match:
-        return int(match.group(1))
-    return 0
-
-def infer_product_details(title):
-    title_lower = title.lower()
-    segment = "PBM"
-    animal_replicated = "Meat"
-    if "egg" in title_lower or "bhurji" in title_lower:
-        segment = "PBE"
-        animal_replicated = "Egg"
-    elif "unmutton" in title_lower or "mutton" in title_lower:
-        animal_replicated = "Mutton"
-    elif "vegicken" in title_lower or "chicken" in title_lower:
-        animal_replicated = "Chicken"
-    # ... (rest of the function is the same)
-    return segment, "n/a", "n/a"
+# Add the project root to the path to allow importing the database module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 class ProductSpider(scrapy.Spider):
     name = "product_spider"
 
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        # Route downloads through Playwright only for scraper types that need a browser,
+        # so plain JSON/HTML crawls never launch it
+        extractor_cls = get_extractor_class(kwargs.get('type'), crawler.settings)
+        if (extractor_cls is not None and extractor_cls.uses_playwright) \
+                or kwargs.get('type') in crawler.settings.getlist('PLAYWRIGHT_SCRAPER_TYPES'):
+            crawler.settings.set('DOWNLOAD_HANDLERS', crawler.settings.getdict('PLAYWRIGHT_DOWNLOAD_HANDLERS'), priority='spider')
+            from product_scraper.rendering import configure_playwright
+            configure_playwright(crawler.settings)
+        # The `concurrency` column in companies.csv caps parallel requests to this company's domain
+        if str(kwargs.get('concurrency') or '').isdigit() and int(kwargs['concurrency']) > 0:
+            crawler.settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', int(kwargs['concurrency']), priority='spider')
+        # A job directory (see jobs.py) persists the request queue and seen-set across runs
+        if kwargs.get('job_dir'):
+            crawler.settings.set('JOBDIR', os.path.join(kwargs['job_dir'], 'scheduler'), priority='spider')
+        return super(ProductSpider, cls).from_crawler(crawler, *args, **kwargs)
+
     def __init__(self, *args, **kwargs):
         super(ProductSpider, self).__init__(*args, **kwargs)
         self.company_name = kwargs.get('name')
@@ -48,94 +35,70 @@ class ProductSpider(scrapy.Spider):
         self.start_url = kwargs.get('url')
         if not all([self.company_name, self.scraper_type, self.start_url]):
             raise ValueError("Spider must be run with `name`, `type`, and `url` arguments.")
+        # `-a incremental=1` skips Shopify products whose updated_at has not changed since the last crawl
+        self.incremental_arg = kwargs.get('incremental')
+        # Seconds a cached response is reused without revalidation (the `cache_ttl` column in companies.csv)
+        self.cache_ttl = kwargs.get('cache_ttl')
+        # Per-company throttling overrides read by AdaptiveThrottleMiddleware (requests/second and burst size)
+        self.start_rate = kwargs.get('start_rate')
+        self.max_rate = kwargs.get('max_rate')
+        self.burst = kwargs.get('burst')
+        # The platform's BaseExtractor, created in start_requests()
+        self.extractor = None
+        # The jobs.Job this crawl checkpoints to (`-a job_dir=...`), if any
+        self.job = None
+        if kwargs.get('job_dir'):
+            import jobs
+            self.job = jobs.Job(kwargs['job_dir'])
+
+    async def start(self):
+        # Scrapy 2.13+ only calls start(); older versions call start_requests() directly
+        for request in self.start_requests():
+            yield request
 
     def start_requests(self):
-        if self.scraper_type == 'shopify':
-            yield scrapy.Request(f"{self.start_url}/products.json", self.parse_shopify_json)
-        elif self.scraper_type == 'trekky':
-            trekky_url = f"{self.start_url}/cities?city=paris&page=1"
-            yield scrapy.Request(trekky_url, self.parse_trekky_listing)
-        elif self.scraper_type == 'playwright':
-            # For this type, we tell Scrapy to use Playwright via the meta flag
-            yield scrapy.Request(
-                self.start_url,
-                callback=self.parse_playwright_page,
-                meta={"playwright": True}
-            )
-        else:
-            self.logger.error(f"Scraper type '{self.scraper_type}' is not supported for company '{self.company_name}'.")
+        extractor_cls = get_extractor_class(self.scraper_type, self.settings)
+        if extractor_cls is None:
+            self.logger.error(f"Scraper type '{self.scraper_type}' is not supported for company '{self.company_name}'. "
+                              f"Known types: {', '.join(available_extractors(self.settings))}.")
+            return
+        self.extractor = extractor_cls(self)
+        if self.job is not None and self.job.state.get('checkpoint'):
+            self.extractor.restore(self.job.state['checkpoint'])
+            self.logger.info(f"Resuming {self.company_name} from its checkpoint "
+                             f"({self.job.state.get('items_written', 0)} items already written).")
+        yield from self.extractor.start_requests()
 
-    def parse_playwright_page(self, response):
+    async def dispatch(self, response, handler, **kwargs):
         """
-        This parser is used for pages that require JavaScript rendering.
-        The response object here has been processed by Playwright.
-        The structure of the trekky-reviews site is the same across levels,
-        so we can reuse the same parsing logic as the simple 'trekky' type.
+        The callback of every request: hands the response to the extractor method named by
+        `handler`, which may be a plain or an async generator.
         """
-        self.logger.info(f"Successfully rendered and fetched page with Playwright: {response.url}")
-        # The page structure is the same as level2, so we can reuse the listing parser
-        yield from self.parse_trekky_listing(response)
+        result = getattr(self.extractor, handler)(response, **kwargs)
+        if hasattr(result, '__aiter__'):
+            async for output in result:
+                yield output
+        elif result is not None:
+            for output in result:
+                yield output
+        self.extractor.fetched(response)
 
-    def parse_trekky_listing(self, response):
-        self.logger.info(f"Parsing hotel listing on {response.url}")
-        for hotel_link in response.css('.hotel-link'):
-            # When following links from a Playwright response, we don't need to add the meta flag again
-            # unless the linked page also requires special Playwright actions. Here it doesn't.
-            yield response.follow(url=hotel_link, callback=self.parse_trekky_hotel)
-
-    def parse_trekky_hotel(self, response):
-        self.logger.info(f"Parsing hotel details on {response.url}")
-        item = ProductItem()
-        item['brand'] = self.company_name
-        item['product_name'] = response.css('.hotel-name::text').get(default='').strip()
-        email = response.css('.hotel-email::text').get(default='').strip()
-        reviews = response.css('.hotel-review .review-rating::text').getall()
-        review_ratings = [r.strip() for r in reviews]
-        item['notes'] = f"Email: {email}, Reviews: {', '.join(review_ratings)}"
-        item['product_page'] = response.url
-        item['website'] = self.start_url
-        item['last_updated'] = 'n/a'
-        yield item
+    def dispatch_error(self, failure):
+        """
+        The errback of frontier and rendered requests: records that the URL could not be
+        fetched, and closes the Playwright page the request kept open, if any.
+        """
+        self.extractor.failed(failure.request)
+        self.logger.warning(f"Failed to fetch {failure.request.url}: {failure.value!r}")
+        if failure.request.meta.get('playwright_page') is not None:
+            from product_scraper.rendering import close_page
+            return close_page(failure.request)
 
-    def parse_shopify_json(self, response):
-        try:
-            data = json.loads(response.body)
-        except json.JSONDecodeError:
-            self.logger.error(f"Failed to parse JSON from {response.url}")
-            return
-        for product in data.get('products', []):
-            product_url = f"{self.start_url}/products/{product['handle']}"
-            if "(copy)" in product['title'].lower(): continue
-            _, animal_replicated, _ = infer_product_details(product['title'])
-            if animal_replicated == "n/a":
-                self.logger.info(f"Skipping product '{product['title']}' as it does not seem to be a meat analogue.")
-                continue
-            for variant in product.get('variants', []):
-                ingredients, ingredient_count = extract_ingredients(product.get('body_html', ''))
-                weight = variant.get('grams') or parse_weight_from_title(product['title'])
-                pack_size = variant.get('title') if variant.get('title') != 'Default Title' else f"{weight}g" if weight else ""
-                item = ProductItem()
-                item['product_name'] = product['title']
-                item['brand'] = self.company_name
-                # ... (rest of the shopify item population logic is the same)
-                item['segment'], item['positioning'], item['animal_product_replicated'] = "PBM", "Plant-based", "Meat"
-                item['consumption_format'] = "RTC"
-                item['storage_condition'] = "Frozen" if self.company_name == "Blue Tribe" else "Ambient"
-                item['availability'] = "Active" if variant.get('available') else "OOS"
-                item['in_stock'] = 1 if variant.get('available') else 0
-                item['status'] = "Launched"
-                item['price_inr'] = variant.get('price')
-                item['weight'] = weight
-                item['weight_unit'] = "g"
-                item['pack_size'] = pack_size
-                item['distribution_channels'] = "Brand website"
-                item['channel'] = "D2C"
-                item['product_page'] = product_url
-                item['website'] = self.start_url
-                item['source_name'] = f"{self.company_name} Official Website"
-                item['source_links'] = product_url
-                item['ingredients_list'] = ingredients
-                item['ingredient_count'] = ingredient_count
-                item['last_updated'] = product.get('updated_at', '').split('T')[0]
-                item['notes'] = ""
-                yield item
+    def closed(self, reason):
+        if self.extractor is not None:
+            self.extractor.closed(reason)
+        # Persist newly parsed product bodies so the next crawl does not parse them again
+        entries = extraction.drain_new_cache_entries()
+        if entries:
+            import database
+            database.save_extraction_cache(entries)
@@ -0,0 +1,643 @@
+import argparse
+import collections
+import hmac
+import json
+import logging
+import os
+import queue
+import random
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import crawl_runner
+import jobs
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = os.path.join(BASE_DIR, "scheduler_state.json")
+LOG_FILE = os.path.join(BASE_DIR, "logs", "scheduler.log")
+# The control API listens on 127.0.0.1 only; a second daemon cannot bind it and exits
+DEFAULT_PORT = 8710
+# Every request to the control API carries the token the daemon writes here on start,
+# readable only by the user who runs it
+TOKEN_FILE = os.path.join(BASE_DIR, "scheduler_token")
+
+# Optional companies.csv columns: hours between two crawls of a company, and its priority
+# (higher runs first when more companies are due than there are free slots)
+SCHEDULE_COLUMNS = ['frequency_hours', 'priority']
+DEFAULT_FREQUENCY_HOURS = 24.0
+# Each crawl is due within +-JITTER of its frequency, so companies drift apart over the day
+# instead of all coming due together
+DEFAULT_JITTER = 0.1
+# Companies never crawled before are spread over this window (or their frequency, if shorter)
+INITIAL_SPREAD_SECONDS = 3600
+# A company that failed is retried after BACKOFF_BASE_SECONDS, doubled for every further
+# failure in a row and never later than its normal frequency
+BACKOFF_BASE_SECONDS = 900
+# Memory one crawl is expected to need; a crawl only starts if this much is available
+MEMORY_PER_CRAWL_MB = 400
+TICK_SECONDS = 15
+# Enrichment and matching run once no crawl is running, or after this long with crawls
+# still running, so a busy day does not leave the catalog unenriched
+POSTPROCESS_MAX_DELAY_SECONDS = 1800
+EVENT_BUFFER_SIZE = 50000
+
+
+def available_memory_mb():
+    """Memory available to new processes, in MB, or None where it cannot be read."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available // (1024 * 1024)
+    except ImportError:
+        pass
+    try:
+        with open('/proc/meminfo', 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def default_max_concurrent():
+    """One crawl per CPU, fewer if the memory available would not hold that many crawls."""
+    cap = os.cpu_count() or 1
+    memory = available_memory_mb()
+    if memory is not None:
+        cap = min(cap, memory // MEMORY_PER_CRAWL_MB)
+    return max(1, cap)
+
+
+def company_plan(company):
+    """(frequency in seconds, priority) from a company's optional schedule columns."""
+    try:
+        frequency = float(company.get('frequency_hours') or DEFAULT_FREQUENCY_HOURS)
+    except ValueError:
+        frequency = DEFAULT_FREQUENCY_HOURS
+    try:
+        priority = int(company.get('priority') or 0)
+    except ValueError:
+        priority = 0
+    return max(frequency, 0.05) * 3600, priority
+
+
+def stable_phase(name):
+    """A fraction in [0, 1) that is the same for a company on every start, to spread first crawls."""
+    return zlib.crc32(name.encode('utf-8')) / 2 ** 32
+
+
+def write_token(token, path=TOKEN_FILE):
+    """Writes the control API's token to a file only the current user can read or write."""
+    tmp_path = path + '.tmp'
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(token)
+    # O_CREAT keeps the mode of a file left over from an earlier run
+    os.chmod(tmp_path, 0o600)
+    os.replace(tmp_path, path)
+
+
+class ScheduleState:
+    """
+    When each company last ran and is next due, kept in scheduler_state.json so a restarted
+    daemon keeps its plan. Per company: next_due, last_started, last_finished, last_status,
+    failures (in a row), and the pending manual request ('manual', 'resume') if there is one.
+    """
+
+    def __init__(self, path=STATE_FILE):
+        self.path = path
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                self.companies = json.load(f)
+        except (OSError, ValueError):
+            self.companies = {}
+
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.companies, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, name):
+        return self.companies.setdefault(name, {})
+
+
+class Scheduler:
+    """
+    Runs every company in companies.csv on its own schedule. Every crawl runs in one
+    long-lived `crawl_runner.py --serve` worker process, which is the only process writing
+    scraper.db; if the worker dies, its crawls count as failed and the next tick starts
+    another one.
+
+    A company is due `frequency_hours` (+- jitter) after its last crawl started, or after a
+    backoff if it failed; crawls that stopped early resume from their job. Due companies are
+    handed to the worker in priority order while there are free slots: at most
+    `max_concurrent` crawls, and only while memory for another one is available. The worker
+    applies the same cap and lets companies on the same domain take turns. Once crawls have
+    finished, the worker enriches and matches the changed rows.
+
+    Progress events and crawl output are kept in a numbered buffer that clients (the GUI)
+    read through the control API.
+    """
+
+    def __init__(self, companies_file=crawl_runner.COMPANIES_FILE, max_concurrent=None, jitter=DEFAULT_JITTER,
+                 state_file=STATE_FILE, incremental=False):
+        self.companies_file = companies_file
+        self.max_concurrent = max(1, int(max_concurrent)) if max_concurrent else default_max_concurrent()
+        self.jitter = max(0.0, min(float(jitter), 0.9))
+        self.incremental = incremental
+        self.state = ScheduleState(state_file)
+        self.companies = {}
+        # Companies handed to the worker: {name: {'domain', 'worker', 'started'}}
+        self.running = {}
+        self.worker = None
+        self.finished = queue.Queue()
+        self.wakeup = threading.Event()
+        self.stopping = False
+        self.lock = threading.RLock()
+        self.events = collections.deque(maxlen=EVENT_BUFFER_SIZE)
+        self.event_seq = 0
+        self.events_lock = threading.Lock()
+        self.postprocess_pending_since = None
+        self.postprocessing = False
+        self.rng = random.Random()
+
+    def emit(self, event, **data):
+        with self.events_lock:
+            self.event_seq += 1
+            data.update(event=event, time=time.time(), seq=self.event_seq)
+            self.events.append(data)
+        if event != 'log':
+            details = ", ".join(f"{k}={v}" for k, v in data.items() if k not in ('event', 'time', 'seq'))
+            logger.info(f"{event}: {details}" if details else event)
+
+    def events_after(self, seq):
+        with self.events_lock:
+            return [event for event in self.events if event['seq'] > seq], self.event_seq
+
+    def load_companies(self):
+        """Re-reads companies.csv so companies added in the GUI are picked up; keeps the last good list on errors."""
+        try:
+            companies = crawl_runner.load_companies(self.companies_file)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read {self.companies_file}: {e}")
+            return
+        now = time.time()
+        with self.lock:
+            self.companies = {company['name']: company for company in companies}
+            for name, company in self.companies.items():
+                entry = self.state.get(name)
+                if 'next_due' not in entry:
+                    entry['next_due'] = self.first_due(company, now)
+
+    def first_due(self, company, now):
+        """When a company the scheduler has not planned yet is due: from its last job if it has one, else spread out."""
+        frequency, _ = company_plan(company)
+        job = jobs.Job.for_company(company['name'])
+        if job.state.get('finished_at') and not job.is_resumable():
+            return max(now, job.state['finished_at'] + frequency)
+        return now + stable_phase(company['name']) * min(frequency, INITIAL_SPREAD_SECONDS)
+
+    def next_due(self, company, entry, now):
+        frequency, _ = company_plan(company)
+        if entry.get('last_status') == 'failed':
+            backoff = min(BACKOFF_BASE_SECONDS * 2 ** (entry.get('failures', 1) - 1), frequency)
+            return now + backoff * self.rng.uniform(1.0, 1.0 + self.jitter)
+        started = entry.get('last_started') or now
+        return max(now, started + frequency * self.rng.uniform(1.0 - self.jitter, 1.0 + self.jitter))
+
+    def due_companies(self, now):
+        """Companies due now and not running, manual requests first, then by priority and due time."""
+        with self.lock:
+            due = []
+            for name, company in self.companies.items():
+                entry = self.state.get(name)
+                if name in self.running or entry.get('next_due', now) > now:
+                    continue
+                _, priority = company_plan(company)
+                due.append((not entry.get('manual'), -priority, entry['next_due'], name))
+            return [self.companies[name] for *_, name in sorted(due)]
+
+    def free_slots(self):
+        slots = self.max_concurrent - len(self.running)
+        memory = available_memory_mb()
+        if memory is not None:
+            slots = min(slots, memory // MEMORY_PER_CRAWL_MB)
+        return slots
+
+    def request_run(self, names=None, resume=False):
+        """
+        Makes the named companies (every company without names) due now. Returns the names queued;
+        a company already being crawled is not queued again, its running crawl counts as the run.
+        """
+        self.load_companies()
+        now = time.time()
+        queued = []
+        with self.lock:
+            for name in (names or list(self.companies)):
+                if name not in self.companies:
+                    continue
+                if name in self.running:
+                    queued.append(name)
+                    continue
+                if resume and not jobs.Job.for_company(name).is_resumable():
+                    continue
+                entry = self.state.get(name)
+                entry.update(next_due=now, manual=True, resume=resume)
+                queued.append(name)
+            self.state.save()
+        self.emit('run_requested', companies=queued, resume=resume)
+        self.wakeup.set()
+        return queued
+
+    def ensure_worker(self):
+        """The worker process every crawl runs in, started if there is none."""
+        if self.worker is not None:
+            return self.worker
+        command = [sys.executable, crawl_runner.__file__, '--serve', '--max-concurrent', str(self.max_concurrent),
+                   '--progress-json']
+        if self.incremental:
+            command.append('--incremental')
+        # Its own process group, so Ctrl+C in the daemon's terminal does not reach it twice:
+        # stop_crawls() sends the one interrupt that makes it save its jobs and exit
+        kwargs = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP} if os.name == 'nt' else {'start_new_session': True}
+        process = subprocess.Popen(command, cwd=BASE_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, text=True, encoding='utf-8', errors='replace', **kwargs)
+        thread = threading.Thread(target=self.follow, args=(process,), daemon=True)
+        self.worker = {'process': process, 'thread': thread}
+        self.emit('worker_started', pid=process.pid)
+        thread.start()
+        return self.worker
+
+    def send(self, command):
+        """Sends a command to the worker (see CrawlRunner.serve); raises OSError if it has exited."""
+        process = self.ensure_worker()['process']
+        process.stdin.write(json.dumps(command) + "\n")
+        process.stdin.flush()
+
+    def launch(self, company):
+        name = company['name']
+        with self.lock:
+            entry = self.state.get(name)
+            manual = entry.pop('manual', False)
+            requested_resume = entry.pop('resume', False)
+            # A scheduled crawl continues an interrupted or failed job; a manual run starts fresh unless asked to resume
+            resume = requested_resume or (not manual and jobs.Job.for_company(name).is_resumable())
+            entry['last_started'] = time.time()
+            self.state.save()
+            worker = self.ensure_worker()
+            self.running[name] = {'domain': crawl_runner.company_domain(company), 'worker': worker['process'],
+                                  'started': False}
+        try:
+            self.send({'command': 'crawl', 'company': company, 'resume': resume})
+        except OSError as e:
+            # follow() reports the worker's exit, which fails this crawl
+            logger.error(f"Could not hand {name} to the crawl worker: {e}")
+            return
+        self.emit('crawl_launched', company=name, resume=resume, manual=manual, pid=worker['process'].pid)
+
+    def follow(self, process):
+        """Relays the worker's output and progress events, then reports its exit to the main loop."""
+        for line in iter(process.stdout.readline, ''):
+            event = crawl_runner.parse_progress_line(line)
+            if event is None:
+                self.emit('log', line=line)
+                continue
+            kind = event.get('event')
+            if kind == 'company_started':
+                with self.lock:
+                    if event['company'] in self.running:
+                        self.running[event['company']]['started'] = True
+            elif kind == 'postprocess_finished':
+                self.postprocessing = False
+            if kind not in ('run_started', 'run_finished'):
+                self.emit(**event)
+            if kind in ('company_finished', 'company_failed'):
+                self.finished.put((event['company'], event))
+                self.wakeup.set()
+        process.wait()
+        self.finished.put((None, {'worker': process, 'returncode': process.returncode}))
+        self.wakeup.set()
+
+    def reap(self):
+        while True:
+            try:
+                name, outcome = self.finished.get_nowait()
+            except queue.Empty:
+                return
+            if name is None:
+                self.worker_exited(outcome['worker'], outcome['returncode'])
+            else:
+                self.crawl_exited(name, outcome)
+
+    def worker_exited(self, process, returncode):
+        """Fails the crawls a worker still had when it exited; the next tick starts a new worker."""
+        with self.lock:
+            if self.worker is not None and self.worker['process'] is process:
+                self.worker = None
+                self.postprocessing = False
+            lost = [name for name, crawl in self.running.items() if crawl['worker'] is process]
+        reason = 'shutdown' if self.stopping else f'worker exit code {returncode}'
+        if not self.stopping:
+            logger.error(f"The crawl worker exited with code {returncode}")
+        for name in lost:
+            self.emit('company_failed', company=name, reason=reason, items=0)
+            self.crawl_exited(name, {'event': 'company_failed', 'reason': reason, 'items': 0})
+
+    def crawl_exited(self, name, outcome):
+        reason = outcome.get('reason') or 'finished'
+        with self.lock:
+            if self.running.pop(name, None) is None:
+                return
+            entry = self.state.get(name)
+            now = time.time()
+            if reason == 'shutdown':
+                # Stopped by us or by hand; it resumes on the next start without counting as a failure
+                entry['next_due'] = now
+            else:
+                # A site that could not be reached still "finishes", with nothing scraped and only errors
+                empty = not outcome.get('items') and outcome.get('errors')
+                status = 'finished' if outcome.get('event') == 'company_finished' and not empty else 'failed'
+                entry.update(last_finished=now, last_status=status,
+                             failures=0 if status == 'finished' else entry.get('failures', 0) + 1)
+                company = self.companies.get(name)
+                entry['next_due'] = self.next_due(company, entry, now) if company else now
+                if status == 'finished' and self.postprocess_pending_since is None:
+                    self.postprocess_pending_since = now
+            self.state.save()
+        self.emit('crawl_exited', company=name, reason=reason, status=self.state.get(name).get('last_status'),
+                  items=outcome.get('items', 0), next_due=round(self.state.get(name)['next_due']))
+
+    def maybe_postprocess(self, now):
+        if self.postprocess_pending_since is None or self.postprocessing:
+            return
+        if self.running and now - self.postprocess_pending_since < POSTPROCESS_MAX_DELAY_SECONDS:
+            return
+        try:
+            self.send({'command': 'postprocess'})
+        except OSError as e:
+            logger.error(f"Could not ask the crawl worker to enrich and match: {e}")
+            return
+        self.postprocess_pending_since = None
+        self.postprocessing = True
+
+    def tick(self):
+        self.reap()
+        if self.stopping:
+            return
+        self.load_companies()
+        if self.worker is not None and self.worker['process'].poll() is not None:
+            return  # follow() has yet to report the crawls of the worker that exited
+        now = time.time()
+        self.maybe_postprocess(now)
+        for company in self.due_companies(now)[:max(0, self.free_slots())]:
+            self.launch(company)
+        with self.lock:
+            self.state.save()
+
+    def run(self):
+        self.emit('scheduler_started', max_concurrent=self.max_concurrent, companies_file=self.companies_file)
+        while not self.stopping:
+            self.tick()
+            self.wakeup.wait(TICK_SECONDS)
+            self.wakeup.clear()
+        self.stop_crawls()
+        self.emit('scheduler_stopped')
+
+    def stop(self, *_):
+        self.stopping = True
+        self.wakeup.set()
+
+    def stop_crawls(self, timeout=60):
+        """Stops the worker the way Ctrl+C would, so its jobs are saved and resume on the next start."""
+        worker = self.worker
+        if worker is not None:
+            process = worker['process']
+            if process.poll() is None:
+                process.send_signal(signal.CTRL_BREAK_EVENT if os.name == 'nt' else signal.SIGINT)
+            try:
+                process.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+            worker['thread'].join(5)
+        self.reap()
+
+    def status(self):
+        now = time.time()
+        with self.lock:
+            companies = []
+            for name, company in sorted(self.companies.items()):
+                frequency, priority = company_plan(company)
+                entry = self.state.get(name)
+                crawl = self.running.get(name)
+                companies.append({
+                    'name': name, 'frequency_hours': round(frequency / 3600, 2), 'priority': priority,
+                    'running': bool(crawl and crawl['started']),
+                    # Requested and not started yet: due for a manual run, or waiting in the worker
+                    'queued': bool(entry.get('manual')) or bool(crawl and not crawl['started']),
+                    'next_due': entry.get('next_due'),
+                    'last_status': entry.get('last_status'), 'last_finished': entry.get('last_finished'),
+                    'failures': entry.get('failures', 0),
+                })
+            running = sorted(name for name, crawl in self.running.items() if crawl['started'])
+            worker_pid = self.worker['process'].pid if self.worker else None
+        return {'time': now, 'pid': os.getpid(), 'worker_pid': worker_pid, 'max_concurrent': self.max_concurrent,
+                'running': running, 'queued': sorted(c['name'] for c in companies if c['queued']),
+                'companies': companies, 'seq': self.event_seq}
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    """
+    The scheduler's control API:
+    GET /status, GET /events?after=<seq>, and POST /run with {"companies": [...], "resume": false}.
+    Every request needs an `Authorization: Bearer <token>` header with the token in TOKEN_FILE.
+    """
+    scheduler = None
+    token = None
+
+    def send_json(self, payload, code=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def authorized(self):
+        supplied = self.headers.get('Authorization') or ''
+        if hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {self.token}".encode('utf-8')):
+            return True
+        self.send_json({'error': 'unauthorized'}, 401)
+        return False
+
+    def do_GET(self):
+        if not self.authorized():
+            return
+        url = urlparse(self.path)
+        if url.path == '/status':
+            self.send_json(self.scheduler.status())
+        elif url.path == '/events':
+            try:
+                after = int(parse_qs(url.query).get('after', ['0'])[0])
+            except ValueError:
+                after = 0
+            events, seq = self.scheduler.events_after(after)
+            self.send_json({'events': events, 'seq': seq})
+        else:
+            self.send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if urlparse(self.path).path != '/run':
+            self.send_json({'error': 'not found'}, 404)
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_json({'error': 'invalid JSON'}, 400)
+            return
+        queued = self.scheduler.request_run(request.get('companies'), bool(request.get('resume')))
+        self.send_json({'queued': queued})
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+
+def serve(scheduler, port, token):
+    handler = type('Handler', (ControlHandler,), {'scheduler': scheduler, 'token': token})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class SchedulerClient:
+    """
+    Talks to a running scheduler daemon; every call raises OSError if none is listening or
+    its token cannot be read.
+    """
+
+    def __init__(self, port=DEFAULT_PORT, timeout=5, token_file=TOKEN_FILE):
+        self.base_url = f"http://127.0.0.1:{port}"
+        self.port = port
+        self.timeout = timeout
+        self.token_file = token_file
+
+    def request(self, path, payload=None):
+        # Read on every call: a restarted daemon writes a new token
+        with open(self.token_file, 'r', encoding='utf-8') as f:
+            token = f.read().strip()
+        data = None if payload is None else json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(self.base_url + path, data=data,
+                                         headers={'Content-Type': 'application/json',
+                                                  'Authorization': f"Bearer {token}"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def status(self):
+        return self.request('/status')
+
+    def events(self, after=0):
+        return self.request(f'/events?after={int(after)}')
+
+    def run(self, companies=None, resume=False):
+        return self.request('/run', {'companies': companies, 'resume': resume})['queued']
+
+    def is_running(self):
+        try:
+            self.status()
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def ensure_running(self, companies_file=crawl_runner.COMPANIES_FILE, wait=15):
+        """Starts a detached daemon if none answers, logging to logs/scheduler.log; it outlives the caller."""
+        if self.is_running():
+            return
+        os.makedirs(os.path.dirname(LOG_FILE), exist_ok=True)
+        command = [sys.executable, os.path.abspath(__file__), '--companies', companies_file, '--port', str(self.port),
+                   '--token-file', self.token_file]
+        kwargs = {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP | subprocess.DETACHED_PROCESS} \
+            if os.name == 'nt' else {'start_new_session': True}
+        with open(LOG_FILE, 'a', encoding='utf-8') as log:
+            subprocess.Popen(command, cwd=BASE_DIR, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                             **kwargs)
+        deadline = time.time() + wait
+        while time.time() < deadline:
+            if self.is_running():
+                return
+            time.sleep(0.25)
+        raise OSError(f"The scheduler did not start; see {LOG_FILE}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run every company in companies.csv on its own recurring schedule "
+                                     "(frequency_hours and priority columns), unattended.")
+    parser.add_argument('--companies', default=crawl_runner.COMPANIES_FILE, help="Path to the companies CSV file.")
+    parser.add_argument('--max-concurrent', type=int, help="Most crawls at once (default: one per CPU, fewer if "
+                        f"there is not {MEMORY_PER_CRAWL_MB} MB of memory available for each).")
+    parser.add_argument('--jitter', type=float, default=DEFAULT_JITTER, help="Random share of the frequency a "
+                        "crawl may run early or late (default: %(default)s).")
+    parser.add_argument('--incremental', action='store_true', help="Skip Shopify products unchanged since the last crawl.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port of the control API on 127.0.0.1.")
+    parser.add_argument('--state-file', default=STATE_FILE, help="Where the schedule is kept between restarts.")
+    parser.add_argument('--token-file', default=TOKEN_FILE, help="Where the control API's token is written "
+                        "(readable by the current user only).")
+    parser.add_argument('--status', action='store_true', help="Print the running daemon's schedule and exit.")
+    parser.add_argument('--run-now', nargs='*', metavar='NAME', help="Ask the running daemon to crawl the named "
+                        "companies (all without names) now, and exit.")
+    args = parser.parse_args(argv)
+
+    if args.status or args.run_now is not None:
+        client = SchedulerClient(args.port, token_file=args.token_file)
+        try:
+            if args.run_now is not None:
+                print(f"Queued: {', '.join(client.run(args.run_now or None)) or 'nothing'}")
+                return 0
+            status = client.status()
+        except OSError as e:
+            print(f"No scheduler is running on port {args.port}: {e}")
+            return 1
+        for company in status['companies']:
+            state = "running" if company['running'] else "next " + time.strftime(
+                '%Y-%m-%d %H:%M', time.localtime(company['next_due'] or status['time']))
+            print(f"{company['name']}: every {company['frequency_hours']}h, priority {company['priority']}, {state}, "
+                  f"last {company['last_status'] or '-'}, {company['failures']} failures in a row")
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [scheduler] %(levelname)s: %(message)s")
+    scheduler = Scheduler(args.companies, args.max_concurrent, args.jitter, args.state_file, args.incremental)
+    token = secrets.token_urlsafe(32)
+    try:
+        server = serve(scheduler, args.port, token)
+    except OSError as e:
+        print(f"Could not listen on 127.0.0.1:{args.port} (is a scheduler already running?): {e}")
+        return 1
+    # Only once the port is ours, so a second daemon does not replace the running one's token
+    write_token(token, args.token_file)
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, scheduler.stop)
+    logger.info(f"Control API at http://127.0.0.1:{args.port}, up to {scheduler.max_concurrent} crawls at once")
+    try:
+        scheduler.run()
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
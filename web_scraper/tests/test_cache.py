@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import sys
+import types
+
+import pytest
+import scrapy
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+from product_scraper.extractors.base import BaseExtractor, pages_persisted
+from product_scraper.middlewares import ConditionalCacheMiddleware, ResponseCacheStore
+from product_scraper.pipelines import DatabasePipeline
+
+URL = "https://brand.example/products/soy-chaap"
+
+
+class PageExtractor(BaseExtractor):
+    name = 'page'
+
+    def start_requests(self):
+        return []
+
+
+@pytest.fixture
+def crawl(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_FILE", str(tmp_path / "scraper.db"))
+    crawler = get_crawler(scrapy.Spider, {'FRONTIER_ENABLED': False, 'METRICS_ENABLED': False})
+    spider = types.SimpleNamespace(settings=crawler.settings, crawler=crawler, logger=types.SimpleNamespace(
+        info=lambda message: None, warning=lambda message: None), company_name="Brand",
+        start_url="https://brand.example", job=None)
+    store = ResponseCacheStore(str(tmp_path / "httpcache.db"), 10 * 1024 * 1024, version="4")
+    middleware = ConditionalCacheMiddleware(crawler, store)
+    crawler.signals.connect(middleware.pages_persisted, signal=pages_persisted)
+    spider.extractor = PageExtractor(spider)
+    pipeline = DatabasePipeline(write_mode='direct', checkpoint_interval=0)
+    pipeline.open_spider(spider)
+    yield spider, store, middleware, pipeline
+    store.close()
+    database.close_shared_connection()
+
+
+def cache_flags(store, middleware):
+    request = scrapy.Request(URL)
+    return middleware.build_response(request, store.get(URL)).flags
+
+
+def test_cached_page_counts_as_unchanged_only_after_its_items_are_written(crawl, monkeypatch):
+    spider, store, middleware, pipeline = crawl
+    store.put(URL, 200, {'Content-Type': ['text/html']}, b"<html></html>", '"v1"', None)
+    request = scrapy.Request(URL)
+    spider.extractor.fetched(HtmlResponse(URL, body=b"<html></html>", request=request))
+    pipeline.writer.add_product({"Product Name": "Soy Chaap", "Product Page": URL, "Website": spider.start_url})
+
+    write_product_params = database.write_product_params
+
+    def locked(conn, params):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(database, "write_product_params", locked)
+    pipeline.checkpoint(spider)
+    assert 'unchanged' not in cache_flags(store, middleware)
+    assert [url for url, _, _ in spider.extractor.completed] == [URL]
+
+    monkeypatch.setattr(database, "write_product_params", write_product_params)
+    pipeline.checkpoint(spider)
+    assert 'unchanged' in cache_flags(store, middleware)
+    assert spider.extractor.completed == []
+
+
+def test_entries_confirmed_by_an_older_extractor_are_parsed_again(crawl):
+    spider, store, middleware, pipeline = crawl
+    store.put(URL, 200, {'Content-Type': ['text/html']}, b"<html></html>", None, None)
+    store.confirm([URL])
+    assert 'unchanged' in cache_flags(store, middleware)
+    store.version = "5"
+    assert 'unchanged' not in cache_flags(store, middleware)
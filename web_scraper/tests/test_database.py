@@ -0,0 +1,172 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import database
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "scraper.db")
+    monkeypatch.setattr(database, "DB_FILE", path)
+    monkeypatch.setattr(database, "STAGING_DIR", str(tmp_path / "staging"))
+    database.migrate()
+    yield path
+    database.close_shared_connection()
+
+
+def product(page, price="100", name="Soy Chaap"):
+    return {"Product Name": name, "Brand": "Brand", "Product Page": page, "Website": "https://brand.example",
+            "Price (INR)": price, "Availability": "Active", "In Stock": 1, "Ingredients List": "Soy, Wheat"}
+
+
+def lock_writes(monkeypatch):
+    """Makes every product write fail as if another process held the database; returns a switch to undo it."""
+    write_product_params = database.write_product_params
+    locked = [True]
+
+    def write(conn, params):
+        if locked[0]:
+            raise sqlite3.OperationalError("database is locked")
+        write_product_params(conn, params)
+
+    monkeypatch.setattr(database, "write_product_params", write)
+    return lambda: locked.__setitem__(0, False)
+
+
+def stored_prices():
+    conn = database.db_connect()
+    try:
+        return dict(conn.execute('SELECT "Product Page", "Price (INR)" FROM products'))
+    finally:
+        conn.close()
+
+
+def test_failed_flush_keeps_the_rows_and_reports_nothing(db_file, monkeypatch):
+    flushes = []
+    writer = database.BatchWriter(batch_size=100, on_flush=lambda seconds, written: flushes.append(written))
+    writer.add_product(product("https://brand.example/a"))
+    writer.add_product(product("https://brand.example/b"))
+    unlock = lock_writes(monkeypatch)
+    with pytest.raises(sqlite3.OperationalError):
+        writer.flush()
+    assert writer.pending() == 2
+    assert flushes == []
+    assert not database.get_shared_connection().in_transaction
+
+    unlock()
+    assert writer.flush() == 2
+    assert writer.pending() == 0
+    assert flushes == [2]
+    assert stored_prices() == {"https://brand.example/a": "100.00", "https://brand.example/b": "100.00"}
+
+
+def test_add_product_keeps_rows_when_a_due_flush_fails(db_file, monkeypatch):
+    writer = database.BatchWriter(batch_size=2)
+    lock_writes(monkeypatch)
+    writer.add_product(product("https://brand.example/a"))
+    writer.add_product(product("https://brand.example/b"))
+    writer.add_product(product("https://brand.example/c"))
+    assert writer.pending() == 3
+    with pytest.raises(sqlite3.OperationalError):
+        writer.close(attempts=1)
+    assert writer.pending() == 3
+
+
+def test_staged_rows_are_merged_and_the_staging_file_removed(db_file):
+    path = database.create_staging_database("Brand")
+    writer = database.BatchWriter(db_file=path)
+    writer.add_product(product("https://brand.example/a"), source_updated_at="2024-01-01")
+    writer.add_product(product("https://brand.example/b", price="250"))
+    writer.close()
+    assert database.merge_staging_database(path) == 2
+    assert not os.path.exists(path)
+    assert stored_prices() == {"https://brand.example/a": "100.00", "https://brand.example/b": "250.00"}
+    assert database.get_sync_state("https://brand.example") == {"https://brand.example/a": "2024-01-01"}
+
+
+def test_only_stale_staging_databases_are_merged(db_file):
+    stale = database.create_staging_database("Stale")
+    live = database.create_staging_database("Live")
+    for path, page in ((stale, "https://brand.example/old"), (live, "https://brand.example/new")):
+        writer = database.BatchWriter(db_file=path)
+        writer.add_product(product(page))
+        writer.close()
+    os.utime(stale, (0, 0))
+    assert database.merge_stale_staging_databases(max_age_seconds=600) == 1
+    assert not os.path.exists(stale)
+    assert os.path.exists(live)
+    assert list(stored_prices()) == ["https://brand.example/old"]
+
+
+LEGACY_COLUMNS = ', '.join(f'"{col}" TEXT' if col != "Product Page" else '"Product Page" TEXT PRIMARY KEY'
+                           for col in database.PRODUCT_COLUMNS)
+
+
+@pytest.fixture
+def legacy_db_file(tmp_path, monkeypatch):
+    """A database from before versioned migrations: the flat products table only, at user_version 0."""
+    path = str(tmp_path / "scraper.db")
+    monkeypatch.setattr(database, "DB_FILE", path)
+    conn = sqlite3.connect(path)
+    conn.execute(f"CREATE TABLE products ({LEGACY_COLUMNS})")
+    rows = [
+        ("Soy Chaap", "Brand", "https://brand.example/chaap", "129", "Active", "Soy Protein, Wheat Flour, Palm Oil"),
+        ("Veg Nuggets", "Other", "https://other.example/nuggets", "", "OOS", ""),
+    ]
+    conn.executemany('INSERT INTO products ("Product Name", "Brand", "Product Page", "Price (INR)", "Availability", '
+                     '"Ingredients List") VALUES (?, ?, ?, ?, ?, ?)', rows)
+    conn.commit()
+    conn.close()
+    yield path
+    database.close_shared_connection()
+
+
+def test_flat_legacy_database_migrates_to_the_current_schema(legacy_db_file):
+    assert database.migrate() == database.SCHEMA_VERSION == 6
+    assert database.migrate() == database.SCHEMA_VERSION
+    assert stored_prices() == {"https://brand.example/chaap": "129.00", "https://other.example/nuggets": None}
+    assert database.count_products() == 2
+    assert database.count_products({"brand": "Brand"}) == 1
+    assert database.count_products({"search": "nuggets"}) == 1
+    # Ingredients linked by the flat schema stay linked, by name, until enrichment links them again
+    assert database.count_products({"ingredient": "palm oil"}) == 1
+    assert set(database.get_unaliased_ingredient_lists().values()) == {"Soy Protein, Wheat Flour, Palm Oil"}
+
+
+def test_migration_is_rolled_back_when_a_step_fails(legacy_db_file, monkeypatch):
+    def broken(conn):
+        conn.execute("CREATE TABLE half_done (x)")
+        raise sqlite3.OperationalError("disk I/O error")
+
+    monkeypatch.setattr(database, "MIGRATIONS", database.MIGRATIONS[:2] + [broken] + database.MIGRATIONS[3:])
+    with pytest.raises(sqlite3.OperationalError):
+        database.migrate()
+    conn = sqlite3.connect(legacy_db_file)
+    try:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == 2
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'half_done'").fetchone() is None
+    finally:
+        conn.close()
+
+
+def test_unchanged_rows_are_skipped_and_price_changes_recorded(db_file):
+    writer = database.BatchWriter()
+    writer.add_product(product("https://brand.example/a"))
+    assert writer.flush() == 1
+    writer.add_product(product("https://brand.example/a"))
+    assert writer.flush() == 0
+    assert writer.unchanged == 1
+    writer.add_product(product("https://brand.example/a", price="90"))
+    assert writer.flush() == 1
+    writer.add_product(product("https://brand.example/a", price="90", name="Soy Chaap (New)"))
+    assert writer.flush() == 1
+
+    row_id = database.get_shared_connection().execute("SELECT variant_id FROM variants").fetchone()[0]
+    # The name change alone adds no history point
+    assert [price for _, price, _, _ in database.get_price_history(row_id)] == [10000, 9000]
+    current = database.get_current_price(row_id)
+    assert (current["Price Paise"], current["Previous Price Paise"], current["Changes"]) == (9000, 10000, 2)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from product_scraper.extraction import infer_product_details, is_non_food
+
+
+def test_flavour_words_do_not_veto_an_analogue():
+    assert infer_product_details("Tandoori Masala Soya Chaap") == ("PBM", "Meat", "RTC")
+    assert infer_product_details("Kolhapuri Spices Chunks") == ("PBM", "Meat", "RTC")
+    assert infer_product_details("Butter Chicken Curry") == ("PBM", "Chicken", "RTE")
+
+
+def test_dish_name_does_not_override_a_non_analogue():
+    assert infer_product_details("Paneer Tikka") == ("n/a", "n/a", "n/a")
+    assert infer_product_details("Peri Peri Mayo") == ("n/a", "n/a", "n/a")
+    assert infer_product_details("Vegicken Mayo Wrap") == ("PBM", "Chicken", "RTE")
+
+
+def test_dish_decides_the_animal_when_none_is_named():
+    assert infer_product_details("Eggless Bhurji Kit") == ("PBE", "Egg", "RTC")
+    assert infer_product_details("Veg Seekh Kebab") == ("PBM", "Meat", "RTC")
+    assert infer_product_details("Egg Chicken Roll") == ("PBE", "Egg", "RTE")
+
+
+def test_only_non_food_listings_are_dropped():
+    assert is_non_food("Blue Tribe Gift Card")
+    assert is_non_food("Vegicken T-Shirt")
+    assert not is_non_food("Peri Peri Mayo")
+    assert not is_non_food("Tandoori Masala Soya Chaap")
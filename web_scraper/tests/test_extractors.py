@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scrapy.settings import Settings
+
+from product_scraper.extractors import get_extractor_class
+from product_scraper.extractors.base import BaseExtractor
+from product_scraper.extractors.sitemap import offer_price, offer_variant_ids
+
+
+class NoStartRequests(BaseExtractor):
+    name = 'incomplete'
+
+
+def test_formatted_prices_are_parsed():
+    assert offer_price({'price': "1,299.00"}) == "1299.00"
+    assert offer_price({'price': "₹499"}) == "499.00"
+    assert offer_price({'price': "Rs. 499"}) == "499.00"
+    assert offer_price({'price': 12.5}) == "12.50"
+    assert offer_price({'lowPrice': "199"}) == "199.00"
+
+
+def test_missing_or_unreadable_price_is_none():
+    assert offer_price({}) is None
+    assert offer_price({'price': ""}) is None
+    assert offer_price({'price': "Call for price"}) is None
+
+
+def test_offers_without_sku_get_distinct_variant_ids():
+    assert offer_variant_ids({'sku': "P1"}, [{}]) == ["P1"]
+    assert offer_variant_ids({'sku': "P1"}, [{}, {}]) == ["P1#0", "P1#1"]
+    named = offer_variant_ids({}, [{'sku': "A"}, {'name': "250 g"}, {'name': "500 g"}])
+    assert named[0] == "A"
+    assert len(set(named)) == 3
+    # The same offers give the same ids on the next crawl
+    assert offer_variant_ids({}, [{'sku': "A"}, {'name': "250 g"}, {'name': "500 g"}]) == named
+
+
+def test_extractor_without_start_requests_is_rejected_by_the_registry():
+    settings = Settings({'EXTRACTORS': {'incomplete': f"{__name__}:NoStartRequests"}})
+    with pytest.raises(TypeError, match="start_requests"):
+        get_extractor_class('incomplete', settings)
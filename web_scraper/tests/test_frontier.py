@@ -0,0 +1,80 @@
+import gzip
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from product_scraper.frontier import UrlFrontier, iter_sitemap, url_fingerprint
+
+SITE = "https://brand.example"
+
+
+@pytest.fixture
+def frontier(tmp_path):
+    frontier = UrlFrontier(str(tmp_path / "frontier.db"))
+    yield frontier
+    frontier.close()
+
+
+def page(slug, lastmod="2024-01-01"):
+    return f"{SITE}/products/{slug}", 'page', 'parse_product', lastmod
+
+
+def offered(frontier, *entries):
+    """{url: previous state} of the entries offer() wants requested."""
+    return {url: state for _, url, _, _, _, state in frontier.offer(SITE, entries)}
+
+
+def unfinished_urls(frontier, max_attempts):
+    return {url for _, url, *_ in frontier.unfinished(SITE, max_attempts)}
+
+
+def test_done_pages_are_skipped_until_their_lastmod_changes(frontier):
+    a, b = page("a"), page("b", lastmod=None)
+    assert offered(frontier, a, b) == {a[0]: None, b[0]: None}
+    frontier.mark_done(SITE, [(url_fingerprint(a[0]), a[3]), (url_fingerprint(b[0]), b[3])])
+    # Without a lastmod there is no telling whether the page changed
+    assert offered(frontier, a, b) == {b[0]: 'done'}
+    assert offered(frontier, page("a", lastmod="2024-02-01")) == {a[0]: 'done'}
+    assert frontier.counts(SITE) == {'pending': 2}
+
+
+def test_failed_pages_are_retried_until_max_attempts_in_a_row(frontier):
+    a, b = page("a"), page("b")
+    frontier.offer(SITE, [a, b])
+    fingerprint = url_fingerprint(a[0])
+    frontier.mark_failed(SITE, fingerprint)
+    assert {url: state for _, url, _, _, _, state in frontier.unfinished(SITE, 2)} == {a[0]: 'failed', b[0]: 'pending'}
+
+    # Offered again by an unchanged sitemap: pending once more, but the failures still count
+    assert offered(frontier, a) == {a[0]: 'failed'}
+    frontier.mark_failed(SITE, fingerprint)
+    assert unfinished_urls(frontier, 2) == {b[0]}
+    assert unfinished_urls(frontier, 3) == {a[0], b[0]}
+
+    frontier.mark_done(SITE, [(fingerprint, a[3])])
+    assert frontier.counts(SITE) == {'done': 1, 'pending': 1}
+    frontier.offer(SITE, [page("a", lastmod="2024-03-01")])
+    frontier.mark_failed(SITE, fingerprint)
+    # A success in between starts the count again
+    assert unfinished_urls(frontier, 2) == {a[0], b[0]}
+
+
+def test_websites_are_kept_apart(frontier):
+    frontier.offer(SITE, [page("a")])
+    assert frontier.unfinished("https://other.example", 3) == []
+    assert frontier.counts("https://other.example") == {}
+
+
+def test_iter_sitemap_reads_indexes_and_gzipped_urlsets():
+    index = (b'<?xml version="1.0"?><sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+             b'<sitemap><loc>https://brand.example/sitemap-products.xml.gz</loc></sitemap></sitemapindex>')
+    urlset = (b'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+              b'<url><loc> https://brand.example/products/a </loc><lastmod>2024-01-01</lastmod></url>'
+              b'<url><loc>https://brand.example/products/b</loc></url></urlset>')
+    assert list(iter_sitemap(index)) == [('sitemap', 'https://brand.example/sitemap-products.xml.gz', None)]
+    assert list(iter_sitemap(gzip.compress(urlset))) == [
+        ('page', 'https://brand.example/products/a', '2024-01-01'),
+        ('page', 'https://brand.example/products/b', None),
+    ]
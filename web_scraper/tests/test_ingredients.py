@@ -0,0 +1,82 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from product_scraper.ingredients import Ingredient, canonical_name, parse_entry, parse_ingredient_list, parse_ingredients
+
+
+def test_ingredients_header_with_percentages_and_sub_ingredients():
+    parsed, allergens = parse_ingredients("Ingredients: Soy Protein Isolate (40%), Spices (Cumin, Coriander 2%), Salt.")
+    assert [ingredient.name for ingredient in parsed] == ["Soy Protein Isolate", "Spices", "Salt"]
+    assert parsed[0].percentage == 40
+    assert parsed[1].children == [Ingredient("Cumin", None, []), Ingredient("Coriander", 2, [])]
+    assert allergens == []
+
+
+def test_made_with_list_is_accepted():
+    parsed, _ = parse_ingredients("Made with soy protein, wheat gluten and spices.")
+    assert [ingredient.name for ingredient in parsed] == ["soy protein", "wheat gluten", "spices"]
+
+
+def test_made_with_marketing_copy_is_not_a_list():
+    html_text = "Made with jackfruit and spices for rich, satisfying flavour in every bite."
+    assert parse_ingredients(html_text) is None
+
+
+def test_prose_after_list_is_dropped():
+    parsed, _ = parse_ingredient_list("fragrant rice, fried onion, traditional Indian spices known for their aroma.")
+    assert [ingredient.name for ingredient in parsed] == ["fragrant rice", "fried onion"]
+
+
+def test_allergen_information_heading_with_contains():
+    parsed, allergens = parse_ingredients("Ingredients: Soy, Water. Allergen Information: Contains Soy, Gluten.")
+    assert [ingredient.name for ingredient in parsed] == ["Soy", "Water"]
+    assert allergens == ["Soy", "Gluten"]
+
+
+def test_contains_declaration():
+    _, allergens = parse_ingredients("Ingredients: Pea Protein, Wheat Flour. Contains: Wheat.")
+    assert allergens == ["Wheat"]
+
+
+def test_amount_in_parentheses_is_not_a_sub_ingredient():
+    assert parse_entry("Vitamin B12 (0.5 mg)") == Ingredient("Vitamin B12", None, [])
+    assert parse_entry("Salt (1.2%)") == Ingredient("Salt", 1.2, [])
+
+
+def test_alias_with_parentheses_is_looked_up_whole():
+    maida = parse_entry("Wheat flour (Maida)")
+    assert maida == Ingredient("Wheat flour (Maida)", None, [])
+    assert canonical_name(maida.name) == "refined wheat flour"
+    atta = parse_entry("Wheat Flour (Atta) 30%")
+    assert atta.percentage == 30
+    assert canonical_name(atta.name) == "whole wheat flour"
+
+
+def test_aliases_map_to_one_canonical_name():
+    assert canonical_name("Soya Protein Isolate") == "soy protein"
+    assert canonical_name("Refined Sunflower Oil") == "sunflower oil"
+    assert canonical_name("Iodised Salt") == "salt"
+
+
+def test_short_claim_inside_a_list_is_skipped():
+    label = ("Ingredients: Soy Protein (45%), Wheat Flour (Maida), No Added Sugar, Sunflower Oil, Iodised Salt, "
+             "Spices. Contains: Soy, Wheat.")
+    parsed, allergens = parse_ingredients(label)
+    assert [ingredient.name for ingredient in parsed] == [
+        "Soy Protein", "Wheat Flour (Maida)", "Sunflower Oil", "Iodised Salt", "Spices"]
+    assert allergens == ["Soy", "Wheat"]
+
+
+def test_claim_in_a_sentence_ends_the_list():
+    parsed, _ = parse_ingredient_list("soy, salt, no preservatives or artificial colours are added at all, garlic")
+    assert [ingredient.name for ingredient in parsed] == ["soy", "salt"]
+
+
+def test_made_with_claim_is_not_a_list():
+    assert parse_ingredients("Made with no maida, palm oil or preservatives.") is None
+
+
+def test_list_opening_with_a_claim_is_all_claim():
+    parsed, _ = parse_ingredient_list("out maida, palm oil, cholesterol or preservatives. No prep, no stress")
+    assert parsed == []
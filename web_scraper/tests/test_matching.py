@@ -0,0 +1,58 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from matching import MinHasher, ProductFeatures, cluster_products, similarity, title_tokens
+
+
+def listing(product_id, brand, name, ingredients=(), weight=None):
+    return ProductFeatures(product_id, brand, title_tokens(name, brand), frozenset(ingredients), weight)
+
+
+CATALOG = {
+    1: listing(1, "Blue Tribe", "Blue Tribe Plant Based Chicken Nuggets 250g", (1, 2, 3, 4, 5), 250.0),
+    2: listing(2, "Blue Tribe Foods", "Chicken Nuggets (Pack of 1)", (1, 2, 3, 4, 5), 250.0),
+    # The same title from another brand, with a different recipe
+    3: listing(3, "Good Dot", "Vegan Chicken Nuggets", (1, 6, 7, 8, 9), 250.0),
+    # A reseller's listing of product 1: other brand, same ingredients
+    4: listing(4, "Marketplace", "Chicken Nuggets 250g", (1, 2, 3, 4, 5), 250.0),
+    # Product 1 in a bigger pack
+    5: listing(5, "Blue Tribe", "Blue Tribe Chicken Nuggets 1kg", (1, 2, 3, 4, 5), 1000.0),
+    6: listing(6, "Blue Tribe", "Mutton Keema", (1, 10, 11), 450.0),
+}
+
+
+def test_title_tokens_drop_quantities_stopwords_and_the_brand():
+    assert title_tokens("Blue Tribe Plant-Based Soya Chaaps 500 g", "Blue Tribe") == {"soy", "chaap"}
+
+
+def test_similarity_needs_matching_ingredients_across_brands_and_matching_weights():
+    assert similarity(CATALOG[1], CATALOG[2]) >= 0.75
+    assert similarity(CATALOG[1], CATALOG[3]) == 0.0
+    assert similarity(CATALOG[1], CATALOG[4]) >= 0.75
+    assert similarity(CATALOG[1], CATALOG[5]) == 0.0
+
+
+def test_lsh_buckets_similar_titles_together():
+    hasher = MinHasher()
+    same = set(hasher.product_keys(CATALOG[1])) & set(hasher.product_keys(CATALOG[2]))
+    other = set(hasher.product_keys(CATALOG[1])) & set(hasher.product_keys(CATALOG[6]))
+    assert same
+    assert not any(kind[0] == 't' for kind, _, _ in other)
+    # Signatures do not depend on the process (no salted str hashes)
+    assert MinHasher().signature(CATALOG[1].tokens) == hasher.signature(CATALOG[1].tokens)
+
+
+def test_clusters_group_listings_of_one_product():
+    labels, stats = cluster_products(CATALOG)
+    assert labels == {1: 1, 2: 1, 3: 3, 4: 1, 5: 5, 6: 6}
+    assert stats['clusters'] == 4
+
+
+def test_incremental_run_only_compares_changed_products():
+    labels, _ = cluster_products(CATALOG)
+    features = {**CATALOG, 7: listing(7, "Good Dot", "Vegan Chicken Nuggets 250 g", (1, 6, 7, 8, 9), 250.0)}
+    incremental, stats = cluster_products(features, labels, changed={7})
+    assert incremental == {**labels, 7: 3}
+    assert stats['changed'] == 1
+    assert stats['pairs_compared'] < len(features) - 1
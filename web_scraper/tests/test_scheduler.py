@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+import urllib.error
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import scheduler
+
+HOUR = 3600
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    companies_file = tmp_path / "companies.csv"
+    companies_file.write_text("name,type,url,frequency_hours,priority\n"
+                              "Low,shopify,https://low.example,2,0\n"
+                              "High,shopify,https://high.example,2,5\n"
+                              "Manual,shopify,https://manual.example,2,0\n", encoding="utf-8")
+    state = {name: {'next_due': 0} for name in ("Low", "High", "Manual")}
+    state_file = tmp_path / "state.json"
+    state_file.write_text(json.dumps(state), encoding="utf-8")
+    daemon = scheduler.Scheduler(str(companies_file), max_concurrent=2, jitter=0.1, state_file=str(state_file))
+    daemon.load_companies()
+    return daemon
+
+
+def test_failures_back_off_exponentially_up_to_the_frequency(daemon):
+    company = daemon.companies["Low"]
+    waits = []
+    for failures in range(1, 6):
+        entry = {'last_status': 'failed', 'failures': failures}
+        waits.append(daemon.next_due(company, entry, 0))
+    for failures, wait in enumerate(waits[:3], start=1):
+        base = scheduler.BACKOFF_BASE_SECONDS * 2 ** (failures - 1)
+        assert base <= wait <= base * 1.1
+    # 900 * 2 ** 3 is more than the 2-hour frequency
+    assert 2 * HOUR <= waits[3] <= 2 * HOUR * 1.1
+    assert 2 * HOUR <= waits[4] <= 2 * HOUR * 1.1
+
+
+def test_next_crawl_is_due_one_frequency_after_the_last_start_give_or_take_the_jitter(daemon):
+    company = daemon.companies["Low"]
+    dues = {daemon.next_due(company, {'last_status': 'finished', 'last_started': 1000}, 1000) for _ in range(50)}
+    assert all(1000 + 2 * HOUR * 0.9 <= due <= 1000 + 2 * HOUR * 1.1 for due in dues)
+    assert len(dues) > 1
+    # A crawl that overran its frequency is due straight away
+    assert daemon.next_due(company, {'last_status': 'finished', 'last_started': 1000}, 4 * HOUR) == 4 * HOUR
+
+
+def test_manual_runs_come_first_then_priority(daemon):
+    daemon.state.get("Manual")['manual'] = True
+    assert [c['name'] for c in daemon.due_companies(10)] == ["Manual", "High", "Low"]
+    daemon.running["High"] = {'domain': 'high.example', 'worker': None, 'started': True}
+    assert [c['name'] for c in daemon.due_companies(10)] == ["Manual", "Low"]
+
+
+def test_crawl_outcomes_update_the_failure_count(daemon):
+    for name in ("Low", "High", "Manual"):
+        daemon.running[name] = {'domain': name, 'worker': 'worker-1', 'started': True}
+    daemon.crawl_exited("Low", {'event': 'company_failed', 'reason': 'closespider_errorcount', 'items': 0})
+    assert daemon.state.get("Low")['failures'] == 1
+    daemon.running["Low"] = {'domain': "Low", 'worker': 'worker-1', 'started': True}
+    # A site that could not be reached "finishes" with nothing but errors
+    daemon.crawl_exited("Low", {'event': 'company_finished', 'reason': 'finished', 'items': 0, 'errors': 3})
+    assert daemon.state.get("Low")['failures'] == 2
+    daemon.crawl_exited("High", {'event': 'company_finished', 'reason': 'finished', 'items': 40})
+    assert (daemon.state.get("High")['last_status'], daemon.state.get("High")['failures']) == ('finished', 0)
+    assert daemon.postprocess_pending_since is not None
+    # Interrupted crawls are due again at once and do not count as failures
+    daemon.crawl_exited("Manual", {'event': 'company_failed', 'reason': 'shutdown', 'items': 0})
+    assert 'failures' not in daemon.state.get("Manual")
+    assert daemon.running == {}
+
+
+def test_worker_exit_fails_only_its_own_crawls(daemon):
+    daemon.running["Low"] = {'domain': 'low.example', 'worker': 'worker-1', 'started': True}
+    daemon.running["High"] = {'domain': 'high.example', 'worker': 'worker-2', 'started': False}
+    daemon.worker_exited('worker-1', -9)
+    assert list(daemon.running) == ["High"]
+    assert daemon.state.get("Low")['last_status'] == 'failed'
+    assert [e['reason'] for e in daemon.events if e['event'] == 'company_failed'] == ['worker exit code -9']
+
+
+def test_control_api_needs_the_token(daemon, tmp_path):
+    server = scheduler.serve(daemon, 0, "s3cret")
+    try:
+        port = server.server_address[1]
+        token_file = tmp_path / "token"
+        scheduler.write_token("s3cret", str(token_file))
+        if os.name != 'nt':
+            assert token_file.stat().st_mode & 0o777 == 0o600
+        assert scheduler.SchedulerClient(port, token_file=str(token_file)).status()['max_concurrent'] == 2
+        scheduler.write_token("wrong", str(token_file))
+        with pytest.raises(urllib.error.HTTPError) as error:
+            scheduler.SchedulerClient(port, token_file=str(token_file)).run(["Low"])
+        assert error.value.code == 401
+        assert 'manual' not in daemon.state.get("Low")
+        assert not scheduler.SchedulerClient(port, token_file=str(tmp_path / "missing")).is_running()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,74 @@
+import os
+import sys
+import types
+
+import pytest
+import scrapy
+from scrapy.http import Response
+from scrapy.utils.test import get_crawler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from product_scraper import middlewares
+from product_scraper.middlewares import AdaptiveThrottleMiddleware, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """time.monotonic() as seen by the token buckets, moved by hand."""
+    now = [1000.0]
+    monkeypatch.setattr(middlewares.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def throttle(monkeypatch):
+    monkeypatch.setattr(middlewares, "_buckets", {})
+    crawler = get_crawler(scrapy.Spider, {'THROTTLE_START_RATE': 1.0, 'THROTTLE_MAX_RATE': 2.0,
+                                          'THROTTLE_RATE_STEP': 0.5, 'THROTTLE_TARGET_LATENCY': 1.0})
+    return AdaptiveThrottleMiddleware(crawler), types.SimpleNamespace(start_rate=None, max_rate=None, burst=None)
+
+
+def respond(middleware, spider, status=200, latency=0.1, headers=None):
+    request = scrapy.Request("https://brand.example/products.json")
+    domain, bucket = middleware.bucket_for(request, spider)
+    request.meta.update(_throttle_domain=domain, download_latency=latency)
+    middleware.process_response(request, Response(request.url, status=status, headers=headers), spider)
+    return bucket
+
+
+def test_bucket_spends_its_burst_then_spaces_requests(clock):
+    bucket = TokenBucket(rate=2.0, burst=2, min_rate=0.5, max_rate=4.0)
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock[0] += 1.0
+    assert bucket.reserve() == 0.5
+
+
+def test_rate_rises_additively_and_falls_multiplicatively(throttle):
+    middleware, spider = throttle
+    assert respond(middleware, spider).rate == 1.5
+    assert respond(middleware, spider).rate == 2.0
+    # Capped at THROTTLE_MAX_RATE
+    assert respond(middleware, spider).rate == 2.0
+    assert respond(middleware, spider, status=429).rate == 1.0
+    # Slower than the target latency: scaled by target / latency, at most halved
+    assert respond(middleware, spider, latency=1.25).rate == 0.8
+    assert respond(middleware, spider, latency=10).rate == 0.4
+    assert respond(middleware, spider, status=503).rate == 0.2
+    assert respond(middleware, spider, status=503).rate == 0.2
+
+
+def test_retry_after_pauses_the_domain(throttle, clock):
+    middleware, spider = throttle
+    bucket = respond(middleware, spider, status=429, headers={'Retry-After': '30'})
+    assert bucket.reserve() == 30
+    clock[0] += 31
+    assert bucket.reserve() == 0.0
+
+
+def test_retry_after_is_capped_and_accepts_dates(throttle):
+    middleware, spider = throttle
+    response = Response("https://brand.example/", status=429, headers={'Retry-After': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+    assert AdaptiveThrottleMiddleware.retry_after_seconds(response) == 0.0
+    assert AdaptiveThrottleMiddleware.retry_after_seconds(Response("https://brand.example/", status=429)) is None
+    bucket = respond(middleware, spider, status=503, headers={'Retry-After': '86400'})
+    assert bucket.reserve() == pytest.approx(middleware.max_retry_after)